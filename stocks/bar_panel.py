@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全市场K线面板 - 某周期最近N根K线按 (股票 × K线) 排成内存映射二维数组
+
+选股、筹码扫描、统计分析等多个进程可同时以只读 mmap 打开同一份面板（零拷贝，RSS 不随进程数增长），
+不必各自为每只股票拉取并构造字典列表。数据来自本地K线库（bar_store.py）中某一个数据源的文件
+（默认东方财富，即 data_source.fetch_kline 写入的；选股器扫描写入的是 sina/tencent），--refresh 时先补拉。
+
+目录结构：
+  <根目录>/<周期>/<构建号>/open.npy high.npy low.npy close.npy volume.npy   float64, 股票×N
+                            t.npy      int64 时间 YYYYMMDDHHMMSS，股票×N
+                            valid.npy  bool，股票×N
+                            meta.json  周期、N、股票代码/名称、构建时间
+  <根目录>/<周期>/CURRENT   当前构建号（写临时文件后 os.replace，读者总是看到完整的一版）
+
+右对齐：每只股票最后一根K线位于最后一列，不足N根的左侧 valid=False、价格为 NaN、时间为 0。
+各股票最后一根的时间可能不同（停牌），需要按时间对齐的调用方请看 t。
+
+用法：
+    cd stocks
+    python bar_panel.py 240min 620            # 用本地K线库构建日线面板
+    python bar_panel.py 5min 540 --refresh    # 先通过 data_source 补拉再构建
+    python bar_panel.py 240min 620 --source tencent   # 用选股器扫描时写入的腾讯日线构建
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import bar_store
+from bar_series import BarSeries
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCREENER_FILE = os.path.join(ROOT_DIR, "严格选股_多周期.py")
+PANEL_ROOT = os.environ.get("BAR_PANEL_DIR", os.path.join(ROOT_DIR, "bar_data", "panels"))
+
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+KEEP_BUILDS = 2  # 保留最近几次构建（旧读者可能仍映射着上一版）
+
+
+def load_stock_list() -> List[Tuple[str, str]]:
+    """股票列表与过滤规则沿用选股器（StrictStockScreener.load_stock_list），面板与选股扫描的股票范围一致"""
+    module = sys.modules.get("screener")
+    if module is None or os.path.abspath(getattr(module, "__file__", "")) != SCREENER_FILE:
+        # 文件名含中文，不能直接 import
+        spec = importlib.util.spec_from_file_location("_panel_screener", SCREENER_FILE)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module.StrictStockScreener().load_stock_list()
+
+
+class BarPanel:
+    """已构建的面板（只读 mmap）。各字段为 股票×N 数组，行号与 codes 对应"""
+
+    def __init__(self, path: str, meta: Dict, arrays: Dict[str, np.ndarray]):
+        self.path = path
+        self.meta = meta
+        self.period: str = meta['period']
+        self.n_bars: int = meta['n_bars']
+        self.codes: List[str] = meta['codes']
+        self.names: List[str] = meta['names']
+        self.open = arrays['open']
+        self.high = arrays['high']
+        self.low = arrays['low']
+        self.close = arrays['close']
+        self.volume = arrays['volume']
+        self.t = arrays['t']
+        self.valid = arrays['valid']
+        self._row_of = {code: i for i, code in enumerate(self.codes)}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def row(self, code: str) -> Optional[int]:
+        return self._row_of.get(code)
+
+    def bar_count(self, i: int) -> int:
+        """第 i 只股票的有效K线根数（右对齐，有效部分是最后若干列）"""
+        return int(self.valid[i].sum())
+
+    def bars(self, i: int) -> BarSeries:
+        """第 i 只股票的有效K线（BarSeries，兼容逐股票的旧调用方）"""
+        k = self.bar_count(i)
+        if k == 0:
+            return BarSeries()
+        records = np.empty(k, dtype=bar_store.BAR_DTYPE)
+        records['t'] = self.t[i, -k:]
+        for f in PANEL_FIELDS:
+            records[f] = getattr(self, f)[i, -k:]
+        return bar_store.to_series(records, self.period)
+
+
+def _period_dir(period: str, root: Optional[str]) -> str:
+    return os.path.join(root or PANEL_ROOT, bar_store.normalize_period(period))
+
+
+def open_panel(period: str, root: Optional[str] = None) -> Optional[BarPanel]:
+    """以只读 mmap 打开某周期的当前面板，未构建时返回 None"""
+    period_dir = _period_dir(period, root)
+    try:
+        with open(os.path.join(period_dir, 'CURRENT'), 'r', encoding='utf-8') as f:
+            build_id = f.read().strip()
+        path = os.path.join(period_dir, build_id)
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+              for name in PANEL_FIELDS + ('t', 'valid')}
+    return BarPanel(path, meta, arrays)
+
+
+# data_source.fetch_kline 的数据源 → 使其排在第一位的 source_idx（--refresh 用）
+REFRESH_SOURCE_IDX = {'eastmoney': 0, 'sina': 1}
+
+
+def build_panel(period: str, n_bars: int, stocks: Optional[List[Tuple[str, str]]] = None,
+                root: Optional[str] = None, refresh: bool = False, workers: int = 8,
+                source: str = 'eastmoney') -> BarPanel:
+    """
+    构建面板：逐只股票读取本地K线库中 source 数据源的最后 n_bars 根写入 mmap 数组，完成后原子切换 CURRENT。
+    refresh=True 时先经 data_source.fetch_kline 补拉（同时更新本地K线库，只支持 REFRESH_SOURCE_IDX 中的数据源）。
+    """
+    period = bar_store.normalize_period(period)
+    stocks = stocks if stocks is not None else load_stock_list()
+    store = bar_store.get_store() or bar_store.BarStore()
+
+    if refresh:
+        import data_source
+        if source not in REFRESH_SOURCE_IDX:
+            raise ValueError(f"data_source 不提供 {source} 数据源，无法补拉")
+
+        def _refresh(item):
+            try:
+                data_source.fetch_kline(item[1][0], period, n_bars, source_idx=REFRESH_SOURCE_IDX[source])
+            except Exception:
+                pass  # 单只失败不影响构建，面板里该股票按库中已有数据（或无效）处理
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_refresh, enumerate(stocks)))
+
+    period_dir = _period_dir(period, root)
+    build_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f_') + f"{os.getpid()}"
+    path = os.path.join(period_dir, build_id)
+    os.makedirs(path, exist_ok=True)
+
+    shape = (len(stocks), n_bars)
+    arrays = {f: np.lib.format.open_memmap(os.path.join(path, f'{f}.npy'), mode='w+',
+                                           dtype=np.float64, shape=shape)
+              for f in PANEL_FIELDS}
+    t = np.lib.format.open_memmap(os.path.join(path, 't.npy'), mode='w+', dtype=np.int64, shape=shape)
+    valid = np.lib.format.open_memmap(os.path.join(path, 'valid.npy'), mode='w+', dtype=bool, shape=shape)
+
+    filled = 0
+    for i, (code, _) in enumerate(stocks):
+        records = store.read(code, period, source, last=n_bars)
+        k = len(records)
+        for f in PANEL_FIELDS:
+            arrays[f][i, :n_bars - k] = np.nan
+            if k:
+                arrays[f][i, n_bars - k:] = records[f]
+        t[i, :n_bars - k] = 0
+        valid[i, :n_bars - k] = False
+        if k:
+            t[i, n_bars - k:] = records['t']
+            valid[i, n_bars - k:] = True
+            filled += 1
+    for arr in list(arrays.values()) + [t, valid]:
+        arr.flush()
+    del arrays, t, valid
+
+    meta = {
+        'period': period,
+        'source': source,
+        'n_bars': n_bars,
+        'codes': [code for code, _ in stocks],
+        'names': [name for _, name in stocks],
+        'filled': filled,
+        'built_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    tmp = os.path.join(period_dir, f'CURRENT.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(build_id)
+    os.replace(tmp, os.path.join(period_dir, 'CURRENT'))
+    _cleanup_builds(period_dir, keep=build_id)
+    return open_panel(period, root)
+
+
+def _cleanup_builds(period_dir: str, keep: str):
+    """删除较旧的构建，只保留最近 KEEP_BUILDS 次（含当前）"""
+    builds = sorted(d for d in os.listdir(period_dir)
+                    if os.path.isdir(os.path.join(period_dir, d)))
+    for d in builds[:-KEEP_BUILDS]:
+        if d != keep:
+            shutil.rmtree(os.path.join(period_dir, d), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建全市场K线面板（内存映射）")
+    parser.add_argument("period", help="周期: 1min/5min/15min/30min/60min/240min/weekly/monthly")
+    parser.add_argument("n_bars", type=int, help="每只股票保留的最近K线根数")
+    parser.add_argument("--refresh", action="store_true", help="先通过 data_source 补拉K线再构建")
+    parser.add_argument("--workers", type=int, default=8, help="补拉线程数")
+    parser.add_argument("--source", default="eastmoney", choices=("eastmoney", "sina", "tencent"),
+                        help="读取本地K线库中哪个数据源的K线（--refresh 只支持 eastmoney/sina）")
+    args = parser.parse_args()
+
+    start = time.time()
+    panel = build_panel(args.period, args.n_bars, refresh=args.refresh, workers=args.workers,
+                        source=args.source)
+    print(f"面板已构建: {panel.path}")
+    print(f"  {len(panel)} 只股票 × {panel.n_bars} 根, 有数据 {panel.meta['filled']} 只, "
+          f"耗时 {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+K线周期合成 - 由更细周期的K线在本地聚合出粗周期K线
+
+监控每轮分别请求 5分钟、30分钟K线，同一只股票两次请求；30分钟K线完全可以由已缓存的 5分钟K线合成，
+周线/月线同理可由日线合成。每个周期只需一族上游请求，每轮请求量约减少三分之一。
+
+合成规则（与数据源自带的粗周期K线一致）：
+  - 分钟K线按 A 股交易时段对齐，时间标签为K线结束时刻：
+      上午 09:30-11:30 → 30分钟: 10:00 10:30 11:00 11:30；60分钟: 10:30 11:30
+      下午 13:00-15:00 → 30分钟: 13:30 14:00 14:30 15:00；60分钟: 14:00 15:00
+    午休不跨桶（11:30 的桶不会并入 13:00 之后的K线）
+  - 周线按 ISO 周、月线按自然月分组，日期标签为组内最后一个交易日
+  - 开=首根开，高=最高，低=最低，收=末根收，量=求和
+  - 最后一组可能未走完（盘中），与数据源返回的当前未完成K线含义相同
+
+DERIVED_FROM 给出每个可合成周期的来源周期，BASE_BARS_PER 为每根合成K线大约对应的来源K线根数
+（用于推算需要请求多少根来源K线，can_derive 据此判断数据源上限内能否合成出足够根数）。max_bars_since 按交易时段估算某根K线之后最多又出了几根（选股器的
+形态观察名单据此判断本轮能否出信号）；session_closes 给出交易日内各根分钟K线的收盘时刻（监控按此对齐扫描），
+closed_bars 去掉尾部未收盘的分钟K线。
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+
+from bar_series import BarSeries
+
+# 可合成周期 → 来源周期
+DERIVED_FROM = {
+    '15min': '5min',
+    '30min': '5min',
+    '60min': '5min',
+    'weekly': '240min',
+    'monthly': '240min',
+}
+
+# 每根合成K线对应的来源K线根数（周/月按交易日估算，取上限）
+BASE_BARS_PER = {
+    '15min': 3,
+    '30min': 6,
+    '60min': 12,
+    'weekly': 5,
+    'monthly': 23,
+}
+
+PERIOD_MINUTES = {'1min': 1, '5min': 5, '15min': 15, '30min': 30, '60min': 60}
+
+# A 股连续竞价时段（自零点起的分钟数）
+SESSIONS = ((9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60))
+
+
+def _minute_label(day: str, minutes: int) -> str:
+    """分钟K线时间（结束时刻，'YYYY-MM-DD HH:MM[:SS]'）→ 所属 minutes 周期K线的结束时刻"""
+    try:
+        m = int(day[11:13]) * 60 + int(day[14:16])
+    except (ValueError, IndexError):
+        raise ValueError(f"非分钟K线时间: {day!r}")
+    start, end = SESSIONS[0] if m <= SESSIONS[0][1] else SESSIONS[1]
+    # 结束时刻落在 (start+(k-1)*minutes, start+k*minutes] 的归入第 k 桶；开盘集合竞价那根并入第一桶
+    k = max(1, -(-(m - start) // minutes))
+    label = min(start + k * minutes, end)
+    return f"{day[:11]}{label // 60:02d}:{label % 60:02d}{day[16:]}"
+
+
+def _week_key(day: str) -> Tuple[int, int]:
+    return date(int(day[:4]), int(day[5:7]), int(day[8:10])).isocalendar()[:2]
+
+
+def _aggregate(series: BarSeries, key: Callable[[str], object],
+               label: Callable[[str, str], str]) -> BarSeries:
+    """按 key(日期) 对连续K线分组聚合，label(组内首根日期, 末根日期) 给出合成K线的时间标签"""
+    out = BarSeries()
+    n = len(series)
+    if not n:
+        return out
+    day, o, h, l, c, v = series.day, series.open, series.high, series.low, series.close, series.volume
+    start = 0
+    cur = key(day[0])
+    for i in range(1, n + 1):
+        k = key(day[i]) if i < n else None
+        if i < n and k == cur:
+            continue
+        out.append(label(day[start], day[i - 1]),
+                   o[start], max(h[start:i]), min(l[start:i]), c[i - 1], sum(v[start:i]))
+        start, cur = i, k
+    return out
+
+
+def resample_minutes(series: BarSeries, minutes: int) -> BarSeries:
+    """分钟K线 → minutes 分钟K线（按交易时段对齐，时间标签为结束时刻）"""
+    def key(day: str) -> str:
+        return _minute_label(day, minutes)
+    return _aggregate(series, key, lambda first, last: key(first))
+
+
+def resample_weekly(series: BarSeries) -> BarSeries:
+    """日K线 → 周K线（ISO 周，日期为该周最后一个交易日）"""
+    return _aggregate(series, _week_key, lambda first, last: last)
+
+
+def resample_monthly(series: BarSeries) -> BarSeries:
+    """日K线 → 月K线（日期为该月最后一个交易日）"""
+    return _aggregate(series, lambda d: d[:7], lambda first, last: last)
+
+
+def resample(series: BarSeries, period: str) -> BarSeries:
+    """按目标周期合成（series 须为 DERIVED_FROM[period] 周期、按时间正序的K线）"""
+    if period == 'weekly':
+        return resample_weekly(series)
+    if period == 'monthly':
+        return resample_monthly(series)
+    if period in PERIOD_MINUTES:
+        return resample_minutes(series, PERIOD_MINUTES[period])
+    raise ValueError(f"不支持合成的周期: {period}")
+
+
+def base_datalen(period: str, datalen: int, limit: int) -> int:
+    """合成 datalen 根 period K线需要请求的来源K线根数（不超过数据源上限 limit）；
+    多请求一根合成K线的量：来源被截断时最早一根合成K线可能不完整，会被丢弃"""
+    return min(limit, (datalen + 1) * BASE_BARS_PER[period])
+
+
+def can_derive(period: str, datalen: int, limit: int) -> bool:
+    """单次请求 limit 根来源K线能否合成出 datalen 根 period K线（1500 根日线只够约 300 根周线、65 根月线）"""
+    return period in DERIVED_FROM and (datalen + 1) * BASE_BARS_PER[period] <= limit
+
+
+# 每根K线跨越的交易日数（分钟线为小数）
+DAYS_PER_BAR = {'1min': 1 / 240, '5min': 1 / 48, '15min': 1 / 16, '30min': 1 / 8, '60min': 1 / 4,
+                '240min': 1, 'weekly': 5, 'monthly': 23}
+
+_BEIJING = timezone(timedelta(hours=8))
+_MAX_SCAN_DAYS = 31  # 超过该天数不再逐日计数，直接视为“很多根”
+
+
+def beijing_now() -> datetime:
+    """北京时间（不带时区信息，与K线时间字符串可直接比较）；CI 机器通常是 UTC"""
+    return datetime.now(_BEIJING).replace(tzinfo=None)
+
+
+def closed_bars(series: BarSeries, period: str, now: Optional[datetime] = None) -> BarSeries:
+    """去掉尾部尚未收盘的分钟K线（时间标签为结束时刻，晚于 now 的即未走完）；日线及以上原样返回"""
+    if period not in PERIOD_MINUTES or not len(series):
+        return series
+    cutoff = (now or beijing_now()).strftime('%Y-%m-%d %H:%M:%S')
+    n = len(series)
+    while n and series.day[n - 1] > cutoff:
+        n -= 1
+    return series if n == len(series) else series[:n]
+
+
+def session_closes(period: str, day: date) -> List[datetime]:
+    """某交易日内各根 period 分钟K线的收盘时刻"""
+    minutes = PERIOD_MINUTES[period]
+    return [datetime(day.year, day.month, day.day, label // 60, label % 60)
+            for start, end in SESSIONS for label in range(start + minutes, end + 1, minutes)]
+
+
+def max_bars_since(last_bar: str, period: str, now: Optional[datetime] = None) -> int:
+    """
+    时间为 last_bar 的K线之后到 now 为止最多已开始了几根新K线（含正在走的一根）。
+    按工作日与交易时段计数、不扣节假日，只会多算不会少算
+    """
+    now = now or beijing_now()
+    last_day = date(int(last_bar[:4]), int(last_bar[5:7]), int(last_bar[8:10]))
+    days = (now.date() - last_day).days
+    if days > _MAX_SCAN_DAYS:
+        return 10 ** 6
+    if period == 'weekly':
+        return max(0, days // 7 + 1) if days > 0 else 0
+    if period == 'monthly':
+        months = (now.year - last_day.year) * 12 + now.month - last_day.month
+        return max(0, months)
+    weekdays = [last_day + timedelta(days=k) for k in range(days + 1)
+                if (last_day + timedelta(days=k)).weekday() < 5]
+    if period not in PERIOD_MINUTES:
+        return sum(1 for d in weekdays if d > last_day)
+
+    minutes = PERIOD_MINUTES[period]
+    last_dt = datetime.strptime(last_bar[:16], '%Y-%m-%d %H:%M')
+    return sum(1 for d in weekdays for close_at in session_closes(period, d)
+               if close_at > last_dt and close_at - timedelta(minutes=minutes) < now)
@@ -0,0 +1,166 @@
+"""
+K线序列 - data_source、选股器、个股分析、持仓监控共用的紧凑K线容器
+
+原先K线是字典列表、价格是字符串（data_source.KLineBar），每个消费方在每次访问时都要 float(k['close'])，
+一根K线（dict + 6 个 str）约 600 字节。BarSeries 按列存放：
+  day     List[str]       日期/时间（'2024-01-02' 或 '2024-01-02 10:05:00'）
+  open/high/low/close/volume   array('d')，抓取时解析一次，之后直接是 float
+
+一根K线约 40 字节 + 日期字符串，比字典列表省一个数量级。列可直接求和/切片；np.frombuffer(series.close)
+可零拷贝得到 numpy 数组。
+
+迁移期兼容：
+  - series[i] 返回 Bar 视图，支持 bar['close'] / bar.get('day') / bar['date'] 等旧字典式访问（数值为 float）
+  - series[a:b] 返回新的 BarSeries；可迭代、len()、布尔判断与列表一致
+  - as_series(x) 把旧的字典列表（字符串或数值）转换为 BarSeries，已是 BarSeries 则原样返回
+  - series.to_dicts() 还原为 KLineBar 格式（字符串值）
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _format_number(v: float) -> str:
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+class Bar:
+    """BarSeries 中一根K线的只读视图（字典式访问，兼容旧的 KLineBar 调用方）"""
+
+    __slots__ = ('_series', '_i')
+
+    def __init__(self, series: 'BarSeries', i: int):
+        self._series = series
+        self._i = i
+
+    def __getitem__(self, key: str):
+        if key in ('day', 'date'):
+            return self._series.day[self._i]
+        if key in FIELDS:
+            return getattr(self._series, key)[self._i]
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in ('day', 'date') or key in FIELDS
+
+    def keys(self):
+        return ('day',) + FIELDS
+
+    def to_dict(self) -> Dict:
+        return {k: self[k] for k in self.keys()}
+
+    def __repr__(self) -> str:
+        return f"Bar({self.to_dict()})"
+
+
+class BarSeries:
+    """按列存放的K线序列（时间正序）"""
+
+    __slots__ = ('day',) + FIELDS
+
+    def __init__(self, day: Optional[List[str]] = None, open: Iterable[float] = (),
+                 high: Iterable[float] = (), low: Iterable[float] = (),
+                 close: Iterable[float] = (), volume: Iterable[float] = ()):
+        self.day: List[str] = list(day) if day is not None else []
+        self.open = array('d', open)
+        self.high = array('d', high)
+        self.low = array('d', low)
+        self.close = array('d', close)
+        self.volume = array('d', volume)
+
+    # ---------- 构造 ----------
+
+    @classmethod
+    def from_dicts(cls, bars: Iterable[Dict]) -> 'BarSeries':
+        """字典列表（值为字符串或数值，日期键 day 或 date）→ BarSeries；缺字段/非数值的K线跳过"""
+        series = cls()
+        for b in bars:
+            try:
+                values = [float(b[f]) for f in FIELDS]
+                day = b.get('day') or b.get('date')
+            except (KeyError, ValueError, TypeError):
+                continue
+            series.append(day, *values)
+        return series
+
+    @classmethod
+    def from_columns(cls, day: Sequence[str], values) -> 'BarSeries':
+        """日期序列 + n×5 (OHLCV) 数组/嵌套序列 → BarSeries"""
+        if hasattr(values, 'T'):  # numpy 数组：按列整段复制
+            cols = [values[:, k].tolist() for k in range(len(FIELDS))]
+        else:
+            cols = list(zip(*values)) if len(values) else [()] * len(FIELDS)
+        return cls(list(day), *cols)
+
+    def append(self, day: str, open: float, high: float, low: float, close: float, volume: float):
+        self.day.append(day)
+        self.open.append(open)
+        self.high.append(high)
+        self.low.append(low)
+        self.close.append(close)
+        self.volume.append(volume)
+
+    # ---------- 序列协议 ----------
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            return BarSeries(self.day[key], self.open[key], self.high[key],
+                             self.low[key], self.close[key], self.volume[key])
+        n = len(self.day)
+        if key < 0:
+            key += n
+        if not 0 <= key < n:
+            raise IndexError("BarSeries index out of range")
+        return Bar(self, key)
+
+    def __iter__(self) -> Iterator[Bar]:
+        return (Bar(self, i) for i in range(len(self.day)))
+
+    def __add__(self, other) -> 'BarSeries':
+        """拼接另一段 BarSeries 或字典列表（如盘中用实时行情现拼的今天这根）"""
+        other = as_series(other)
+        return BarSeries(self.day + other.day, self.open + other.open, self.high + other.high,
+                         self.low + other.low, self.close + other.close, self.volume + other.volume)
+
+    def __repr__(self) -> str:
+        span = f" {self.day[0]} ~ {self.day[-1]}" if self.day else ""
+        return f"BarSeries({len(self)} 根{span})"
+
+    # ---------- 查询/转换 ----------
+
+    def before(self, day: str) -> 'BarSeries':
+        """日期早于 day 的部分（按日期二分，day 可只给日期部分）"""
+        return self[:bisect_left(self.day, day)]
+
+    def columns(self) -> Dict[str, List]:
+        """列字典（day + 五个数值列），可直接构造 pandas.DataFrame"""
+        cols: Dict[str, List] = {'day': list(self.day)}
+        for f in FIELDS:
+            cols[f] = getattr(self, f).tolist()
+        return cols
+
+    def to_dicts(self) -> List[Dict[str, str]]:
+        """还原为 data_source.KLineBar 格式（字段值为字符串）"""
+        return [{'day': d, 'open': _format_number(o), 'high': _format_number(h),
+                 'low': _format_number(l), 'close': _format_number(c), 'volume': _format_number(v)}
+                for d, o, h, l, c, v in zip(self.day, self.open, self.high,
+                                            self.low, self.close, self.volume)]
+
+
+def as_series(bars) -> BarSeries:
+    """迁移期适配：BarSeries 原样返回，字典列表/None 转换为 BarSeries"""
+    if isinstance(bars, BarSeries):
+        return bars
+    return BarSeries.from_dicts(bars or [])
@@ -0,0 +1,269 @@
+"""
+本地K线库 - 按 (周期, 代码) 存放的定长二进制K线文件
+
+选股器、data_source.fetch_kline 及其调用方（个股分析、持仓监控、ML结果回填）共用同一份本地K线，
+重启后只需补拉缺失的尾部，不再每次整段下载。
+
+存储格式：
+  <根目录>/<周期>/<数据源>/<代码>.bin，内容为按时间升序排列的 numpy 结构化记录（BAR_DTYPE，小端定长48字节/根）
+    t       int64    时间 YYYYMMDDHHMMSS（日/周/月线时分秒为0）
+    open/high/low/close/volume  float64
+  - 按数据源分文件：各数据源的成交量单位（东方财富为手、新浪为股）和复权口径不同，混在一个文件里
+    尾部重叠核对永远对不上，各工具会反复整段重拉、互相覆盖
+  - 增量写入（write_tail）：新K线须与文件尾部重叠（最后一根通常是未完成的K线），从重叠起点替换
+  - 整段写入（merge）：与已有K线合并，不截短别的调用方写入的更长历史；重叠部分不一致视为复权调整，只保留新K线
+  - 所有写入都先写临时文件再 os.replace，其他进程读到的总是完整的文件
+  - 读取：np.fromfile 一次读入，按时间二分截取区间
+
+根目录默认为本文件旁的 bar_data/，可用环境变量 BAR_STORE_DIR 指定；BAR_STORE_DIR=off 关闭。
+"""
+
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bar_series import BarSeries
+
+BAR_DTYPE = np.dtype([
+    ('t', '<i8'),
+    ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+])
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# 周期别名（各模块对日线的叫法不同，落到同一个目录）
+_PERIOD_ALIAS = {'daily': '240min', 'day': '240min', '101': '240min'}
+_DAILY_PERIODS = ('240min', 'weekly', 'monthly')
+_MINUTE_BARS_PER_DAY = {'1min': 240, '5min': 48, '15min': 16, '30min': 8, '60min': 4}
+
+# 每个文件最多保留的K线根数（分钟线只追加会无限增长，超过两倍时裁剪）
+KEEP_BARS = {'1min': 4800, '5min': 4800, '15min': 3000, '30min': 3000, '60min': 3000}
+KEEP_BARS_DEFAULT = 3000
+
+_DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bar_data')
+
+
+def normalize_period(period: str) -> str:
+    return _PERIOD_ALIAS.get(period, period)
+
+
+def encode_time(day: str) -> int:
+    """'2024-01-02' / '2024-01-02 10:05' / '2024-01-02 10:05:00' → 20240102100500"""
+    digits = re.sub(r'\D', '', day)
+    if len(digits) < 8:
+        raise ValueError(f"无法解析K线时间: {day!r}")
+    return int(digits[:14].ljust(14, '0'))
+
+
+def decode_time(t: int, period: str) -> str:
+    s = f"{t:014d}"
+    if normalize_period(period) in _DAILY_PERIODS:
+        return f"{s[0:4]}-{s[4:6]}-{s[6:8]}"
+    return f"{s[0:4]}-{s[4:6]}-{s[6:8]} {s[8:10]}:{s[10:12]}:{s[12:14]}"
+
+
+def _format_number(v: float) -> str:
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+def from_kline_bars(bars) -> np.ndarray:
+    """BarSeries 或字典列表（字段值为字符串或数值）→ 按时间升序的结构化数组；同一时间保留最后一根"""
+    records = np.empty(len(bars), dtype=BAR_DTYPE)
+    if isinstance(bars, BarSeries):
+        records['t'] = [encode_time(d) for d in bars.day]
+        for f in PRICE_FIELDS:
+            records[f] = np.frombuffer(getattr(bars, f), dtype=np.float64)
+    else:
+        for i, b in enumerate(bars):
+            records[i] = (encode_time(b.get('day') or b.get('date')),
+                          float(b['open']), float(b['high']), float(b['low']),
+                          float(b['close']), float(b['volume']))
+    records = records[np.argsort(records['t'], kind='stable')]
+    if len(records) > 1:
+        keep = np.append(records['t'][1:] != records['t'][:-1], True)
+        records = records[keep]
+    return records
+
+
+def from_arrays(days: List[str], values: np.ndarray) -> np.ndarray:
+    """时间字符串列表 + n×5 (OHLCV) 数组 → 结构化数组（调用方保证已按时间升序）"""
+    records = np.empty(len(days), dtype=BAR_DTYPE)
+    records['t'] = [encode_time(d) for d in days]
+    for k, f in enumerate(PRICE_FIELDS):
+        records[f] = values[:, k]
+    return records
+
+
+def to_kline_bars(records: np.ndarray, period: str) -> List[Dict]:
+    """结构化数组 → data_source.KLineBar 格式（字段值为字符串）"""
+    cols = [records[f].tolist() for f in PRICE_FIELDS]
+    return [{'day': decode_time(t, period),
+             'open': _format_number(o), 'high': _format_number(h), 'low': _format_number(l),
+             'close': _format_number(c), 'volume': _format_number(v)}
+            for t, o, h, l, c, v in zip(records['t'].tolist(), *cols)]
+
+
+def to_series(records: np.ndarray, period: str) -> BarSeries:
+    """结构化数组 → BarSeries（数值列直接整段复制，不经字符串）"""
+    return BarSeries([decode_time(t, period) for t in records['t'].tolist()],
+                     *(records[f].tolist() for f in PRICE_FIELDS))
+
+
+def merge_records(existing: np.ndarray, records: np.ndarray) -> np.ndarray:
+    """
+    已有K线与新拉取的一段合并：新K线覆盖同时间的旧K线，两侧多出的旧K线保留。
+    两者在时间上没有交集、交集的时间点对不上，或共同的已完成K线（文件最后一根除外，可能是未走完的K线）
+    数值不一致（复权调整）时无法确认衔接，只保留新K线
+    """
+    if not len(existing) or not len(records):
+        return records if len(records) else existing
+    t = existing['t']
+    lo = int(np.searchsorted(t, records['t'][0], 'left'))
+    hi = int(np.searchsorted(t, records['t'][-1], 'right'))
+    overlap = existing[lo:hi]
+    if not len(overlap):
+        return records
+    pos = np.searchsorted(records['t'], overlap['t'])
+    pos_clipped = np.minimum(pos, len(records) - 1)
+    if (records['t'][pos_clipped] != overlap['t']).any():
+        return records
+    finished = len(overlap) - 1 if hi == len(existing) else len(overlap)
+    matched = records[pos_clipped[:finished]]
+    for f in PRICE_FIELDS:
+        if not np.array_equal(matched[f], overlap[f][:finished]):
+            return records
+    return np.concatenate([existing[:lo], records, existing[hi:]])
+
+
+def estimate_missing_bars(last_t: int, period: str, now: Optional[datetime] = None) -> int:
+    """按最后一根K线时间估算到现在最多缺多少根（按自然日放宽估计，宁多勿少），含最后一根自身"""
+    period = normalize_period(period)
+    now = now or datetime.now()
+    last_day = datetime.strptime(f"{last_t:014d}"[:8], '%Y%m%d')
+    days = max(0, (now.date() - last_day.date()).days)
+    if period == 'weekly':
+        return days // 7 + 2
+    if period == 'monthly':
+        return days // 28 + 2
+    if period in _DAILY_PERIODS:
+        return days + 2
+    return (days + 1) * _MINUTE_BARS_PER_DAY.get(period, 48) + 2
+
+
+class BarStore:
+    """本地K线库（线程安全；写入均为临时文件 + os.replace，多进程下读者不会看到半截文件）"""
+
+    def __init__(self, root: str = _DEFAULT_ROOT):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _path(self, code: str, period: str, source: str) -> str:
+        return os.path.join(self.root, normalize_period(period), source, f"{code}.bin")
+
+    def _lock(self, path: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = threading.Lock()
+            return lock
+
+    def _write(self, path: str, records: np.ndarray):
+        """写临时文件后原子替换（调用方持有 path 的锁）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        records.astype(BAR_DTYPE, copy=False).tofile(tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _trim(records: np.ndarray, period: str) -> np.ndarray:
+        """超过保留根数两倍时裁剪到保留根数（分钟线只追加会无限增长）"""
+        keep = KEEP_BARS.get(normalize_period(period), KEEP_BARS_DEFAULT)
+        return records[-keep:] if len(records) > keep * 2 else records
+
+    def read(self, code: str, period: str, source: str, start: Optional[int] = None,
+             end: Optional[int] = None, last: Optional[int] = None) -> np.ndarray:
+        """读取某数据源 [start, end] 时间区间（YYYYMMDDHHMMSS，含端点）的K线，last 表示只取最后若干根"""
+        path = self._path(code, period, source)
+        try:
+            records = np.fromfile(path, dtype=BAR_DTYPE)
+        except (FileNotFoundError, ValueError):
+            return np.empty(0, dtype=BAR_DTYPE)
+        if start is not None or end is not None:
+            lo = int(np.searchsorted(records['t'], start, 'left')) if start is not None else 0
+            hi = int(np.searchsorted(records['t'], end, 'right')) if end is not None else len(records)
+            records = records[lo:hi]
+        if last is not None:
+            records = records[-last:] if last > 0 else records[:0]
+        return records
+
+    def last_time(self, code: str, period: str, source: str) -> Optional[int]:
+        """文件最后一根K线的时间（只读最后一条记录）"""
+        path = self._path(code, period, source)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if size < BAR_DTYPE.itemsize:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(size - size % BAR_DTYPE.itemsize - BAR_DTYPE.itemsize)
+            return int(np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)['t'][0])
+
+    def merge(self, code: str, period: str, source: str, records: np.ndarray):
+        """整段拉取的K线与已有数据合并写入（规则见 merge_records）；各调用方请求的根数不同，不能直接覆盖"""
+        if len(records) == 0:
+            return
+        path = self._path(code, period, source)
+        with self._lock(path):
+            merged = merge_records(self.read(code, period, source), records.astype(BAR_DTYPE, copy=False))
+            self._write(path, self._trim(merged, period))
+
+    def write_tail(self, code: str, period: str, source: str, records: np.ndarray) -> bool:
+        """
+        写入最新一段K线：与文件尾部重叠的部分被替换（最后一根通常是上次未完成的K线），其余追加。
+        重叠部分除文件最后一根外必须与已有数据完全一致，否则返回 False（复权调整，需调用方整段替换）；
+        新K线早于文件第一根、或与文件之间有缺口时同样返回 False。
+        """
+        if len(records) == 0:
+            return True
+        path = self._path(code, period, source)
+        with self._lock(path):
+            existing = self.read(code, period, source)
+            if len(existing) == 0:
+                return False
+            # 新K线须从文件中间某根开始（首根之后、最后一根及之前），否则视为缺口/整段不同
+            first_new = int(records['t'][0])
+            p = int(np.searchsorted(existing['t'], first_new))
+            if p == 0 or p == len(existing) or existing['t'][p] != first_new:
+                return False
+            overlap = existing[p:]
+            if len(overlap) > len(records) or (records['t'][:len(overlap)] != overlap['t']).any():
+                return False
+            finished = len(overlap) - 1
+            for f in PRICE_FIELDS:
+                if not np.array_equal(records[f][:finished], overlap[f][:finished]):
+                    return False
+
+            merged = np.concatenate([existing[:p], records.astype(BAR_DTYPE, copy=False)])
+            self._write(path, self._trim(merged, period))
+            return True
+
+
+_store: Optional[BarStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[BarStore]:
+    """全局K线库（BAR_STORE_DIR=off 时返回 None）"""
+    global _store
+    root = os.environ.get('BAR_STORE_DIR', _DEFAULT_ROOT)
+    if root.lower() in ('off', '0', 'none', ''):
+        return None
+    with _store_lock:
+        if _store is None or _store.root != root:
+            _store = BarStore(root)
+        return _store
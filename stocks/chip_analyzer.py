@@ -24,12 +24,13 @@ import time
 import re
 import ssl
 import random
-import urllib.request
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
 
+import http_pool
+
 warnings.filterwarnings("ignore")
 
 for _key in ["HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy"]:
@@ -37,8 +38,6 @@ for _key in ["HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy"]:
         del os.environ[_key]
 
 ssl._create_default_https_context = ssl._create_unverified_context
-_proxy_handler = urllib.request.ProxyHandler({})
-_opener = urllib.request.build_opener(_proxy_handler)
 
 _USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0",
@@ -79,10 +78,9 @@ def _http_get(url: str, timeout: int = 20, retry: int = 3) -> bytes:
     for attempt in range(retry + 1):
         try:
             _limiter.wait()
-            req = urllib.request.Request(url, headers=headers)
-            with _opener.open(req, timeout=timeout) as r:
-                _limiter.report_success()
-                return r.read()
+            data = http_pool.http_get(url, headers, timeout)
+            _limiter.report_success()
+            return data
         except:
             _limiter.report_throttled()
             if attempt < retry:
@@ -199,7 +197,7 @@ def fetch_chip_data(code: str, realtime: bool = False) -> pd.DataFrame:
     if temp_df.empty and DATA_SOURCE_AVAILABLE:
         klines = fetch_kline(code, period="daily", limit=210)
         if klines:
-            temp_df = pd.DataFrame(klines)
+            temp_df = pd.DataFrame(klines.columns())
             temp_df["date"] = pd.to_datetime(temp_df["day"])
             temp_df["hsl"] = 5.0
 
@@ -37,11 +37,13 @@ import re
 import ssl
 import random
 import threading
-import urllib.request
 import urllib.parse
 import logging
 from typing import Dict, List, Optional, Tuple, TypedDict
 
+import http_pool
+from bar_series import BarSeries
+
 # 禁用代理
 for _key in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
     if _key in os.environ:
@@ -49,15 +51,13 @@ for _key in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
-_proxy_handler = urllib.request.ProxyHandler({})
-_opener = urllib.request.build_opener(_proxy_handler)
-
 logger = logging.getLogger(__name__)
 
 
 # ==================== TypedDict 类型定义 ====================
 
 class KLineBar(TypedDict):
+    """旧的K线字典格式（字段值为字符串）。fetch_kline 现返回 BarSeries，需要此格式时用 to_dicts()"""
     day: str
     open: str
     high: str
@@ -132,7 +132,7 @@ def _random_ua() -> str:
 
 def _http_get(url: str, headers: Optional[Dict[str, str]] = None,
               timeout: int = 15, retry: int = 2) -> bytes:
-    """通用HTTP GET，带重试和随机UA"""
+    """通用HTTP GET，带重试和随机UA（经 http_pool 长连接复用、gzip 压缩传输）"""
     h: Dict[str, str] = {
         "User-Agent": _random_ua(),
         "Accept": "application/json, text/plain, */*",
@@ -145,9 +145,7 @@ def _http_get(url: str, headers: Optional[Dict[str, str]] = None,
     last_err: Exception = RuntimeError("未知错误")
     for attempt in range(retry + 1):
         try:
-            req = urllib.request.Request(url, headers=h)
-            with _opener.open(req, timeout=timeout) as r:
-                return r.read()
+            return http_pool.http_get(url, h, timeout)
         except Exception as e:
             last_err = e
             err_str = str(e)
@@ -337,22 +335,88 @@ def _fetch_stock_list_sina() -> Dict[str, str]:
 
 # ==================== 2. K线数据 ====================
 
+def _get_bar_store():
+    """本地K线库（bar_store.py，依赖 numpy）；不可用或已关闭时返回 None"""
+    try:
+        import bar_store
+    except ImportError:
+        return None
+    return bar_store.get_store()
+
+
 def fetch_kline(code: str, period: str = '240min', limit: int = 1500,
-                source_idx: int = 0) -> List[KLineBar]:
+                source_idx: int = 0) -> BarSeries:
     """
     获取K线数据，东方财富优先，新浪备用
-    返回格式: [{"day": "2024-01-01", "open": "10.0", "high": ..., "close": ..., "low": ..., "volume": ...}]
+    返回 BarSeries（bar_series.py）：day 列 + float 数值列；series[i]['close'] 等字典式访问仍可用，
+    需要旧的字符串字典格式时用 series.to_dicts()
 
     period: '1min','5min','15min','30min','60min','240min','weekly','monthly'
+
+    先查本地K线库（按数据源分文件）：某数据源的库里已有足够根数时只向该数据源补拉缺失的尾部
+    （与库尾重叠核对，不一致视为复权调整后整段重拉），否则整段拉取并与本地库合并。
     """
+    store = _get_bar_store()
+    order = _kline_source_order(source_idx)
+    if store is None:
+        return _fetch_kline_from(order, code, period, limit)[0]
+
+    import bar_store
+    for fetch_fn in order:
+        source = _store_source(fetch_fn, period)
+        if source is None:
+            continue
+        cached = store.read(code, period, source, last=limit)
+        if len(cached) < limit:
+            continue
+        missing = bar_store.estimate_missing_bars(int(cached['t'][-1]), period)
+        if missing >= limit:
+            continue
+        tail, _ = _fetch_kline_from([fetch_fn], code, period, missing)
+        if not tail:
+            return bar_store.to_series(cached, period)  # 网络失败时退回本地数据
+        try:
+            if store.write_tail(code, period, source, bar_store.from_kline_bars(tail)):
+                return bar_store.to_series(store.read(code, period, source, last=limit), period)
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            logger.debug(f"K线尾部写入本地库失败 {code} {period}: {e}")
+        break
+
+    data, fetch_fn = _fetch_kline_from(order, code, period, limit)
+    source = _store_source(fetch_fn, period) if data else None
+    if source:
+        try:
+            store.merge(code, period, source, bar_store.from_kline_bars(data))
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            logger.debug(f"K线写入本地库失败 {code} {period}: {e}")
+    return data
+
+
+def _kline_source_order(source_idx: int = 0) -> List:
     sources = [_fetch_kline_eastmoney, _fetch_kline_sina]
-    order = [sources[(source_idx + i) % len(sources)] for i in range(len(sources))]
+    return [sources[(source_idx + i) % len(sources)] for i in range(len(sources))]
+
+
+def _store_source(fetch_fn, period: str) -> Optional[str]:
+    """本地K线库中该数据源的文件分组名；新浪没有周线/月线接口（返回的是日线），不入库"""
+    if fetch_fn is _fetch_kline_sina:
+        return None if period in ('weekly', 'monthly') else 'sina'
+    return 'eastmoney'
+
+
+def _fetch_kline_remote(code: str, period: str, limit: int,
+                        source_idx: int = 0) -> BarSeries:
+    """从网络获取K线（东方财富优先，新浪备用）"""
+    return _fetch_kline_from(_kline_source_order(source_idx), code, period, limit)[0]
 
+
+def _fetch_kline_from(order: List, code: str, period: str, limit: int) -> Tuple[BarSeries, Optional[object]]:
+    """按 order 依次尝试各数据源，返回 (K线, 成功的数据源函数)；全部失败返回 (空, None)"""
     for fetch_fn in order:
         try:
             data = fetch_fn(code, period, limit)
             if data and len(data) > 0:
-                return data
+                return data, fetch_fn
         except Exception as e:
             err_str = str(e)
             if any(c in err_str for c in ('456', '403', '429', 'RemoteDisconnected')) or \
@@ -364,10 +428,10 @@ def fetch_kline(code: str, period: str = '240min', limit: int = 1500,
                 else:
                     _sina_limiter.report_throttled()
             continue
-    return []
+    return BarSeries(), None
 
 
-def _fetch_kline_eastmoney(code: str, period: str, limit: int) -> List[KLineBar]:
+def _fetch_kline_eastmoney(code: str, period: str, limit: int) -> BarSeries:
     """东方财富K线API"""
     KLT_MAP: Dict[str, int] = {
         '1min': 1, '5min': 5, '15min': 15, '30min': 30,
@@ -388,25 +452,22 @@ def _fetch_kline_eastmoney(code: str, period: str, limit: int) -> List[KLineBar]
     resp = _http_get_json(url, headers={"Referer": "https://quote.eastmoney.com"})
     klines: List[str] = resp.get('data', {}).get('klines', []) if resp.get('data') else []
 
-    result: List[KLineBar] = []
+    result = BarSeries()
     for line in klines:
         parts = line.split(',')
         if len(parts) >= 6:
-            result.append({
-                "day": parts[0],
-                "open": parts[1],
-                "high": parts[3],
-                "low": parts[4],
-                "close": parts[2],
-                "volume": parts[5],
-            })
+            try:
+                result.append(parts[0], float(parts[1]), float(parts[3]),
+                              float(parts[4]), float(parts[2]), float(parts[5]))
+            except ValueError:
+                continue
 
     if result:
         _eastmoney_limiter.report_success()
     return result
 
 
-def _fetch_kline_sina(code: str, period: str, limit: int) -> List[KLineBar]:
+def _fetch_kline_sina(code: str, period: str, limit: int) -> BarSeries:
     """新浪K线API"""
     SCALE_MAP: Dict[str, int] = {
         '1min': 1, '5min': 5, '15min': 15, '30min': 30,
@@ -424,18 +485,15 @@ def _fetch_kline_sina(code: str, period: str, limit: int) -> List[KLineBar]:
     raw = _http_get(url, headers={"Referer": "https://finance.sina.com.cn"})
     data = json.loads(raw.decode("utf-8"))
     if not isinstance(data, list):
-        return []
+        return BarSeries()
 
-    result: List[KLineBar] = []
+    result = BarSeries()
     for d in data:
-        result.append({
-            "day": d.get("day", ""),
-            "open": d.get("open", "0"),
-            "high": d.get("high", "0"),
-            "low": d.get("low", "0"),
-            "close": d.get("close", "0"),
-            "volume": d.get("volume", "0"),
-        })
+        try:
+            result.append(d.get("day", ""), float(d.get("open", 0)), float(d.get("high", 0)),
+                          float(d.get("low", 0)), float(d.get("close", 0)), float(d.get("volume", 0)))
+        except (ValueError, TypeError):
+            continue
 
     if result:
         _sina_limiter.report_success()
@@ -1149,7 +1207,7 @@ def test_all_sources() -> None:
         print(f"\n[{idx}] {label}...")
         try:
             result = fn()
-            if isinstance(result, list):
+            if isinstance(result, (list, BarSeries)):
                 print(f"    成功: {len(result)} 条")
                 for item in result[:3]:
                     print(f"    {item}")
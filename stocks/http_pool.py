@@ -0,0 +1,217 @@
+"""
+HTTP 长连接池 - 选股器、data_source、chip_analyzer 的行情请求共用
+
+原先每次请求都经 urllib 新建 TCP+TLS 连接、且不要求压缩，每轮几千次请求里握手和未压缩 JSON 占了大半耗时
+（跨境的 CI 更明显）。这里按 (协议, 主机, 端口) 复用 http.client 连接：
+  - 每个主机最多 MAX_PER_HOST 个并发连接（超出的请求排队等待），空闲连接放回池中复用
+  - 请求默认带 Accept-Encoding: gzip, deflate，响应透明解压
+  - 复用的连接可能已被服务端关闭：发请求失败时换新连接重试一次
+  - 非 2xx 抛 urllib.error.HTTPError（错误文本与 urllib 一致，调用方的限流检测 '456'/'403'/'429' 不变）
+  - 统计：请求数、连接新建/复用、传输字节与解压后字节（压缩节省量），每轮扫描前 reset_stats
+
+与原 urllib opener 一致：不走系统代理，不校验证书。
+"""
+
+import gzip
+import http.client
+import os
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+MAX_PER_HOST = int(os.environ.get('HTTP_POOL_MAX_PER_HOST', '16'))
+IDLE_TIMEOUT = 30.0   # 空闲超过该秒数的连接不再复用（服务端 keep-alive 通常 60s 内断开）
+MAX_REDIRECTS = 3
+
+_ssl_context = ssl._create_unverified_context()
+
+
+def decode_body(body: bytes, encoding: Optional[str]) -> bytes:
+    """按 Content-Encoding 解压响应体"""
+    encoding = (encoding or '').strip().lower()
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)  # 部分服务端发送无 zlib 头的裸 deflate
+    return body
+
+
+class HTTPPool:
+    """按主机复用的 HTTP 长连接池（线程安全）"""
+
+    def __init__(self, max_per_host: int = MAX_PER_HOST, idle_timeout: float = IDLE_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[Tuple[str, str, int], List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._slots: Dict[Tuple[str, str, int], threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    # ---------- 连接管理 ----------
+
+    def _slot(self, key) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._slots.get(key)
+            if sem is None:
+                sem = self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return sem
+
+    def _checkout(self, key, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """取一个空闲连接（返回 (连接, 是否复用)），没有则新建"""
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=_ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _checkin(self, key, conn: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.setdefault(key, []).append((conn, time.time()))
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            for conns in self._idle.values():
+                for conn, _ in conns:
+                    conn.close()
+            self._idle.clear()
+
+    # ---------- 请求 ----------
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15) -> bytes:
+        """GET 请求，返回解压后的响应体；非 2xx 抛 urllib.error.HTTPError"""
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, resp_headers, body = self._get_once(url, headers or {}, timeout)
+            if status in (301, 302, 303, 307, 308) and resp_headers.get('Location'):
+                url = urllib.parse.urljoin(url, resp_headers['Location'])
+                continue
+            if not 200 <= status < 300:
+                raise urllib.error.HTTPError(url, status, reason, resp_headers, None)
+            return body
+        raise urllib.error.HTTPError(url, status, reason, resp_headers, None)
+
+    def _get_once(self, url: str, headers: Dict[str, str], timeout: float):
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        h = {'Accept-Encoding': 'gzip, deflate'}
+        h.update(headers)
+
+        sem = self._slot(key)
+        sem.acquire()
+        try:
+            for attempt in range(2):
+                conn, reused = self._checkout(key, timeout)
+                try:
+                    conn.request('GET', path, headers=h)
+                    resp = conn.getresponse()
+                    wire = resp.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError,
+                        BrokenPipeError, http.client.CannotSendRequest):
+                    conn.close()
+                    if reused and attempt == 0:
+                        # 复用的连接已被服务端关闭（keep-alive 超时），换新连接重试一次
+                        self._count('stale')
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._checkin(key, conn)
+                body = decode_body(wire, resp.getheader('Content-Encoding'))
+                self.record_response(len(wire), len(body), reused)
+                return resp.status, resp.reason, resp.headers, body
+        finally:
+            sem.release()
+
+    # ---------- 统计 ----------
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def record_response(self, wire_bytes: int, body_bytes: int, reused: bool):
+        """记录一次响应（异步请求等不走连接池的路径也可调用，计入同一份统计）"""
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['reused' if reused else 'new'] += 1
+            self._stats['wire_bytes'] += wire_bytes
+            self._stats['body_bytes'] += body_bytes
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {'requests': 0, 'new': 0, 'reused': 0, 'stale': 0,
+                           'wire_bytes': 0, 'body_bytes': 0}
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['saved_bytes'] = stats['body_bytes'] - stats['wire_bytes']
+        return stats
+
+    def summary(self) -> str:
+        """本轮统计摘要，无请求返回空字符串"""
+        s = self.get_stats()
+        if not s['requests']:
+            return ""
+        reuse_pct = s['reused'] / s['requests'] * 100
+        saved_pct = s['saved_bytes'] / s['body_bytes'] * 100 if s['body_bytes'] else 0
+        text = (f"HTTP连接: 请求 {s['requests']} 次, 复用 {reuse_pct:.0f}% (新建 {s['new']}), "
+                f"压缩节省 {s['saved_bytes'] / 1048576:.1f}MB ({saved_pct:.0f}%)")
+        if s['stale']:
+            text += f", 失效重连 {s['stale']} 次"
+        return text
+
+
+_pool: Optional[HTTPPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> HTTPPool:
+    """全局连接池（进程内共享）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HTTPPool()
+        return _pool
+
+
+def http_get(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15) -> bytes:
+    return get_pool().get(url, headers, timeout)
+
+
+def get_stats() -> Dict[str, int]:
+    return get_pool().get_stats()
+
+
+def get_summary() -> str:
+    return get_pool().summary()
+
+
+def reset_stats():
+    get_pool().reset_stats()
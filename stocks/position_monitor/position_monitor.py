@@ -28,6 +28,7 @@ from typing import Dict, List, Optional
 PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, PARENT_DIR)
 import data_source
+from bar_series import BarSeries, as_series
 
 # 复用钉钉推送
 sys.path.insert(0, os.path.join(PARENT_DIR, 'stock_monitor'))
@@ -140,7 +141,7 @@ def load_positions() -> List[Dict]:
 
 def get_klines_with_today(code: str, current_price: float,
                           today_high: float, today_low: float,
-                          today_open: float, today_volume: float) -> List[dict]:
+                          today_open: float, today_volume: float) -> BarSeries:
     """
     返回用于算 MA/MACD 的日K序列：
       - 历史K线（昨天及以前，已定死）：当天首次拉取后缓存，整天复用
@@ -152,21 +153,20 @@ def get_klines_with_today(code: str, current_price: float,
     if cached and cached[0] == today_str:
         hist = cached[1]
     else:
-        raw = data_source.fetch_kline(code, '240min', 120)
+        raw = as_series(data_source.fetch_kline(code, '240min', 120))
         # 去掉最后一根（可能是今天的，盘中会变），只缓存已定死的历史
-        hist = [k for k in raw if k.get('day', '')[:10] < today_str]
+        hist = raw.before(today_str)
         _kline_cache[code] = (today_str, hist)
 
     # 拼上今天这根（实时）
-    today_bar = {
-        'day': today_str,
-        'open': str(today_open if today_open > 0 else current_price),
-        'high': str(today_high if today_high > 0 else current_price),
-        'low': str(today_low if today_low > 0 else current_price),
-        'close': str(current_price),
-        'volume': str(int(today_volume) if today_volume > 0 else 0),
-    }
-    return hist + [today_bar]
+    klines = hist[:]
+    klines.append(today_str,
+                  today_open if today_open > 0 else current_price,
+                  today_high if today_high > 0 else current_price,
+                  today_low if today_low > 0 else current_price,
+                  current_price,
+                  int(today_volume) if today_volume > 0 else 0)
+    return klines
 
 
 # ==================== 健康度计算 ====================
@@ -200,14 +200,15 @@ def _macd_dead_cross(closes: List[float]) -> Optional[bool]:
 
 
 def compute_health(code: str, quote: dict, capital: dict,
-                   klines: List[dict]) -> Dict:
+                   klines: BarSeries) -> Dict:
     """
     四维健康度判断（每维：好/中/坏），汇总成 健康/观察/转弱。
     返回 {level, reasons:[...], detail:{...}}
     """
     reasons_bad = []
     reasons_good = []
-    closes = [float(k['close']) for k in klines] if klines else []
+    klines = as_series(klines)
+    closes = klines.close.tolist()
 
     # ── 维度1：主力资金 ──
     main_in = capital.get('main_net_in', 0.0)
@@ -243,7 +244,7 @@ def compute_health(code: str, quote: dict, capital: dict,
     vol = float(quote.get('volume', 0) or 0)
     vp_state = 'mid'
     if len(klines) >= 6:
-        hist_vol = [float(k['volume']) for k in klines[-6:-1]]
+        hist_vol = klines.volume[-6:-1]
         avg_vol = sum(hist_vol) / len(hist_vol) if hist_vol else 0
         vol_ratio = vol / avg_vol if avg_vol > 0 else 1.0
         if change_pct < -2 and vol_ratio > 1.3:
@@ -0,0 +1,55 @@
+"""
+批量选股流水线的判定进程 - 严格选股_多周期.py 中 screen_all_stocks(executor='process') 使用
+
+主进程的抓取线程把解析好的K线（n×5 float64：open/high/low/close/volume）写入共享内存槽位，
+本模块的 evaluate 在进程池里直接映射同一块内存计算 MA/金叉/信号，只把判定结果回传，
+K线数据本身不经过 pickle。
+"""
+
+import importlib.util
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_screener = None
+_shm = None
+_ring = None
+
+
+def _attach(shm_name: str) -> shared_memory.SharedMemory:
+    """只映射不接管：共享内存由主进程创建和释放（子进程与主进程共用同一个 resource_tracker，
+    3.13 以下 attach 时的重复登记是幂等的，由主进程 unlink 时统一注销）"""
+    try:
+        return shared_memory.SharedMemory(name=shm_name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=shm_name)
+
+
+def init_worker(screener_path: str, shm_name: str, shape: Tuple[int, int, int],
+                period: str, period_name: str):
+    """进程池初始化：按文件路径加载选股模块（文件名含中文，不能直接 import），映射共享内存槽位"""
+    global _screener, _shm, _ring
+    stocks_dir = os.path.dirname(screener_path)
+    if stocks_dir not in sys.path:
+        sys.path.insert(0, stocks_dir)
+    module = sys.modules.get('screener')
+    if module is None or os.path.abspath(getattr(module, '__file__', '')) != screener_path:
+        spec = importlib.util.spec_from_file_location('_scan_screener', screener_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    _screener = module.StrictStockScreener(period, period_name, columnar=True)
+    _shm = _attach(shm_name)
+    _ring = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+
+
+def evaluate(slot: int, n: int, dates: List[str], code: str = '') -> Tuple[bool, bool, Dict, Dict, float]:
+    """判定槽位中前 n 根K线的最后一根，返回 (普通买入, 严格买入, 详情, 形态状态, 本进程CPU耗时秒)"""
+    t0 = time.process_time()
+    bars = _screener._columnar_from_arrays(dates, _ring[slot, :n])
+    normal_buy, strict_buy, details = _screener._check_signal_at(bars, n - 1)
+    state = _screener._pattern_state(bars, normal_buy or strict_buy, code)
+    return normal_buy, strict_buy, details, state, time.process_time() - t0
@@ -0,0 +1,548 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+选股器微基准 - 分周期测量 _prepare_data / _check_signal_at / check_one_stock 的单次耗时、吞吐和内存分配，
+并用金标准校验优化后的引擎与优化前的参考版本（逐K线对齐通达信金叉.txt）逐K线一致
+
+夹具（bench_fixtures/，均提交到仓库，校验不依赖生成时的 Python/numpy 版本）：
+  合成K线   synthetic/<周期>.json，--synth-update 按固定种子生成，每个周期 SYNTH_STOCKS 只：一半随机游走，
+            一半在末尾植入 金叉 → 阴线 → 倍量阳 → 缩量阴 → 确认阳（最后一根K线出信号）。时间轴固定
+  录制K线   recorded/<周期>.json，--record 从数据源录制 stock_list.md 前N只股票 PERIOD_MAP 全部8个周期的K线
+            （整段 MAX_DATALEN 根；CI 上由 bench-record.yml 手动触发录制并提交）；未录制的周期只测合成K线
+  golden.json  各夹具逐K线的信号行（见 GOLDEN_FIELDS，只含布尔、整数下标、信号类型，不含浮点数），
+            由优化前的参考版本（golden.json 的 reference，一个 git 提交）逐根调用 _check_signal_at 生成。
+            --golden 时当前的字典路径、列式路径 signal_series 都要与之一致
+
+指标（每个周期、每类夹具）：
+  单次耗时   每只夹具重复 --repeat 次，取全部调用的均值/中位数/P95（毫秒）
+  吞吐       夹具只数 / 每只平均耗时之和（只/秒）
+  内存分配   tracemalloc：单次调用的峰值增量（KiB）、调用后仍存活的新分配块数
+check_one_stock 的K线取自夹具、不做过期判定，判定结果缓存容量为 0（测冷判定，缓存键的摘要计算仍计入）。
+
+用法：
+    cd stocks
+    python screener_bench.py                          # 全部8个周期
+    python screener_bench.py --periods 5min 240min --repeat 50
+    python screener_bench.py --save                   # 结果写入基线 bench_fixtures/baseline.json
+    python screener_bench.py --compare                # 与基线对比（耗时变化百分比）
+    python screener_bench.py --golden                 # 只做金标准校验
+    python screener_bench.py --golden-update          # 用参考版本重新生成金标准（新增/重录夹具后）
+    python screener_bench.py --golden-update --reference <提交>   # 更换参考版本（确认判定逻辑是有意修改时才用）
+    python screener_bench.py --record 20              # 录制 stock_list.md 前20只的8个周期K线
+    python screener_bench.py --synth-update           # 重新生成合成K线夹具
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import bar_resample
+from bar_series import BarSeries
+
+# 动态导入中文文件名模块
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_spec = importlib.util.spec_from_file_location("screener", os.path.join(_BASE_DIR, '严格选股_多周期.py'))
+screener = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(screener)
+
+FIXTURE_DIR = os.path.join(_BASE_DIR, 'bench_fixtures')
+RECORDED_DIR = os.path.join(FIXTURE_DIR, 'recorded')
+SYNTH_DIR = os.path.join(FIXTURE_DIR, 'synthetic')
+GOLDEN_FILE = os.path.join(FIXTURE_DIR, 'golden.json')
+BASELINE_FILE = os.path.join(FIXTURE_DIR, 'baseline.json')
+
+PERIODS = [period for period, _, _ in screener.StrictStockScreener.PERIOD_MAP.values()]
+PERIOD_NAMES = {period: name for period, name, _ in screener.StrictStockScreener.PERIOD_MAP.values()}
+
+SYNTH_STOCKS = 12                       # 每个周期的合成夹具只数（偶数序号植入形态）
+SYNTH_END = datetime(2024, 12, 31, 15)  # 合成K线的最后时刻（固定，金标准不随运行日期变化）
+
+
+# ==================== 合成K线 ====================
+def _next_weekday(day: date) -> date:
+    day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def bar_times(period: str, n: int, end: datetime = SYNTH_END) -> List[str]:
+    """截止 end 的最近 n 根 period K线时间（按工作日与交易时段，不扣节假日），格式与数据源一致；
+    周线/月线取每周/每月最后一个工作日，end 所在的一根为未走完的当期"""
+    out = []
+    day = end.date()
+    while len(out) < n:
+        if day.weekday() < 5:
+            if period in bar_resample.PERIOD_MINUTES:
+                out.extend(t.strftime('%Y-%m-%d %H:%M:%S')
+                           for t in reversed(bar_resample.session_closes(period, day)) if t <= end)
+            elif (period == '240min' or day == end.date() or
+                  period == 'weekly' and day.weekday() == 4 or
+                  period == 'monthly' and _next_weekday(day).month != day.month):
+                out.append(day.strftime('%Y-%m-%d'))
+        day -= timedelta(days=1)
+    return out[:n][::-1]
+
+
+class _SynthWriter:
+    """逐根生成K线，价格保留两位小数（与真实行情精度一致），同时维护 MA20/MA30 以便定位金叉"""
+
+    def __init__(self, rnd: random.Random, price: float):
+        self.rnd = rnd
+        self.price = price
+        self.bars: List[Tuple[float, float, float, float, float]] = []
+
+    def add(self, open_: float, close: float, volume: float):
+        wick = lambda: abs(self.rnd.gauss(0, 0.003))
+        o, c = round(open_, 2), round(close, 2)
+        if o == c:  # 十字星既非阴也非阳，植入的形态要求阴阳分明
+            c = round(c + (0.01 if close >= open_ else -0.01), 2)
+        self.bars.append((o, round(max(o, c) * (1 + wick()), 2), round(min(o, c) * (1 - wick()), 2),
+                          c, float(int(volume))))
+        self.price = c
+
+    def walk(self, n: int, drift: float = 0.0, yang_volume: Optional[float] = None,
+             yin_volume: Optional[float] = None):
+        """随机游走 n 根：drift 为每根的平均涨跌幅；量能缺省为随机（阳线偶有放量）"""
+        rnd = self.rnd
+        for _ in range(n):
+            o = self.price * (1 + rnd.gauss(0, 0.003))
+            c = o * (1 + drift + rnd.gauss(0, 0.004 if drift else 0.012))
+            if c > o:
+                v = yang_volume or rnd.randint(1000, 5000) * rnd.choice([1, 1, 1, 2, 3, 5])
+            else:
+                v = yin_volume or rnd.randint(1000, 5000)
+            self.add(o, c, v)
+
+    def ma(self, k: int, end: int) -> float:
+        return sum(bar[3] for bar in self.bars[end - k + 1:end + 1]) / k
+
+
+def synth_bars(period: str, n: int, seed: int, plant: bool = False, grind: int = 0) -> BarSeries:
+    """
+    确定性的合成K线 n 根。plant=True 时在末尾植入完整形态，最后一根为首次确认阳：
+      先连续下跌 40 根（MA20 下穿 MA30），再缩量上涨直到 MA20-MA30 开口首次达到本周期阈值（金叉日，放量），
+      随后 阴线(量1500) → 倍量阳(4000，≥阴量2倍且>金叉量) → 缩量阴(1200) → 确认阳(5000，收盘高于倍量阳)
+    grind>0 时 MA20 上穿 MA30 后先缓涨 grind 根、开口始终不达标，再加速到阈值（简单金叉远在开口达标之前）
+    """
+    rnd = random.Random(f"{period}:{seed}:{int(plant)}")
+    w = _SynthWriter(rnd, price=round(rnd.uniform(5, 50), 2))
+    if not plant:
+        left = n
+        while left > 0:
+            k = min(left, rnd.randint(20, 60))
+            w.walk(k, drift=rnd.choice([-0.006, 0.0, 0.006, 0.006]))
+            left -= k
+    else:
+        threshold = screener.StrictStockScreener.OPEN_THRESHOLD_MAP[period]
+        w.walk(max(n - 44, 60))
+        w.walk(40, drift=-0.01, yang_volume=1200, yin_volume=1500)
+        crossed = False
+        if grind:
+            while w.ma(20, len(w.bars) - 1) <= w.ma(30, len(w.bars) - 1):
+                w.walk(1, drift=0.012, yang_volume=1500, yin_volume=800)
+            crossed = True
+            # 收盘每 k 根涨 0.01、其余持平：收盘不降则 MA20 始终在 MA30 之上（不再交叉），
+            # 稳态开口约 5*0.01/k/价格，按价格取 k 使其约为阈值的 0.4（k≤20，30 根内总有上涨）
+            k = min(20, max(1, -(-1250 // int(threshold * w.price))))
+            for j in range(grind):
+                c = w.price + (0.01 if j % k == k - 1 else 0.0)
+                w.add(c - 0.01, c, 1500)
+        while True:
+            w.walk(1, drift=0.012, yang_volume=1500, yin_volume=800)
+            i = len(w.bars) - 1
+            ma20, ma30 = w.ma(20, i), w.ma(30, i)
+            crossed = crossed or ma20 > ma30
+            if crossed and (ma20 - ma30) * 10000 >= w.price * threshold:
+                o, h, l, c, _ = w.bars[-1]
+                w.bars[-1] = (o, h, l, c, 3000.0)
+                break
+        p = w.price
+        w.add(p * 1.005, p * 0.997, 1500)     # 阴线
+        w.add(p * 0.998, p * 1.020, 4000)     # 倍量阳（首倍量）
+        w.add(p * 1.020, p * 1.012, 1200)     # 缩量阴
+        w.add(p * 1.012, p * 1.030, 5000)     # 确认阳
+        w.bars = w.bars[-n:]
+    return BarSeries.from_columns(bar_times(period, len(w.bars)), w.bars)
+
+
+def generate_synthetic(periods: List[str]):
+    """生成合成夹具写入 synthetic/<周期>.json。根数为该周期扫描时实际请求的根数（required_bars），
+    至少 260 根（覆盖筑底的250根回看）"""
+    os.makedirs(SYNTH_DIR, exist_ok=True)
+    for period in periods:
+        n = max(screener.StrictStockScreener(period=period).datalen, 260)
+        stocks = {f"syn{i:03d}" + ("p" if i % 2 == 0 else ""): synth_bars(period, n, i, plant=i % 2 == 0).columns()
+                  for i in range(SYNTH_STOCKS)}
+        path = os.path.join(SYNTH_DIR, f"{period}.json")
+        _write_fixtures(path, period, stocks)
+        print(f"  {PERIOD_NAMES[period]}: 合成 {len(stocks)} 只 × {n} 根 → {path}")
+
+
+# ==================== 夹具文件 ====================
+def _write_fixtures(path: str, period: str, stocks: Dict[str, Dict]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'period': period, 'recorded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                   'stocks': stocks}, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def _load_fixtures(path: str) -> Dict[str, BarSeries]:
+    """夹具文件 → {代码: K线}，文件不存在返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        stocks = json.load(f)['stocks']
+    return {code: BarSeries(cols['day'], cols['open'], cols['high'], cols['low'], cols['close'], cols['volume'])
+            for code, cols in stocks.items()}
+
+
+def synthetic_fixtures(period: str) -> Dict[str, BarSeries]:
+    """某周期的合成夹具 {代码: K线}（偶数序号、代码以 p 结尾的植入了形态），未生成返回空字典"""
+    return _load_fixtures(os.path.join(SYNTH_DIR, f"{period}.json"))
+
+
+def recorded_fixtures(period: str) -> Dict[str, BarSeries]:
+    """已录制的真实K线 {代码: K线}，未录制返回空字典"""
+    return _load_fixtures(os.path.join(RECORDED_DIR, f"{period}.json"))
+
+
+def fixture_sets(period: str) -> List[Tuple[str, Dict[str, BarSeries]]]:
+    """某周期已有的各类夹具 [(类别, {代码: K线})]"""
+    sets = [('合成', synthetic_fixtures(period)), ('录制', recorded_fixtures(period))]
+    return [(corpus, fixtures) for corpus, fixtures in sets if fixtures]
+
+
+# ==================== 录制K线 ====================
+
+
+def record(count: int, periods: List[str]):
+    """从数据源录制 stock_list.md 前 count 只股票各周期的整段K线（MAX_DATALEN 根）"""
+    stock_list = screener.StrictStockScreener().load_stock_list()[:count]
+    if not stock_list:
+        print("股票列表为空，无法录制")
+        return
+    os.makedirs(RECORDED_DIR, exist_ok=True)
+    for period in periods:
+        stocks = {}
+        for i, (code, name) in enumerate(stock_list):
+            try:
+                raw = screener.fetch_kline_with_fallback(code, period, i,
+                                                         datalen=screener.StrictStockScreener.MAX_DATALEN)
+            except screener.FetchFailed as e:
+                print(f"  ✘ {period} {code} {name}: {e}")
+                continue
+            if raw:
+                stocks[code] = dict(name=name, **raw.columns())
+        path = os.path.join(RECORDED_DIR, f"{period}.json")
+        _write_fixtures(path, period, stocks)
+        print(f"  {PERIOD_NAMES[period]}: 录制 {len(stocks)}/{len(stock_list)} 只 → {path}")
+
+
+# ==================== 计时与内存分配 ====================
+class _FixtureScreener(screener.StrictStockScreener):
+    """check_one_stock 的K线取自夹具；夹具时间固定，不做过期判定"""
+
+    fixtures: Dict[str, BarSeries] = {}
+
+    def _fetch_raw(self, code: str, source_idx: int = 0) -> BarSeries:
+        return self.fixtures[code]
+
+    @staticmethod
+    def _is_stale_bar(last_bar_time) -> bool:
+        return False
+
+
+def _measure(calls: Dict[str, Callable[[], object]], repeat: int) -> Optional[Dict]:
+    """calls: {夹具代码: 无参调用}。每只先调用一次预热，再计时 repeat 次，最后在 tracemalloc 下单独调用一次；
+    没有可测的夹具（数据不足）返回 None"""
+    if not calls:
+        return None
+    latencies, per_stock = [], []
+    for fn in calls.values():
+        fn()
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        latencies.extend(samples)
+        per_stock.append(sum(samples) / len(samples))
+
+    peaks, blocks = [], []
+    tracemalloc.start()
+    try:
+        for fn in calls.values():
+            before = tracemalloc.take_snapshot()
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            after = tracemalloc.take_snapshot()
+            blocks.append(sum(max(0, s.count_diff) for s in after.compare_to(before, 'lineno')))
+            del result
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'stocks_per_sec': len(per_stock) / sum(per_stock) if sum(per_stock) else 0.0,
+        'alloc_peak_kib': statistics.fmean(peaks) / 1024,
+        'alloc_blocks': statistics.fmean(blocks),
+    }
+
+
+def bench_period(period: str, fixtures: Dict[str, BarSeries], repeat: int) -> Dict[str, Dict]:
+    """某周期一组夹具的各项测量 {操作: 指标}"""
+    s = screener.StrictStockScreener(period=period, period_name=PERIOD_NAMES[period])
+    results = {'_prepare_data': _measure({c: (lambda r=raw: s._prepare_data(r)) for c, raw in fixtures.items()},
+                                         repeat)}
+    prepared = {c: s._prepare_data(raw) for c, raw in fixtures.items()}
+    prepared = {c: d for c, d in prepared.items() if d is not None}
+    results['_check_signal_at'] = _measure(
+        {c: (lambda d=d: s._check_signal_at(d, len(d) - 1)) for c, d in prepared.items()}, repeat)
+
+    if screener.np is not None:
+        results['_prepare_columnar'] = _measure(
+            {c: (lambda r=raw: s._prepare_columnar(r)) for c, raw in fixtures.items()}, repeat)
+        bars = {c: s._prepare_columnar(raw) for c, raw in fixtures.items()}
+        bars = {c: b for c, b in bars.items() if b is not None}
+        results['_check_signal_at[列式]'] = _measure(
+            {c: (lambda b=b: s._check_signal_at(b, len(b) - 1)) for c, b in bars.items()}, repeat)
+
+    # check_one_stock 按监控的配置（列式，缺 numpy 时自动回退字典路径）
+    checker = _FixtureScreener(period=period, period_name=PERIOD_NAMES[period], columnar=True)
+    _FixtureScreener.fixtures = fixtures
+    results['check_one_stock'] = _measure({c: (lambda c=c: checker.check_one_stock(c)) for c in fixtures},
+                                          repeat)
+    return {op: m for op, m in results.items() if m}
+
+
+def _pad(text: str, width: int, right: bool = False) -> str:
+    """按终端显示宽度补空格（中文占两列）"""
+    fill = ' ' * max(0, width - sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text))
+    return fill + text if right else text + fill
+
+
+def print_results(period: str, corpus: str, n_fixtures: int, results: Dict[str, Dict],
+                  baseline: Optional[Dict] = None):
+    print(f"\n  {PERIOD_NAMES[period]}（{period}）{corpus} {n_fixtures} 只")
+    header = ('均值ms', 'P50ms', 'P95ms', '只/秒', '峰值KiB', '存活块')
+    print("    " + _pad('操作', 28) + ''.join(_pad(h, 10, right=True) for h in header))
+    for op, m in results.items():
+        line = (f"    {_pad(op, 28)}{m['mean_ms']:>10.3f}{m['p50_ms']:>10.3f}{m['p95_ms']:>10.3f}"
+                f"{m['stocks_per_sec']:>10.0f}{m['alloc_peak_kib']:>10.1f}{m['alloc_blocks']:>10.0f}")
+        base = (baseline or {}).get(op)
+        if base and base['mean_ms']:
+            line += f"  {(m['mean_ms'] / base['mean_ms'] - 1) * 100:+.1f}%"
+        print(line)
+
+
+# ==================== 金标准 ====================
+# 每个出信号（通过确认阳）的K线一行；其余K线没有行
+GOLDEN_FIELDS = ('bar', 'normal', 'strict', 'bottom', 'breakout', 'signal_type',
+                 'gold_cross_idx', 'first_double_idx', 'gap_days')
+
+
+def signal_rows(series: Dict[str, List]) -> List[List]:
+    """signal_series → 金标准信号行（字段见 GOLDEN_FIELDS）"""
+    return [[i, bool(series['normal'][i]), bool(series['strict'][i]), bool(series['bottom'][i]),
+             bool(series['breakout'][i]), series['signal_type'][i], int(series['gold_cross_idx'][i]),
+             int(series['first_double_idx'][i]), int(series['gap_days'][i])]
+            for i, details in enumerate(series['details']) if details is not None]
+
+
+def golden_rows(period: str, fixtures: Dict[str, BarSeries], columnar: bool) -> Dict[str, Optional[Dict]]:
+    """当前逻辑整段 signal_series 的信号行 {代码: {'bars': 根数, 'rows': [...]}}，数据不足为 None"""
+    s = screener.StrictStockScreener(period=period, period_name=PERIOD_NAMES[period], columnar=columnar)
+    out = {}
+    for code, raw in fixtures.items():
+        data = s._prepare_columnar(raw) if s.columnar else s._prepare_data(raw)
+        out[code] = {'bars': len(data), 'rows': signal_rows(s.signal_series(data))} if data is not None else None
+    return out
+
+
+def load_reference(rev: str):
+    """从 git 取出参考版本的 严格选股_多周期.py 并加载（该版本逐K线独立判定，只依赖标准库）"""
+    rel = os.path.relpath(os.path.join(_BASE_DIR, '严格选股_多周期.py'),
+                          subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=_BASE_DIR,
+                                                  text=True).strip())
+    source = subprocess.check_output(['git', 'show', f"{rev}:{rel.replace(os.sep, '/')}"], cwd=_BASE_DIR)
+    with tempfile.NamedTemporaryFile('wb', suffix='.py', delete=False) as f:
+        f.write(source)
+    try:
+        spec = importlib.util.spec_from_file_location("_golden_reference", f.name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.unlink(f.name)
+    return module
+
+
+def reference_rows(reference, period: str, fixtures: Dict[str, BarSeries]) -> Dict[str, Optional[Dict]]:
+    """参考版本逐根K线调用 _check_signal_at 得到的信号行（格式同 golden_rows）"""
+    s = reference.StrictStockScreener(period=period, period_name=PERIOD_NAMES[period])
+    out = {}
+    for code, raw in fixtures.items():
+        data = s._prepare_data(raw.to_dicts())
+        if data is None:
+            out[code] = None
+            continue
+        index = {bar['date']: i for i, bar in enumerate(data)}
+        rows = []
+        for i in range(len(data)):
+            try:
+                normal, strict, details = s._check_signal_at(data, i)
+            except Exception:
+                continue
+            if details:
+                rows.append([i, bool(normal), bool(strict), bool(details['bottom_buy']),
+                             bool(details['breakout_buy']), details['signal_type'],
+                             index[details['gold_cross_date']], index[details['first_double_date']],
+                             int(details['gap_days'])])
+        out[code] = {'bars': len(data), 'rows': rows}
+    return out
+
+
+def load_golden() -> Dict:
+    if not os.path.exists(GOLDEN_FILE):
+        return {'reference': None, 'fields': list(GOLDEN_FIELDS), 'fixtures': {}}
+    with open(GOLDEN_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_golden(golden: Dict):
+    """每只夹具一行，便于审阅 diff"""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    lines = ['{', f' "reference": {json.dumps(golden["reference"])},',
+             f' "fields": {json.dumps(list(GOLDEN_FIELDS))},', ' "fixtures": {']
+    groups = sorted(golden['fixtures'].items())
+    for g, (key, stocks) in enumerate(groups):
+        lines.append(f'  {json.dumps(key, ensure_ascii=False)}: {{')
+        items = sorted(stocks.items())
+        for k, (code, entry) in enumerate(items):
+            lines.append(f'   {json.dumps(code)}: {json.dumps(entry, ensure_ascii=False)}'
+                         + (',' if k < len(items) - 1 else ''))
+        lines.append('  }' + (',' if g < len(groups) - 1 else ''))
+    lines += [' }', '}']
+    with open(GOLDEN_FILE, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def check_golden(periods: List[str], update: bool = False, reference: Optional[str] = None) -> bool:
+    """
+    各夹具整段 signal_series 的信号行与金标准比对（字典、列式两条路径）。
+    update=True 时先用参考版本（reference，缺省沿用 golden.json 记录的提交）重新生成这些周期的金标准
+    """
+    golden = load_golden()
+    if update:
+        rev = reference or golden.get('reference')
+        if not rev:
+            print("  未指定参考版本：--golden-update --reference <优化前的提交>")
+            return False
+        ref_module = load_reference(rev)
+        golden['reference'] = rev
+    engines = [('字典', False)] + ([('列式', True)] if screener.np is not None else [])
+    ok = True
+    print(f"\n  金标准校验（{GOLDEN_FILE}，参考版本 {golden.get('reference')}）")
+    for period in periods:
+        for corpus, fixtures in fixture_sets(period):
+            key = f"{period}/{corpus}"
+            if update:
+                golden['fixtures'][key] = reference_rows(ref_module, period, fixtures)
+            expected = golden['fixtures'].get(key)
+            if expected is None:
+                print(f"    {key}: 无金标准，跳过（--golden-update 生成）")
+                continue
+            for engine_name, columnar in engines:
+                got = golden_rows(period, fixtures, columnar)
+                bad = sorted(code for code in set(got) | set(expected) if got.get(code) != expected.get(code))
+                ok = ok and not bad
+                signals = sum(len(entry['rows']) for entry in got.values() if entry)
+                print(f"    {key} [{engine_name}]: {len(got)} 只, 信号K线 {signals} 根, 不一致 {len(bad)} 只"
+                      + (f" {bad[:5]}" if bad else ""))
+            if corpus == '合成':
+                planted = [code for code in expected if code.endswith('p')]
+                fired = sum(1 for code in planted if expected[code] and expected[code]['rows']
+                            and expected[code]['rows'][-1][0] == expected[code]['bars'] - 1
+                            and (expected[code]['rows'][-1][1] or expected[code]['rows'][-1][2]))
+                print(f"    {key}: 植入形态末根出信号 {fired}/{len(planted)}")
+    if update:
+        _write_golden(golden)
+        print(f"  金标准已更新: {GOLDEN_FILE}")
+    return ok
+
+
+# ==================== 主程序 ====================
+def main():
+    parser = argparse.ArgumentParser(description="选股器微基准（分周期耗时/吞吐/内存分配 + 金标准校验）")
+    parser.add_argument("--periods", nargs='+', choices=PERIODS, default=PERIODS, help="要测的周期（默认全部8个）")
+    parser.add_argument("--repeat", type=int, default=20, help="每只夹具每项操作的计时次数")
+    parser.add_argument("--save", nargs='?', const=BASELINE_FILE, help="结果写入基线文件")
+    parser.add_argument("--compare", nargs='?', const=BASELINE_FILE, help="与基线文件对比")
+    parser.add_argument("--golden", action="store_true", help="只做金标准校验")
+    parser.add_argument("--golden-update", action="store_true", help="用参考版本重新生成金标准")
+    parser.add_argument("--reference", help="生成金标准的参考版本（git 提交，缺省沿用 golden.json 中记录的）")
+    parser.add_argument("--record", type=int, metavar="N", help="录制 stock_list.md 前N只股票的真实K线")
+    parser.add_argument("--synth-update", action="store_true", help="重新生成合成K线夹具")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.periods)
+        return
+    if args.synth_update:
+        generate_synthetic(args.periods)
+        return
+    if args.golden or args.golden_update:
+        ok = check_golden(args.periods, update=args.golden_update, reference=args.reference)
+        sys.exit(0 if ok else 1)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    screener._result_memo = screener.ResultMemo(max_entries=0)  # 测冷判定
+
+    print(f"{'=' * 80}")
+    print(f"  选股器微基准  Python {platform.python_version()}  "
+          f"numpy {getattr(screener.np, '__version__', '未安装')}  每只重复 {args.repeat} 次")
+    print(f"{'=' * 80}")
+    results = {}
+    for period in args.periods:
+        for corpus, fixtures in fixture_sets(period):
+            key = f"{period}/{corpus}"
+            results[key] = bench_period(period, fixtures, args.repeat)
+            print_results(period, corpus, len(fixtures), results[key], baseline.get(key))
+
+    ok = check_golden(args.periods)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': getattr(screener.np, '__version__', None),
+                'machine': f"{platform.system()} {platform.machine()}",
+                'repeat': args.repeat,
+                'results': results,
+            }, f, ensure_ascii=False, indent=1)
+        print(f"\n  基线已保存: {args.save}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,7 @@ import sys
 import time
 import logging
 import concurrent.futures
-from typing import Dict, List, Tuple, Optional, TypedDict
+from typing import Dict, List, Tuple, Optional, TypedDict, Union
 from datetime import datetime
 
 if sys.platform == 'win32':
@@ -26,8 +26,12 @@ if sys.platform == 'win32':
         pass
 
 import data_source
+from bar_series import BarSeries, as_series
 from data_source import KLineBar, QuoteInfo, CapitalFlow
 
+# K线入参：data_source.fetch_kline 返回的 BarSeries，或迁移期的旧字典列表（内部经 as_series 转换）
+KLines = Union[BarSeries, List[KLineBar]]
+
 logger = logging.getLogger(__name__)
 
 
@@ -199,15 +203,15 @@ def _standard_ema(data: List[float], period: int) -> List[float]:
 
 # ==================== 1. 技术目标价计算 ====================
 
-def _calc_atr(klines: List[KLineBar], period: int = 14) -> float:
+def _calc_atr(klines: KLines, period: int = 14) -> float:
     if len(klines) < period + 1:
         return 0.0
     trs: List[float] = []
-    bars = klines[-(period + 1):]
+    bars = as_series(klines)[-(period + 1):]
     for i in range(1, len(bars)):
-        high = float(bars[i]['high'])
-        low  = float(bars[i]['low'])
-        prev_close = float(bars[i - 1]['close'])
+        high = bars.high[i]
+        low  = bars.low[i]
+        prev_close = bars.close[i - 1]
         tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
         trs.append(tr)
     return sum(trs) / len(trs) if trs else 0.0
@@ -218,12 +222,11 @@ def _ma(closes: List[float], n: int) -> Optional[float]:
     return sum(closes[-n:]) / n if len(closes) >= n else None
 
 
-def _resistance_target(klines: List[KLineBar], current: float, lookback: int = 60) -> float:
+def _resistance_target(klines: KLines, current: float, lookback: int = 60) -> float:
     """压力位法：近 lookback 根 K 线中高于当前价的最低高点"""
     if not klines:
         return current * 1.10
-    recent = klines[-lookback:] if len(klines) >= lookback else klines
-    highs = [float(k['high']) for k in recent]
+    highs = as_series(klines).high[-lookback:]
     resistances = [h for h in highs if h > current * 1.01]
     return min(resistances) if resistances else max(highs)
 
@@ -233,17 +236,16 @@ def _atr_channel_target(current: float, atr: float, multiplier: float = 3.0) ->
     return current + atr * multiplier if atr > 0 else current * 1.12
 
 
-def _fib_extension_target(klines: List[KLineBar], current: float, lookback: int = 60) -> float:
+def _fib_extension_target(klines: KLines, current: float, lookback: int = 60) -> float:
     """斐波那契扩展法：波段低点起 1.618 扩展"""
     if len(klines) < 10:
         return current * 1.10
-    recent = klines[-lookback:] if len(klines) >= lookback else klines
-    swing_low = min(float(k['low']) for k in recent)
+    swing_low = min(as_series(klines).low[-lookback:])
     wave = current - swing_low
     return swing_low + wave * 1.618 if wave > 0 else current * 1.10
 
 
-def calc_target_price(klines: List[KLineBar], current_price: float) -> TechnicalTarget:
+def calc_target_price(klines: KLines, current_price: float) -> TechnicalTarget:
     """
     改进版本：
     - 三法取中位数计算目标价
@@ -263,6 +265,7 @@ def calc_target_price(klines: List[KLineBar], current_price: float) -> Technical
             'ma20': 0.0,
         }
 
+    klines = as_series(klines)
     atr = _calc_atr(klines)
     t_r = _resistance_target(klines, current_price)
     t_a = _atr_channel_target(current_price, atr)
@@ -275,14 +278,13 @@ def calc_target_price(klines: List[KLineBar], current_price: float) -> Technical
 
     # ========== 改进：科学的止损价设置 ==========
     # 方法1：MA20 作为支撑基础
-    closes = [float(k['close']) for k in klines]
+    closes = klines.close.tolist()
     ma20 = _ma(closes, 20)
     if ma20 is None:
         ma20 = current_price * 0.95
 
     # 方法2：近 5 日最低点
-    recent5 = klines[-5:] if len(klines) >= 5 else klines
-    swing_low_5d = min(float(k['low']) for k in recent5)
+    swing_low_5d = min(klines.low[-5:])
 
     # 方法3：MA20 下方 0.5 倍 ATR（考虑正常波动）
     stop_by_atr = max(ma20 * 0.98, ma20 - atr * 0.5) if atr > 0 else ma20
@@ -314,7 +316,7 @@ def calc_target_price(klines: List[KLineBar], current_price: float) -> Technical
 
 # ==================== 2. 趋势强度评分 ====================
 
-def calc_trend_strength(klines: List[KLineBar]) -> TrendStrength:
+def calc_trend_strength(klines: KLines) -> TrendStrength:
     """
     改进版本：
     - 均线权重降低到 30%（而非 40%）
@@ -331,8 +333,9 @@ def calc_trend_strength(klines: List[KLineBar]) -> TrendStrength:
             'detail': {'ma_align': 50.0, 'vol_price': 50.0, 'macd': 50.0},
         }
 
-    closes  = [float(k['close']) for k in klines]
-    volumes = [float(k['volume']) for k in klines]
+    klines = as_series(klines)
+    closes  = klines.close.tolist()
+    volumes = klines.volume.tolist()
 
     # ---- 均线排列（权重 30%） ----
     ma5  = _ma(closes, 5)
@@ -355,11 +358,11 @@ def calc_trend_strength(klines: List[KLineBar]) -> TrendStrength:
         ma_score = min(ma_score + 10, 100.0)
 
     # ---- 量价配合（权重 40%） ----
-    recent10 = klines[-10:] if len(klines) >= 10 else klines
-    up_bars   = [k for k in recent10 if float(k['close']) > float(k['open'])]
-    down_bars = [k for k in recent10 if float(k['close']) < float(k['open'])]
-    avg_up_v  = sum(float(k['volume']) for k in up_bars) / len(up_bars) if up_bars else 0
-    avg_dn_v  = sum(float(k['volume']) for k in down_bars) / len(down_bars) if down_bars else 1
+    recent10 = list(zip(klines.open[-10:], klines.close[-10:], klines.volume[-10:]))
+    up_bars   = [v for o, c, v in recent10 if c > o]
+    down_bars = [v for o, c, v in recent10 if c < o]
+    avg_up_v  = sum(up_bars) / len(up_bars) if up_bars else 0
+    avg_dn_v  = sum(down_bars) / len(down_bars) if down_bars else 1
     vp_ratio  = avg_up_v / avg_dn_v if avg_dn_v > 0 else 1.0
 
     avg_vol_5  = sum(volumes[-5:]) / 5   if len(volumes) >= 5  else volumes[-1]
@@ -474,7 +477,7 @@ def _get_benchmark(code: str) -> Tuple[str, str]:
     return _DEFAULT_BENCHMARK
 
 
-def _score_relative_strength(klines: List[KLineBar],
+def _score_relative_strength(klines: KLines,
                               benchmark_code: str) -> Tuple[float, float]:
     """
     改进版本：
@@ -490,7 +493,7 @@ def _score_relative_strength(klines: List[KLineBar],
     except Exception:
         return 50.0, 0.0
 
-    stock_closes = [float(k['close']) for k in klines]
+    stock_closes = as_series(klines).close
     stock_chg10 = (stock_closes[-1] - stock_closes[-11]) / stock_closes[-11] * 100
 
     idx_closes = [k['close'] for k in idx_klines]
@@ -510,7 +513,7 @@ def _score_relative_strength(klines: List[KLineBar],
     return round(score, 1), rs
 
 
-def _score_vol_ratio(klines: List[KLineBar], today_volume: float) -> Tuple[float, float]:
+def _score_vol_ratio(klines: KLines, today_volume: float) -> Tuple[float, float]:
     """
     改进版本：
     - 量比评分平滑化
@@ -519,12 +522,13 @@ def _score_vol_ratio(klines: List[KLineBar], today_volume: float) -> Tuple[float
     if not klines or len(klines) < 5:
         return 50.0, 1.0
 
-    hist = klines[-20:] if len(klines) >= 20 else klines
-    avg_vol = sum(float(k['volume']) for k in hist) / len(hist)
+    volumes = as_series(klines).volume
+    hist = volumes[-20:]
+    avg_vol = sum(hist) / len(hist)
     if avg_vol <= 0:
         return 50.0, 1.0
 
-    vol = today_volume if today_volume > 0 else float(klines[-1]['volume'])
+    vol = today_volume if today_volume > 0 else volumes[-1]
     vr = round(vol / avg_vol, 2)
 
     # 改进：评分平滑化（避免剧烈跳跃）
@@ -542,7 +546,7 @@ def _score_vol_ratio(klines: List[KLineBar], today_volume: float) -> Tuple[float
     return round(score, 1), vr
 
 
-def calc_market_position(code: str, klines: List[KLineBar],
+def calc_market_position(code: str, klines: KLines,
                           today_volume: float) -> MarketPosition:
     """市场位置综合评分：相对强度(50%) + 量比(50%)"""
     benchmark_code, benchmark_name = _get_benchmark(code)
@@ -566,7 +570,7 @@ def calc_market_position(code: str, klines: List[KLineBar],
 
 # ==================== 4. 到达概率评分（新增维度） ====================
 
-def _calc_reach_probability(klines: List[KLineBar], target: float,
+def _calc_reach_probability(klines: KLines, target: float,
                              current: float, stop_loss: float) -> Tuple[float, float]:
     """
     估算目标价的到达概率。
@@ -578,12 +582,12 @@ def _calc_reach_probability(klines: List[KLineBar], target: float,
     if not klines or len(klines) < 20 or target <= current:
         return 60.0, 1.0
 
-    closes = [float(k['close']) for k in klines]
-    highs = [float(k['high']) for k in klines]
+    klines = as_series(klines)
+    closes = klines.close.tolist()
+    highs = klines.high.tolist()
 
     # 因子1：历史突破率（近 60 日）
-    recent60 = klines[-60:] if len(klines) >= 60 else klines
-    swing_high = max(float(k['high']) for k in recent60)
+    swing_high = max(highs[-60:])
 
     # 目标价距离当前价的相对高度
     target_height = (target - current) / current * 100
@@ -617,7 +621,7 @@ def _calc_reach_probability(klines: List[KLineBar], target: float,
     return reach_prob, rr
 
 
-def calc_reach_probability_score(klines: List[KLineBar], technical: TechnicalTarget) -> float:
+def calc_reach_probability_score(klines: KLines, technical: TechnicalTarget) -> float:
     """将到达概率转为 0-100 的评分"""
     reach_prob, _ = _calc_reach_probability(
         klines,
@@ -632,7 +636,7 @@ def calc_reach_probability_score(klines: List[KLineBar], technical: TechnicalTar
 # ==================== 5. 成功率评分（优中选优）- 改进版 ====================
 
 def calc_success_rate(
-    klines: List[KLineBar],
+    klines: KLines,
     technical: TechnicalTarget,
     trend: TrendStrength,
     market_pos: MarketPosition,
@@ -655,8 +659,9 @@ def calc_success_rate(
 
     等级：S≥80 / A≥65 / B≥50 / C≥35 / D<35
     """
-    closes  = [float(k['close']) for k in klines] if klines else []
-    volumes = [float(k['volume']) for k in klines] if klines else []
+    klines = as_series(klines)
+    closes  = klines.close.tolist()
+    volumes = klines.volume.tolist()
 
     # ── 维度1：突破质量 ──────────────────────────────────────────
     bk_score = 40.0
@@ -792,7 +797,7 @@ def _capital_confirmed(capital: CapitalFlow) -> bool:
 
 # ==================== 7. 数据时间戳验证 ====================
 
-def _verify_data_sync(quote: QuoteInfo, klines: List[KLineBar], capital: CapitalFlow) -> bool:
+def _verify_data_sync(quote: QuoteInfo, klines: KLines, capital: CapitalFlow) -> bool:
     """验证数据时间戳一致性，确保来自同一交易日"""
     try:
         # 提取时间戳（如果有的话）
@@ -835,17 +840,17 @@ def analyze_stock(code: str, name: str = '', signal_type: str = '') -> AnalysisR
     current_price = quote.get('price', 0.0)
     if current_price <= 0 and klines:
         last_bar = klines[-1]
-        current_price = float(last_bar['close'])
+        current_price = last_bar['close']
         quote['price'] = current_price
         quote['source'] = quote.get('source') or 'kline_fallback'
         if quote.get('open', 0) <= 0:
-            quote['open'] = float(last_bar['open'])
+            quote['open'] = last_bar['open']
         if quote.get('high', 0) <= 0:
-            quote['high'] = float(last_bar['high'])
+            quote['high'] = last_bar['high']
         if quote.get('low', 0) <= 0:
-            quote['low'] = float(last_bar['low'])
+            quote['low'] = last_bar['low']
         if quote.get('volume', 0) <= 0:
-            quote['volume'] = int(float(last_bar['volume']))
+            quote['volume'] = int(last_bar['volume'])
         logger.warning(f"{code} 实时价格为0，使用K线收盘价兜底: {current_price}")
 
     # 所有数据源都失败，价格仍为0，标记失败
@@ -1,10 +1,11 @@
 """
 股票信号监控 - GitHub Actions 版
-单线程循环：三个周期顺序扫描 → 等5分钟 → 再扫 → 收盘自动退出
+按K线收盘调度：5分钟/30分钟在各自K线收盘后扫描已收盘的K线，日线在固定检查点扫描 → 收盘自动退出
 
 用法:
-    python monitor.py              # 正常运行（等待交易时间）
-    python monitor.py --now        # 立即扫描一次（不等交易时间，用于测试）
+    python monitor.py                      # 正常运行（等待交易时间，按K线收盘调度）
+    python monitor.py --now                # 立即扫描一次（不等交易时间，用于测试）
+    python monitor.py --rescan-unfinished  # 旧模式：所有周期每5分钟扫一遍（含未收盘的K线）
 
 环境变量:
     DINGTALK_WEBHOOK  - 钉钉机器人Webhook URL
@@ -18,9 +19,11 @@ import json
 import signal
 import logging
 import argparse
+import threading
 import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 # ==================== 优雅退出 ====================
 _shutdown = False
@@ -168,23 +171,37 @@ logger = logging.getLogger(__name__)
 # 环境自适应：CI/GitHub Actions 跨境延迟高，需更多线程填充I/O等待
 _is_ci = os.environ.get('GITHUB_ACTIONS') == 'true' or os.environ.get('CI') == 'true'
 
-# 扫描周期（顺序执行）
+# 扫描周期：按数据源族分成并行的扫描线（分钟线/日线同时扫，见 _period_lanes），同一条线内按列表顺序执行
+# derive=True：不单独请求本周期K线，由刚扫描过的来源周期缓存本地合成（如 15分钟←5分钟），来源周期须排在前面。
+#   数据源上限（1500根）内的来源K线合成不出所需根数的周期（30分钟需约 2160 根 5分钟K线）不能合成，见 bar_resample.can_derive
+# snapshot=True：日线历史取缓存，当天这根由全市场批量行情快照合成（首轮整段拉取，之后每轮只需十几次请求）
+# budget：同一条扫描线内分配轮次时间预算的权重（见 run_full_round），缺省为 1
 if _is_ci:
     PERIODS = [
-        {"name": "5分钟", "code": "5min", "max_workers": 10},
+        {"name": "5分钟", "code": "5min", "max_workers": 10, "budget": 3},
         {"name": "30分钟", "code": "30min", "max_workers": 10},
-        {"name": "日线", "code": "240min", "max_workers": 14},
+        {"name": "日线", "code": "240min", "max_workers": 14, "snapshot": True},
     ]
 else:
     PERIODS = [
-        {"name": "5分钟", "code": "5min", "max_workers": 4},
+        {"name": "5分钟", "code": "5min", "max_workers": 4, "budget": 3},
         {"name": "30分钟", "code": "30min", "max_workers": 4},
-        {"name": "日线", "code": "240min", "max_workers": 6},
+        {"name": "日线", "code": "240min", "max_workers": 6, "snapshot": True},
     ]
 
-# 每轮扫描完成后等待时间（秒）
+# 每轮扫描完成后等待时间（秒）：仅 --rescan-unfinished 模式使用（固定间隔反复扫描未收盘的K线）
 SCAN_INTERVAL = 300  # 5分钟
 
+# 每轮时间预算（秒，0 不限）：到点后各周期尚未开始请求的股票顺延到下一轮（下一轮同形态阶段内优先），
+# 限流严重时一轮不会拖过下一根K线收盘。按K线收盘调度时还不超过距下一次扫描时刻的时间
+ROUND_BUDGET = int(os.environ.get('ROUND_BUDGET', '270'))
+
+# 默认按K线收盘调度：分钟周期在每根K线收盘后 SCAN_DELAY 秒扫描（给数据源生成K线留时间），
+# 日线在 DAILY_CHECKPOINTS 各时刻扫描当天未走完的日K（环境变量 DAILY_CHECKPOINTS=10:30,14:50 可覆盖）
+SCAN_DELAY = 20
+DAILY_CHECKPOINTS = [t.strip() for t in
+                     os.environ.get('DAILY_CHECKPOINTS', '10:00,11:20,13:30,14:30,14:50').split(',') if t.strip()]
+
 # 交易时间
 TRADING_START_MORNING = "09:40"
 TRADING_END_MORNING = "11:35"
@@ -194,9 +211,15 @@ TRADING_END_AFTERNOON = "15:05"
 # 去重窗口（小时）
 DEDUP_HOURS = 2
 
+# 同一信号（代码/类型/K线日期）在该时长内再次扫出时复用上次的个股分析，不重复请求（秒）
+ANALYSIS_REUSE_SECONDS = 1800
+
 # 信号结果文件（会被 Actions commit 到仓库）
 SIGNALS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'signals')
 
+# 信号文件/ML数据集的读改写锁（各扫描线的 on_signal 可能同时触发）
+_signal_io_lock = threading.Lock()
+
 
 # ==================== 交易日历 ====================
 _HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'holidays.json')
@@ -221,13 +244,14 @@ def _load_holidays() -> set:
     return _holidays_cache
 
 
+def _is_trading_date(d) -> bool:
+    """某日是否为A股交易日（排除周末 + 法定假日）"""
+    return d.weekday() < 5 and d.strftime('%Y-%m-%d') not in _load_holidays()
+
+
 def is_trading_day() -> bool:
     """判断今天是否为A股交易日（排除周末 + 法定假日）"""
-    now = get_beijing_now()
-    if now.weekday() >= 5:
-        return False
-    today_str = now.strftime('%Y-%m-%d')
-    return today_str not in _load_holidays()
+    return _is_trading_date(get_beijing_now())
 
 
 # ==================== 交易时间判断 ====================
@@ -288,12 +312,41 @@ def seconds_to_next_session() -> int:
     return 0
 
 
+# ==================== 按K线收盘调度 ====================
+def _trigger_times(period_code: str, day) -> List[datetime]:
+    """
+    某交易日内该周期的扫描时刻：分钟周期为各根K线收盘时刻，日线及以上为 DAILY_CHECKPOINTS，统一延后 SCAN_DELAY 秒
+    （检查点与分钟K线收盘重合时同一轮并行扫描，日线不会挡住分钟周期）
+    """
+    if period_code in screener.bar_resample.PERIOD_MINUTES:
+        times = screener.bar_resample.session_closes(period_code, day)
+    else:
+        times = []
+        for checkpoint in DAILY_CHECKPOINTS:
+            h, m = map(int, checkpoint.split(':'))
+            times.append(datetime(day.year, day.month, day.day, h, m))
+    return sorted(t + timedelta(seconds=SCAN_DELAY) for t in times)
+
+
+def next_trigger(period_code: str, after: datetime) -> datetime:
+    """after 之后该周期的下一个扫描时刻（跳过周末和 holidays.json 中的休市日）"""
+    day = after.date()
+    for _ in range(30):
+        if _is_trading_date(day):
+            for t in _trigger_times(period_code, day):
+                if t > after:
+                    return t
+        day += timedelta(days=1)
+    raise RuntimeError(f"30天内找不到 {period_code} 的扫描时刻，请检查 holidays.json")
+
+
 # ==================== 信号去重 ====================
 class SignalDedup:
     """信号去重：同一信号在窗口期内不重复推送"""
 
     def __init__(self):
         self._sent = {}
+        self._lock = threading.Lock()  # 扫描线与触发监视线程同时读写
         self._file = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'sent_signals.json'
         )
@@ -319,15 +372,17 @@ class SignalDedup:
 
     def is_new(self, period: str, code: str, signal_date: str, signal_type: str) -> bool:
         key = f"{period}|{code}|{signal_date}|{signal_type}"
-        ts = self._sent.get(key)
+        with self._lock:
+            ts = self._sent.get(key)
         if ts and time.time() - ts < DEDUP_HOURS * 3600:
             return False
         return True
 
     def mark_sent(self, period: str, code: str, signal_date: str, signal_type: str):
         key = f"{period}|{code}|{signal_date}|{signal_type}"
-        self._sent[key] = time.time()
-        self._save()
+        with self._lock:
+            self._sent[key] = time.time()
+            self._save()
 
 
 # ==================== 信号结果保存 ====================
@@ -434,6 +489,32 @@ def _run_stock_analysis(code: str, name: str, signal_type: str) -> dict:
         return {}
 
 
+# 已完成的个股分析 {(代码, 信号类型, 信号日期): (完成时刻, 分析结果)}
+_analysis_memo = {}
+_analysis_memo_lock = threading.Lock()
+
+
+def _cached_stock_analysis(code: str, name: str, signal_type: str, signal_date: str) -> dict:
+    """
+    同一信号在 ANALYSIS_REUSE_SECONDS 内再次扫出（日线各检查点之间K线没变、跨轮重复推送）时复用上次的分析；
+    分析失败（空结果）不缓存，下次重试
+    """
+    key = (code, signal_type, signal_date)
+    now = time.time()
+    with _analysis_memo_lock:
+        for k in [k for k, (t, _) in _analysis_memo.items() if now - t > ANALYSIS_REUSE_SECONDS]:
+            del _analysis_memo[k]
+        entry = _analysis_memo.get(key)
+    if entry is not None:
+        logger.info(f"复用个股分析: {code} {name}")
+        return entry[1]
+    analysis = _run_stock_analysis(code, name, signal_type)
+    if analysis:
+        with _analysis_memo_lock:
+            _analysis_memo[key] = (now, analysis)
+    return analysis
+
+
 def _format_analysis_for_dingtalk(analysis: dict, details: dict = None) -> str:
     """将个股分析结果格式化为钉钉Markdown片段（结构化分行版）"""
     if not analysis:
@@ -549,25 +630,141 @@ def _format_single_signal(period_name: str, code: str, name: str,
 
 
 # ==================== 单周期扫描（边扫边推） ====================
-def run_scan(period_cfg: dict, stock_list: list, webhook: str, secret: str, dedup: SignalDedup, round_num: int = 0):
-    """执行一个周期的选股扫描，扫到信号立即推送，并返回本轮推送的信号列表"""
+def _base_datalen_for(period_code: str):
+    """
+    来源周期需请求的K线根数：有合成周期依赖它时（如 15分钟←5分钟），按合成所需根数请求，
+    来源周期扫描拉到的K线即可直接供合成周期复用；无依赖返回 None（按本周期默认根数）
+    """
+    derived = [screener.StrictStockScreener(period=cfg['code'], derive=True)
+               for cfg in PERIODS if cfg.get('derive')]
+    need = [s.base_datalen() for s in derived if s.derive and s.fetch_period == period_code]
+    if not need:
+        return None
+    own = screener.StrictStockScreener(period=period_code).datalen
+    return max([own] + need)
+
+
+def _process_signal(period_name: str, code: str, name: str, signal_type: str, details: dict,
+                    webhook: str, secret: str, round_num: int = 0) -> Tuple[dict, bool]:
+    """一条信号：保存 + 个股分析 + ML记录 + 非普通信号立即单推，返回 (汇总条目, 是否已单推)"""
+    signal_date = details.get('date', '')
+    is_normal = signal_type in ('普通', 'normal')
+
+    # 保存到文件（save_signals_to_file 内部去重；多条扫描线共用当天文件，读改写加锁）
+    with _signal_io_lock:
+        if is_normal:
+            save_signals_to_file(period_name, [(code, name, details)], [])
+        else:
+            save_signals_to_file(period_name, [], [(code, name, details)])
+
+    # 所有信号都跑分析（普通信号也跑，汇总时用；同一信号短时间内重复扫出时复用上次结果）
+    analysis = _cached_stock_analysis(code, name, signal_type, signal_date)
+    verdict  = analysis.get('verdict', '')   # 达标 / 空间不足 / 趋势偏弱
+    sr       = analysis.get('success_rate', {})
+    grade    = sr.get('grade', '?')          # S/A/B/C/D
+    sr_score = sr.get('score', 0.0)
+
+    # 市场环境埋点（不影响主流程：任何异常都被吞掉，details 保持原状）
+    # - import 失败 / 网络失败 / 解析失败 / update 失败 全部隔离
+    # - 失败后 details 仍是 screener 原始返回值，ML 记录正常进行
+    try:
+        from market_env import check_market_environment, env_to_ml_features
+        _mk_env = check_market_environment()  # 槽位缓存,同一轮多次调用零成本
+        _mk_feats = env_to_ml_features(_mk_env)
+        if isinstance(_mk_feats, dict):
+            details.update(_mk_feats)
+    except Exception as _mk_err:
+        logger.debug(f"市场环境埋点失败（不影响信号推送和ML记录）: {_mk_err}")
+
+    # ML自动记录 + 预测（复用已有analysis，不重复请求）
+    with _signal_io_lock:
+        ml_result = _ml_record_signal(code, name, period_name, signal_type, details, analysis)
+    ml_prob = ml_result.get('prob')
+    ml_potential = ml_result.get('potential')
+
+    # 非普通信号：立即单推
+    pushed = False
+    if not is_normal:
+        icon = '🔴' if signal_type == '严格' else '🟢'
+        round_tag = f" | 第{round_num}轮" if round_num else ""
+        title = (
+            f"{icon}{signal_type}买入"
+            f" | {period_name} | {code} {name} | {verdict}{round_tag}"
+        )
+        content = _format_single_signal(
+            period_name, code, name, signal_type, details,
+            verdict=verdict, round_num=round_num
+        )
+        analysis_text = _format_analysis_for_dingtalk(analysis, details=details)
+        if analysis_text:
+            content += "\n\n" + analysis_text
+        if ml_prob is not None or ml_potential is not None:
+            ml_parts = []
+            if ml_prob is not None:
+                ml_parts.append(f"🤖 **ML胜率**{ml_prob}%")
+            if ml_potential is not None:
+                ml_parts.append(f"🌱 **潜力**{ml_potential}%")
+            ml_gain = ml_result.get('gain')
+            if ml_gain is not None:
+                gain_icon = _gain_icon(ml_gain)
+                ml_parts.append(f"{gain_icon} **涨幅**{ml_gain}")
+            rule = _calc_rule_match(period_name, details, analysis)
+            ml_parts.append(f"🎯 **{_format_rule_text(rule)}**")
+            content += "\n\n" + "  ".join(ml_parts)
+        send_dingtalk(webhook, secret, title, content)
+        pushed = True
+
+    # 所有信号都收集用于汇总
+    sig_entry = {
+        'period':      period_name,
+        'code':        code,
+        'name':        name,
+        'signal_type': signal_type,
+        'details':     details,
+        'verdict':     verdict,
+        'analysis':    analysis,
+        'ml_prob':     ml_prob,
+        'ml_potential': ml_potential,
+        'ml_gain':     ml_result.get('gain'),
+    }
+
+    return sig_entry, pushed
+
+
+def run_scan(period_cfg: dict, stock_list: list, webhook: str, secret: str, dedup: SignalDedup,
+             round_num: int = 0, progress_tag: str = '', closed_only: bool = False,
+             deadline: Optional[float] = None):
+    """执行一个周期的选股扫描，扫到信号立即推送，返回 (本轮推送的信号列表, 顺延到下一轮的股票数)
+    closed_only: 只判定已收盘的K线（按K线收盘调度时，数据源返回的下一根未走完的K线丢弃）
+    deadline: 本周期截止时刻（time.time()），到点尚未请求的股票顺延到下一轮"""
     if _shutdown:
-        return []
+        return [], 0
 
     period_name = period_cfg['name']
     period_code = period_cfg['code']
     max_workers = period_cfg['max_workers']
 
-    logger.info(f"[{period_name}] 开始扫描 {len(stock_list)} 只股票...")
-    start = time.time()
-
-    screener.reset_throttle_counts()
-
     s = screener.StrictStockScreener(
         period=period_code,
         period_name=period_name,
-        max_workers=max_workers
+        max_workers=max_workers,
+        columnar=True,  # 监控每轮全市场扫描，走 numpy 列式预计算（缺 numpy 时自动回退）
+        incremental=True,  # 进程常驻多轮扫描：只拉最新几根K线拼到上轮缓存（减少请求量，降低限流）
+        derive=period_cfg.get('derive', False),
+        datalen=_base_datalen_for(period_code),
+        skip_unviable=True,  # 上一轮形态状态表明本轮不可能出信号的股票不请求（见 PatternHints）
+        closed_only=closed_only,
+        snapshot=period_cfg.get('snapshot', False),
+        prefilter=True,  # 每轮先用批量行情剔除停牌/无成交（及 PREFILTER_* 配置的价格、换手下限）的股票
     )
+    derive_note = f"（由{s.fetch_period}合成）" if s.derive else ""
+    logger.info(f"[{period_name}] 开始扫描 {len(stock_list)} 只股票{derive_note}...")
+    start = time.time()
+
+    screener.reset_tail_cache_stats(period_code)
+    # 只统计/清零本周期所用数据源的限流（另一条扫描线可能正在用别的数据源）
+    sources = [src.__name__ for src in screener.sources_for_period(s.fetch_period)]
+    screener.reset_throttle_counts(sources)
 
     # 记录本轮推送的信号
     pushed_count = [0]  # 用list以便在闭包中修改
@@ -575,95 +772,38 @@ def run_scan(period_cfg: dict, stock_list: list, webhook: str, secret: str, dedu
 
     def on_signal(code, name, signal_type, details):
         """回调：扫到信号立即推送+保存（每轮都推，普通信号只汇总不单推）"""
-        signal_date = details.get('date', '')
-        is_normal = signal_type in ('普通', 'normal')
-
-        # 保存到文件（save_signals_to_file 内部去重）
-        if is_normal:
-            save_signals_to_file(period_name, [(code, name, details)], [])
-        else:
-            save_signals_to_file(period_name, [], [(code, name, details)])
-
-        # 所有信号都跑分析（普通信号也跑，汇总时用）
-        analysis = _run_stock_analysis(code, name, signal_type)
-        verdict  = analysis.get('verdict', '')   # 达标 / 空间不足 / 趋势偏弱
-        sr       = analysis.get('success_rate', {})
-        grade    = sr.get('grade', '?')          # S/A/B/C/D
-        sr_score = sr.get('score', 0.0)
-
-        # 市场环境埋点（不影响主流程：任何异常都被吞掉，details 保持原状）
-        # - import 失败 / 网络失败 / 解析失败 / update 失败 全部隔离
-        # - 失败后 details 仍是 screener 原始返回值，ML 记录正常进行
-        try:
-            from market_env import check_market_environment, env_to_ml_features
-            _mk_env = check_market_environment()  # 槽位缓存,同一轮多次调用零成本
-            _mk_feats = env_to_ml_features(_mk_env)
-            if isinstance(_mk_feats, dict):
-                details.update(_mk_feats)
-        except Exception as _mk_err:
-            logger.debug(f"市场环境埋点失败（不影响信号推送和ML记录）: {_mk_err}")
-
-        # ML自动记录 + 预测（复用已有analysis，不重复请求）
-        ml_result = _ml_record_signal(code, name, period_name, signal_type, details, analysis)
-        ml_prob = ml_result.get('prob')
-        ml_potential = ml_result.get('potential')
-
-        # 非普通信号：立即单推
-        if not is_normal:
-            icon = '🔴' if signal_type == '严格' else '🟢'
-            round_tag = f" | 第{round_num}轮" if round_num else ""
-            title = (
-                f"{icon}{signal_type}买入"
-                f" | {period_name} | {code} {name} | {verdict}{round_tag}"
-            )
-            content = _format_single_signal(
-                period_name, code, name, signal_type, details,
-                verdict=verdict, round_num=round_num
-            )
-            analysis_text = _format_analysis_for_dingtalk(analysis, details=details)
-            if analysis_text:
-                content += "\n\n" + analysis_text
-            if ml_prob is not None or ml_potential is not None:
-                ml_parts = []
-                if ml_prob is not None:
-                    ml_parts.append(f"🤖 **ML胜率**{ml_prob}%")
-                if ml_potential is not None:
-                    ml_parts.append(f"🌱 **潜力**{ml_potential}%")
-                ml_gain = ml_result.get('gain')
-                if ml_gain is not None:
-                    gain_icon = _gain_icon(ml_gain)
-                    ml_parts.append(f"{gain_icon} **涨幅**{ml_gain}")
-                rule = _calc_rule_match(period_name, details, analysis)
-                ml_parts.append(f"🎯 **{_format_rule_text(rule)}**")
-                content += "\n\n" + "  ".join(ml_parts)
-            send_dingtalk(webhook, secret, title, content)
+        sig_entry, pushed = _process_signal(period_name, code, name, signal_type, details,
+                                            webhook, secret, round_num=round_num)
+        if pushed:
             pushed_count[0] += 1
-
-        # 所有信号都收集用于汇总
-        sig_entry = {
-            'period':      period_name,
-            'code':        code,
-            'name':        name,
-            'signal_type': signal_type,
-            'details':     details,
-            'verdict':     verdict,
-            'analysis':    analysis,
-            'ml_prob':     ml_prob,
-            'ml_potential': ml_potential,
-            'ml_gain':     ml_result.get('gain'),
-        }
-
+        dedup.mark_sent(period_name, code, details.get('date', ''), signal_type)
         pushed_signals.append(sig_entry)
 
-    normal_results, strict_results = s.screen_all_stocks(stock_list, on_signal=on_signal)
+    normal_results, strict_results = s.screen_all_stocks(stock_list, on_signal=on_signal,
+                                                         progress_tag=progress_tag, deadline=deadline)
 
     elapsed = time.time() - start
     logger.info(f"[{period_name}] 扫描完成，耗时 {elapsed:.0f}s，"
                 f"严格 {len(strict_results)} + 普通 {len(normal_results)}，"
-                f"本轮推送 {pushed_count[0]} 条")
+                f"本轮推送 {pushed_count[0]} 条"
+                + (f"，形态跳过 {s.last_skipped} 只" if s.last_skipped else ""))
+    if s.last_deferred:
+        logger.warning(f"[{period_name}] 时间预算用尽，顺延 {s.last_deferred} 只到下一轮")
+    prefilter_info = screener.format_prefilter_counts(s.last_prefiltered)
+    if prefilter_info:
+        logger.info(f"[{period_name}] 行情预筛{prefilter_info}")
+    stats = s.last_scan_stats
+    if stats:
+        retry_info = f"，失败重试 {stats['retried']} 只（找回 {stats['recovered']}）" if stats['retried'] else ""
+        log = logger.warning if stats['failed'] else logger.info
+        log(f"[{period_name}] 覆盖率 {stats['coverage']:.1f}%（成功判定 {stats['evaluated']}/{stats['total']}，"
+            f"请求失败 {stats['failed']}）{retry_info}")
+    tail_info = screener.get_tail_cache_summary(period_code)
+    if tail_info:
+        logger.info(f"[{period_name}] {tail_info}")
 
     # 检查限流情况并通知
-    throttle_info = screener.get_throttle_summary()
+    throttle_info = screener.get_throttle_summary(sources)
     if throttle_info:
         logger.warning(f"[{period_name}] {throttle_info}")
         beijing_now = get_beijing_now().strftime('%H:%M')
@@ -679,14 +819,18 @@ def run_scan(period_cfg: dict, stock_list: list, webhook: str, secret: str, dedu
         ])
         send_dingtalk(webhook, secret, title, content)
 
-    return pushed_signals
+    return pushed_signals, s.last_deferred
 
 
 # ==================== 一轮完整扫描 ====================
-def _format_round_summary(all_signals: list, round_num: int) -> str:
-    """格式化一轮扫描的汇总消息（精简版，无普通信号）"""
+def _format_round_summary(all_signals: list, round_num: int, deferred: dict = None) -> str:
+    """格式化一轮扫描的汇总消息（精简版，无普通信号）
+    deferred: {周期名: 时间预算用尽顺延到下一轮的股票数}"""
     beijing_now = get_beijing_now().strftime('%m-%d %H:%M:%S')
     lines = [f"### 📋 第{round_num}轮汇总 ({beijing_now})"]
+    if deferred:
+        lines.append("⏱️ 时间预算用尽，顺延到下一轮: "
+                     + "，".join(f"{name} {n} 只" for name, n in deferred.items()))
 
     # 市场环境提示（独立try，任何异常都不影响汇总主体）
     # 注意：模块导入、网络请求、解析、格式化任何环节失败都会被捕获
@@ -792,34 +936,102 @@ def _format_round_summary(all_signals: list, round_num: int) -> str:
     return "\n\n".join(lines)
 
 
+def _period_lanes(periods: List[dict] = None) -> List[List[dict]]:
+    """
+    按数据源族把 PERIODS 分成并行的扫描线（分钟线走新浪、日线走腾讯）。
+    同一条线内按配置顺序依次扫描（合成周期排在来源周期之后，直接复用其缓存）；不同的线同时进行，
+    各数据源的限速额度（screener._rate_limiter，进程内全局共享）在整轮中始终有请求在用，
+    日线不必等两个分钟周期扫完才开始。periods 为本轮要扫的周期（默认全部）
+    """
+    lanes = {}
+    for cfg in periods or PERIODS:
+        s = screener.StrictStockScreener(period=cfg['code'], derive=cfg.get('derive', False))
+        key = tuple(src.__name__ for src in screener.sources_for_period(s.fetch_period))
+        lanes.setdefault(key, []).append(cfg)
+    return list(lanes.values())
+
+
+def _period_deadline(lane: List[dict], k: int, round_end: Optional[float]) -> Optional[float]:
+    """扫描线 lane 中第 k 个周期的截止时刻：剩余预算按本周期及其后各周期的 budget 权重分配，
+    前面的周期提前扫完省下的时间自动留给后面的周期"""
+    if round_end is None:
+        return None
+    weights = [cfg.get('budget', 1) for cfg in lane[k:]]
+    remaining = max(0.0, round_end - time.time())
+    return time.time() + remaining * weights[0] / sum(weights)
+
+
 def run_full_round(stock_list: list, webhook: str, secret: str, dedup: SignalDedup,
-                   round_num: int = 0):
-    """依次扫描三个周期，最后推送整合汇总"""
+                   round_num: int = 0, periods: List[dict] = None, closed_only: bool = False,
+                   budget: Optional[float] = None):
+    """各扫描线并行扫描 periods（默认所有周期），最后推送整合汇总
+    budget: 本轮时间预算（秒，None/0 不限），各扫描线内按周期 budget 权重分配，到点未请求的股票顺延到下一轮"""
     beijing_now = get_beijing_now().strftime('%H:%M:%S')
     logger.info(f"========== 开始新一轮扫描 (北京时间 {beijing_now}) ==========")
 
+    round_start = time.time()
+    screener.http_pool.reset_stats()
+    lanes = _period_lanes(periods)
     all_signals = []
-    for idx, period_cfg in enumerate(PERIODS, 1):
-        if _shutdown:
-            logger.info("收到终止信号，跳过剩余周期")
-            break
-        logger.info(f">>> 开始扫描周期 {idx}/{len(PERIODS)}: {period_cfg['name']}")
-        signals = run_scan(period_cfg, stock_list, webhook, secret, dedup, round_num=round_num)
-        logger.info(f"<<< 周期 {idx}/{len(PERIODS)} 完成，获得 {len(signals)} 条信号")
-        all_signals.extend(signals)
-
+    finished = {}  # {周期名: 轮内完成时刻(秒)}
+    deferred = {}  # {周期名: 时间预算用尽顺延的股票数}
+    round_lock = threading.Lock()
+    round_end = round_start + budget if budget else None
+    if budget:
+        logger.info(f"本轮时间预算 {budget:.0f}s")
+
+    def run_lane(lane: List[dict]):
+        for k, period_cfg in enumerate(lane):
+            if _shutdown:
+                logger.info(f"收到终止信号，跳过周期 {period_cfg['name']}")
+                return
+            deadline = _period_deadline(lane, k, round_end)
+            logger.info(f">>> 开始扫描周期: {period_cfg['name']} (轮内 +{time.time() - round_start:.0f}s"
+                        + (f"，预算 {deadline - time.time():.0f}s" if deadline else "") + ")")
+            tag = f"[{period_cfg['name']}]" if len(lanes) > 1 else ''
+            signals, n_deferred = run_scan(period_cfg, stock_list, webhook, secret, dedup,
+                                           round_num=round_num, progress_tag=tag, closed_only=closed_only,
+                                           deadline=deadline)
+            done_at = time.time() - round_start
+            logger.info(f"<<< 周期 {period_cfg['name']} 完成 (轮内 +{done_at:.0f}s)，获得 {len(signals)} 条信号"
+                        + (f"，顺延 {n_deferred} 只" if n_deferred else ""))
+            with round_lock:
+                all_signals.extend(signals)
+                finished[period_cfg['name']] = done_at
+                if n_deferred:
+                    deferred[period_cfg['name']] = n_deferred
+
+    with ThreadPoolExecutor(max_workers=len(lanes)) as pool:
+        futures = [pool.submit(run_lane, lane) for lane in lanes]
+    for f in futures:
+        f.result()
+
+    # 汇总按周期配置顺序排列（各扫描线完成先后不定）
+    period_order = {cfg['name']: i for i, cfg in enumerate(PERIODS)}
+    all_signals.sort(key=lambda sig: period_order.get(sig['period'], len(PERIODS)))
+    timeline = ', '.join(f"{cfg['name']} +{finished[cfg['name']]:.0f}s"
+                         for cfg in PERIODS if cfg['name'] in finished)
+    logger.info(f"各周期完成时刻: {timeline}  (本轮用时 {time.time() - round_start:.0f}s，"
+                f"{len(lanes)} 条扫描线并行)")
+    pool_info = screener.http_pool.get_summary()
+    if pool_info:
+        logger.info(pool_info)
+
+    deferred = {cfg['name']: deferred[cfg['name']] for cfg in PERIODS if cfg['name'] in deferred}
+    deferred_total = sum(deferred.values())
+    deferred_info = f"，时间预算用尽顺延 {deferred_total} 只" if deferred_total else ""
     if _shutdown:
         logger.info(f"========== 扫描被终止，已收集 {len(all_signals)} 条信号 ==========")
     else:
-        logger.info(f"========== 本轮扫描完成，共 {len(all_signals)} 条新信号 ==========")
+        logger.info(f"========== 本轮扫描完成，共 {len(all_signals)} 条新信号{deferred_info} ==========")
 
     # 普通信号已在 on_signal 里完成分析，此处无需补做
 
     # 推送整合汇总消息（外层兜底：即便格式化整体崩溃，也降级推送一个最简版本，
     # 确保扫描结果不因附加功能失败而丢失通知）
-    title = f"第{round_num}轮汇总 | 共{len(all_signals)}条信号"
+    title = f"第{round_num}轮汇总 | 共{len(all_signals)}条信号" + (f" | 顺延{deferred_total}只" if deferred_total else "")
     try:
-        content = _format_round_summary(all_signals, round_num)
+        content = _format_round_summary(all_signals, round_num, deferred)
     except Exception as _fmt_err:
         logger.error(f"汇总格式化异常，降级为最简版本: {_fmt_err}")
         beijing_now = get_beijing_now().strftime('%m-%d %H:%M:%S')
@@ -830,6 +1042,54 @@ def run_full_round(stock_list: list, webhook: str, secret: str, dedup: SignalDed
     send_dingtalk(webhook, secret, title, content)
 
 
+# ==================== 盘中触发监视 ====================
+# 扫描时处于确认窗口内的股票会在形态状态里记下触发价位（screener.pattern_triggers），扫描间隙用批量行情
+# 对比，达到价位的立即做一次完整判定。日线检查点之间不必等下一次全市场扫描，信号几秒内即可推送。
+TRIGGER_WATCH_INTERVAL = 15  # 秒
+
+
+def _check_triggers(period_cfg: dict, checker, names: dict, webhook: str, secret: str,
+                    dedup: SignalDedup) -> int:
+    """对比一次触发价位，命中的做完整判定并推送新信号，返回推送条数"""
+    period_name = period_cfg['name']
+    triggers = screener.pattern_triggers(period_cfg['code'])
+    if not triggers:
+        return 0
+    quotes, _ = screener.QuoteSnapshot.fetch(list(triggers))
+    fired = 0
+    for code in screener.match_triggers(triggers, quotes):
+        normal, strict, details, _ = checker.check_with_quote(code, quotes[code])
+        if not (normal or strict):
+            continue
+        signal_type = details.get('signal_type') or 'normal'
+        if not dedup.is_new(period_name, code, details.get('date', ''), signal_type):
+            continue
+        dedup.mark_sent(period_name, code, details.get('date', ''), signal_type)
+        name = names.get(code, '')
+        logger.info(f"[{period_name}] 盘中触发: {code} {name} 达到确认阳价位，{signal_type}信号")
+        _process_signal(period_name, code, name, signal_type, details, webhook, secret)
+        fired += 1
+    return fired
+
+
+def _trigger_watch_loop(stock_list: list, webhook: str, secret: str, dedup: SignalDedup):
+    """触发监视线程：交易时间内每 TRIGGER_WATCH_INTERVAL 秒对比一次（触发表通常几十只，一次行情请求）"""
+    cfgs = [cfg for cfg in PERIODS if cfg['code'] in screener.TRIGGER_PERIODS]
+    names = dict(stock_list)
+    checkers = {cfg['code']: screener.StrictStockScreener(period=cfg['code'], period_name=cfg['name'],
+                                                          columnar=True, incremental=True,
+                                                          datalen=_base_datalen_for(cfg['code']))
+                for cfg in cfgs}
+    while cfgs and not _shutdown and not is_after_trading():
+        if is_trading_time():
+            for cfg in cfgs:
+                try:
+                    _check_triggers(cfg, checkers[cfg['code']], names, webhook, secret, dedup)
+                except Exception as e:
+                    logger.warning(f"[{cfg['name']}] 触发监视异常（不影响定时扫描）: {e}")
+        _interruptible_sleep(TRIGGER_WATCH_INTERVAL)
+
+
 def _interruptible_sleep(seconds: int):
     """可中断的sleep，每秒检查一次退出标志"""
     for _ in range(int(seconds)):
@@ -838,10 +1098,90 @@ def _interruptible_sleep(seconds: int):
         time.sleep(1)
 
 
+def _loop_fixed_interval(stock_list: list, webhook: str, secret: str, dedup: SignalDedup) -> int:
+    """--rescan-unfinished：所有周期一起扫，跑完等 SCAN_INTERVAL 再扫（未收盘的K线会被反复判定），返回轮数"""
+    round_count = 0
+    while not _shutdown:
+        if is_after_trading():
+            logger.info("已收盘，退出")
+            break
+
+        if is_trading_time():
+            round_count += 1
+            logger.info(f"--- 第 {round_count} 轮 ---")
+            run_full_round(stock_list, webhook, secret, dedup, round_num=round_count, budget=ROUND_BUDGET)
+
+            # 跑完等5分钟（可中断）
+            if not is_after_trading() and not _shutdown:
+                logger.info(f"等待 {SCAN_INTERVAL}s 后开始下一轮...")
+                _interruptible_sleep(SCAN_INTERVAL)
+
+        elif is_before_trading():
+            wait = seconds_to_next_session()
+            next_time = (get_beijing_now() + timedelta(seconds=wait)).strftime('%H:%M')
+            logger.info(f"未开盘，等待到 {next_time} ({wait}s)")
+            _interruptible_sleep(wait)
+
+        elif is_lunch_break():
+            wait = seconds_to_next_session()
+            next_time = (get_beijing_now() + timedelta(seconds=wait)).strftime('%H:%M')
+            logger.info(f"午休中，等待到 {next_time} ({wait}s)")
+            _interruptible_sleep(wait)
+
+        else:
+            _interruptible_sleep(30)
+
+    return round_count
+
+
+def _loop_bar_aligned(stock_list: list, webhook: str, secret: str, dedup: SignalDedup) -> int:
+    """
+    按K线收盘调度（默认）：每个周期只在自己的K线收盘后扫描一次、只判定已收盘的K线，
+    同一时刻到期的周期合并为一轮（如 10:00 的5分钟和30分钟，各扫描线并行），返回轮数。
+    30分钟不再把同一根未走完的K线扫五六遍，日线只在 DAILY_CHECKPOINTS 扫描
+    """
+    now = get_beijing_now()
+    due = {cfg['name']: next_trigger(cfg['code'], now) for cfg in PERIODS}
+    round_count = 0
+    while not _shutdown:
+        if is_after_trading():
+            logger.info("已收盘，退出")
+            break
+
+        now = get_beijing_now()
+        ready = [cfg for cfg in PERIODS if due[cfg['name']] <= now]
+        if not ready:
+            wake = min(due.values())
+            if wake.date() != now.date():
+                logger.info("今日扫描时刻已全部完成，退出")
+                break
+            names = ', '.join(cfg['name'] for cfg in PERIODS if due[cfg['name']] == wake)
+            wait = (wake - now).total_seconds()
+            logger.info(f"下次扫描 {wake.strftime('%H:%M:%S')} ({names})，等待 {wait:.0f}s")
+            _interruptible_sleep(int(wait) + 1)
+            continue
+
+        round_count += 1
+        logger.info(f"--- 第 {round_count} 轮: {', '.join(cfg['name'] for cfg in ready)} ---")
+        # 预算不超过本轮各周期的下一次扫描时刻：扫不完的顺延，不推迟下一根K线的扫描
+        budget = ROUND_BUDGET
+        if budget:
+            next_due = min(next_trigger(cfg['code'], now) for cfg in ready)
+            budget = max(SCAN_DELAY, min(budget, (next_due - get_beijing_now()).total_seconds()))
+        run_full_round(stock_list, webhook, secret, dedup, round_num=round_count,
+                       periods=ready, closed_only=True, budget=budget)
+        # 从本轮开始时刻算下一次：扫描期间又有K线收盘的，扫完立即再扫（错过多根只补扫最新一根）
+        for cfg in ready:
+            due[cfg['name']] = next_trigger(cfg['code'], now)
+    return round_count
+
+
 # ==================== 主循环 ====================
 def main():
     parser = argparse.ArgumentParser(description='股票信号监控')
     parser.add_argument('--now', action='store_true', help='立即扫描一次（不等交易时间）')
+    parser.add_argument('--rescan-unfinished', action='store_true',
+                        help=f'每 {SCAN_INTERVAL}s 扫描所有周期（含未收盘的K线），默认按K线收盘时刻调度')
     args = parser.parse_args()
 
     # 从环境变量读取Token
@@ -866,7 +1206,11 @@ def main():
     threads_info = ', '.join(f"{p['name']}={p['max_workers']}线程" for p in PERIODS)
     logger.info(f"  线程配置: {threads_info}")
     logger.info(f"  股票数量: {len(stock_list)}")
-    logger.info(f"  扫描间隔: {SCAN_INTERVAL}s (跑完等5分钟)")
+    if args.rescan_unfinished:
+        logger.info(f"  扫描间隔: {SCAN_INTERVAL}s (跑完等5分钟，含未收盘的K线)")
+    else:
+        logger.info(f"  扫描调度: 分钟周期K线收盘后 {SCAN_DELAY}s，日线 {', '.join(DAILY_CHECKPOINTS)}")
+    logger.info(f"  轮次预算: {f'{ROUND_BUDGET}s（到点未扫的股票顺延到下一轮）' if ROUND_BUDGET else '不限'}")
     logger.info(f"  钉钉推送: {'已配置' if webhook and secret else '未配置'}")
     logger.info(f"  北京时间: {get_beijing_now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("=" * 60)
@@ -893,36 +1237,12 @@ def main():
         return
 
     # 正常模式：循环到收盘
-    round_count = 0
-    while not _shutdown:
-        if is_after_trading():
-            logger.info("已收盘，退出")
-            break
-
-        if is_trading_time():
-            round_count += 1
-            logger.info(f"--- 第 {round_count} 轮 ---")
-            run_full_round(stock_list, webhook, secret, dedup, round_num=round_count)
-
-            # 跑完等5分钟（可中断）
-            if not is_after_trading() and not _shutdown:
-                logger.info(f"等待 {SCAN_INTERVAL}s 后开始下一轮...")
-                _interruptible_sleep(SCAN_INTERVAL)
-
-        elif is_before_trading():
-            wait = seconds_to_next_session()
-            next_time = (get_beijing_now() + timedelta(seconds=wait)).strftime('%H:%M')
-            logger.info(f"未开盘，等待到 {next_time} ({wait}s)")
-            _interruptible_sleep(wait)
-
-        elif is_lunch_break():
-            wait = seconds_to_next_session()
-            next_time = (get_beijing_now() + timedelta(seconds=wait)).strftime('%H:%M')
-            logger.info(f"午休中，等待到 {next_time} ({wait}s)")
-            _interruptible_sleep(wait)
-
-        else:
-            _interruptible_sleep(30)
+    if args.rescan_unfinished:
+        round_count = _loop_fixed_interval(stock_list, webhook, secret, dedup)
+    else:
+        threading.Thread(target=_trigger_watch_loop, args=(stock_list, webhook, secret, dedup),
+                         daemon=True).start()
+        round_count = _loop_bar_aligned(stock_list, webhook, secret, dedup)
 
     logger.info(f"今日共完成 {round_count} 轮扫描")
 
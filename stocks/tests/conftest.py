@@ -0,0 +1,17 @@
+"""
+选股器测试的公共夹具：stocks/ 加入 sys.path，经 screener_bench 加载选股模块（文件名含中文，不能直接 import）
+和提交在 bench_fixtures/ 下的K线夹具、金标准。
+
+    cd stocks
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+STOCKS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if STOCKS_DIR not in sys.path:
+    sys.path.insert(0, STOCKS_DIR)
+
+# 测试不读写本地K线库
+os.environ.setdefault('BAR_STORE_DIR', 'off')
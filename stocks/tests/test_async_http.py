@@ -0,0 +1,146 @@
+"""
+异步扫描的 HTTP/1.1 客户端（_async_request）对本地服务端的测试：
+  - 响应体：Content-Length、chunked（含扩展）、Connection: close 读到 EOF、gzip、重定向、非 2xx
+  - 长连接：有长度的响应放回复用，Connection: close 的不复用；扫描结束 _async_close_idle 全部关闭
+  - 空闲连接按事件循环隔离：两个线程各跑一个事件循环时互不取用、互不关闭，没有泄漏的连接
+"""
+
+import asyncio
+import gzip
+import socketserver
+import threading
+import time
+import urllib.error
+
+import pytest
+
+import screener_bench as bench
+
+screener = bench.screener
+
+RESPONSES = {
+    '/length': b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello",
+    '/chunked': (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                 b"5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\n\r\n"),
+    '/close': b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nbye",
+    '/gzip': (b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nContent-Length: %d\r\n\r\n"
+              % len(gzip.compress(b"zipped")) + gzip.compress(b"zipped")),
+    '/redirect': b"HTTP/1.1 302 Found\r\nLocation: /length\r\nContent-Length: 0\r\n\r\n",
+    '/missing': b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n",
+}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """逐个读请求行+请求头，按路径回放固定响应；/close 回完即断开"""
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.accepted += 1
+            server.open += 1
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                path = line.split()[1].decode()
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                self.wfile.write(RESPONSES[path])
+                self.wfile.flush()
+                if path == '/close':
+                    break
+        finally:
+            with server.lock:
+                server.open -= 1
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.open = 0
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def wait_all_closed(self, timeout: float = 3.0) -> int:
+        """等服务端看到客户端关闭全部连接，返回仍打开的连接数"""
+        deadline = time.time() + timeout
+        while self.open and time.time() < deadline:
+            time.sleep(0.02)
+        return self.open
+
+
+@pytest.fixture
+def server():
+    srv = _Server()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_response_bodies_and_reuse(server):
+    async def run():
+        try:
+            got = [await screener._async_request(server.url(path), {})
+                   for path in ('/length', '/chunked', '/gzip', '/redirect')]
+            reused_accepts = server.accepted
+            got.append(await screener._async_request(server.url('/close'), {}))
+            got.append(await screener._async_request(server.url('/length'), {}))
+            with pytest.raises(urllib.error.HTTPError) as err:
+                await screener._async_request(server.url('/missing'), {})
+            return got, reused_accepts, err.value.code
+        finally:
+            await screener._async_close_idle()
+
+    got, reused_accepts, status = asyncio.run(run())
+    assert got == [b"hello", b"hello world", b"zipped", b"hello", b"bye", b"hello"]
+    assert reused_accepts == 1          # 有长度的响应（含重定向）都复用同一条连接
+    assert server.accepted == 2         # /close 之后重新建连
+    assert status == 404
+    assert server.wait_all_closed() == 0
+    assert len(screener._async_idle) == 0
+
+
+def test_idle_pool_per_event_loop(server):
+    """A 循环留着空闲连接时，B 循环既不取走也不关闭它；各自结束时只关自己的，最后没有泄漏"""
+    a_idle, b_done = threading.Event(), threading.Event()
+    results = {}
+
+    async def lane_a():
+        loop = asyncio.get_running_loop()
+        try:
+            await screener._async_request(server.url('/length'), {})
+            a_idle.set()
+            await loop.run_in_executor(None, b_done.wait, 5)
+            before = server.accepted
+            await screener._async_request(server.url('/length'), {})
+            results['a_reused'] = server.accepted == before
+        finally:
+            await screener._async_close_idle()
+
+    async def lane_b():
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, a_idle.wait, 5)
+        try:
+            results['b'] = await screener._async_request(server.url('/chunked'), {})
+        finally:
+            await screener._async_close_idle()
+            b_done.set()
+
+    threads = [threading.Thread(target=asyncio.run, args=(lane(),)) for lane in (lane_a, lane_b)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert results == {'a_reused': True, 'b': b"hello world"}
+    assert server.accepted == 2
+    assert server.wait_all_closed() == 0
+    assert len(screener._async_idle) == 0
@@ -0,0 +1,49 @@
+"""
+screen_all_stocks 各执行方式的对拍：抓取换成提交的合成夹具（不发请求），
+'async'、'process'（抓取线程 + 判定进程池）的扫描结果（信号股票及详情）与默认的 'thread' 完全一致
+"""
+
+import asyncio
+
+import pytest
+
+import screener_bench as bench
+
+screener = bench.screener
+Screener = screener.StrictStockScreener
+
+SCAN_PERIOD = '240min'
+
+
+@pytest.fixture
+def stub_fetch(monkeypatch):
+    """_fetch_raw / _fetch_raw_async 直接返回合成夹具，数据源检测视为可用，夹具的固定年份不算过期K线"""
+    fixtures = bench.synthetic_fixtures(SCAN_PERIOD)
+
+    async def fetch_async(self, code, source_idx=0):
+        await asyncio.sleep(0)
+        return fixtures[code]
+
+    monkeypatch.setattr(Screener, '_check_sources', lambda self: (['stub'], []))
+    monkeypatch.setattr(Screener, '_fetch_raw', lambda self, code, source_idx=0: fixtures[code])
+    monkeypatch.setattr(Screener, '_fetch_raw_async', fetch_async)
+    monkeypatch.setattr(Screener, '_is_stale_bar', staticmethod(lambda last_bar_time: False))
+    yield [(code, f"股票{code}") for code in fixtures]
+    screener._result_memo.clear()
+    screener._pattern_hints.clear()
+
+
+def _scan(stock_list, executor: str):
+    screener._result_memo.clear()
+    screener._pattern_hints.clear()
+    normal, strict = Screener(period=SCAN_PERIOD, columnar=True).screen_all_stocks(stock_list, executor=executor)
+    return sorted(normal), sorted(strict)
+
+
+@pytest.mark.parametrize('executor', ['async', 'process'])
+def test_executor_matches_thread(stub_fetch, executor):
+    if screener.np is None:
+        pytest.skip("未安装 numpy")
+    expected = _scan(stub_fetch, 'thread')
+    assert expected[1], "合成夹具应有植入形态的严格信号"
+    assert _scan(stub_fetch, executor) == expected
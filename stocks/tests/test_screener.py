@@ -0,0 +1,241 @@
+"""
+选股器对拍测试，跑在提交的夹具上（bench_fixtures/synthetic、已录制时还有 recorded）：
+  - 金标准：字典/列式两条路径的 signal_series 与参考版本逐K线 _check_signal_at 的信号行一致
+  - 列式预计算与字典路径逐字段、逐根信号一致
+  - _SignalEngine 的逐K线序列与逐根回溯的原始写法一致
+  - 筑底/突破用的滚动最高/最低价、MACD 预计算列与逐位置直接计算一致
+  - 按 datalen（required_bars()）根K线抓取判定最新信号，与用全部历史判定一致（需要比 required_bars() 更长的K线：
+    录制K线，同一生成器 screener_bench.synth_bars 按固定种子生成的加长合成K线，以及简单金叉远在窗口之前、
+    开口长期不达标的缓涨K线——抓取时须整段重取）
+"""
+
+import pytest
+
+import screener_bench as bench
+
+screener = bench.screener
+
+FIXTURES = [(period, corpus, fixtures) for period in bench.PERIODS
+            for corpus, fixtures in bench.fixture_sets(period)]
+CORPUS_IDS = {'合成': 'synthetic', '录制': 'recorded'}  # 测试编号用 ASCII（pytest 会转义中文）
+FIXTURE_IDS = [f"{period}-{CORPUS_IDS[corpus]}" for period, corpus, _ in FIXTURES]
+DAILY_PERIODS = ('240min', 'weekly', 'monthly')
+# 原始写法逐根回溯，分钟线窗口大（1分钟 240 根）时单只要十几秒，只测窗口不超过 60 根的周期
+REFERENCE_PERIODS = ('30min', '60min') + DAILY_PERIODS
+REFERENCE_STOCKS = 6
+REFERENCE_LAST_BARS = 120
+LOOKBACK_SEEDS = (0, 1)
+LOOKBACK_LAST_BARS = 100
+LOOKBACK_GRIND_EXTRA = 100  # 缓涨段比 datalen 多出的根数（简单金叉落在抓取窗口之外）
+
+
+def test_fixtures_committed():
+    for period in bench.PERIODS:
+        assert bench.synthetic_fixtures(period), f"缺少合成夹具 {period}（screener_bench.py --synth-update）"
+
+
+@pytest.mark.parametrize('columnar', [False, True], ids=['dict', 'columnar'])
+@pytest.mark.parametrize('period,corpus,fixtures', FIXTURES, ids=FIXTURE_IDS)
+def test_golden_signal_rows(period, corpus, fixtures, columnar):
+    if columnar and screener.np is None:
+        pytest.skip("未安装 numpy")
+    expected = bench.load_golden()['fixtures'].get(f"{period}/{corpus}")
+    assert expected is not None, "无金标准（screener_bench.py --golden-update）"
+    assert bench.golden_rows(period, fixtures, columnar) == expected
+
+
+@pytest.mark.parametrize('period,corpus,fixtures', FIXTURES, ids=FIXTURE_IDS)
+def test_columnar_matches_dict(period, corpus, fixtures):
+    if screener.np is None:
+        pytest.skip("未安装 numpy")
+    s = screener.StrictStockScreener(period=period)
+    for code, raw in fixtures.items():
+        data, bars = s._prepare_data(raw), s._prepare_columnar(raw)
+        if data is None or bars is None:
+            assert data is None and bars is None, code
+            continue
+        assert bars.to_dicts() == data, code
+        engine_dict, engine_bars = s._build_engine(data), s._build_engine(bars)
+        for i in range(s.ma_long + 1, len(data)):
+            assert s._check_signal_at(data, i, engine_dict) == s._check_signal_at(bars, i, engine_bars), \
+                (code, data[i]['date'])
+
+
+def reference_engine_at(s, data, idx):
+    """逐K线回溯的原始实现（金叉.txt逐根独立计算的直译）
+    返回: (金叉位置, 死叉位置, 阴线量, 首倍量位置, idx是否确认阳, [金叉, idx]内确认阳根数)"""
+    cols = screener._as_columns(data)
+    volumes, closes = cols.volume, cols.close
+    is_yang, is_yin = cols.is_yang, cols.is_yin
+
+    def barslast(flags, pos):
+        for j in range(pos, s.ma_long, -1):
+            if flags[j]:
+                return j
+        return -1
+
+    gold_cross_idx = barslast(cols.gold_cross, idx)
+    dead_cross_idx = barslast(cols.dead_cross, idx)
+
+    def calc_yin_vol_at(pos):
+        k_gold_idx = barslast(cols.gold_cross, pos)
+        if k_gold_idx == -1:
+            return 0
+        k_dist_gold = pos - k_gold_idx
+        for off in range(1, s.window_size + 1):
+            ci = pos - off
+            if ci < 0:
+                continue
+            if off < k_dist_gold and is_yin[ci]:
+                return volumes[ci]
+        return 0
+
+    def find_first_double_at(pos):
+        dv_flags = {}
+        start_scan = max(0, pos - s.window_size - 10)
+        for k in range(start_scan, pos + 1):
+            k_gold_idx = barslast(cols.gold_cross, k)
+            if k_gold_idx == -1:
+                continue
+            k_dist_gold = k - k_gold_idx
+            if k_dist_gold <= 0 or k_dist_gold > s.window_size:
+                continue
+            k_yin_vol = calc_yin_vol_at(k)
+            if (is_yang[k] and k_yin_vol > 0 and volumes[k] >= k_yin_vol * 2 and
+                    volumes[k] > volumes[k_gold_idx]):
+                dv_flags[k] = True
+        for k in sorted(dv_flags.keys()):
+            if k <= gold_cross_idx:
+                continue
+            if all((k - prev_off) not in dv_flags for prev_off in range(1, 11)):
+                return k
+        return -1
+
+    def is_confirm_yang_at(pos):
+        if not is_yang[pos]:
+            return False
+        fd_idx = find_first_double_at(pos)
+        if fd_idx == -1:
+            return False
+        pos_dist_fd = pos - fd_idx
+        pos_dist_gold = pos - gold_cross_idx
+        if pos_dist_fd < 1 or pos_dist_fd > 5 or pos_dist_fd >= pos_dist_gold:
+            return False
+        if closes[pos] * 10000 < closes[fd_idx] * s.tolerance:
+            return False
+        max_yang_vol = 0
+        for n in range(1, s.window_size + 1):
+            kk = pos - n
+            if kk >= 0 and n < pos_dist_gold and n != pos_dist_fd and is_yang[kk]:
+                max_yang_vol = max(max_yang_vol, volumes[kk])
+        return volumes[pos] > max_yang_vol
+
+    if gold_cross_idx == -1:
+        return -1, dead_cross_idx, 0, -1, False, 0
+    confirm_count = sum(1 for i in range(gold_cross_idx, idx + 1) if is_confirm_yang_at(i))
+    return (gold_cross_idx, dead_cross_idx, calc_yin_vol_at(idx),
+            find_first_double_at(idx), is_confirm_yang_at(idx), confirm_count)
+
+
+@pytest.mark.parametrize('period,corpus,fixtures',
+                         [f for f in FIXTURES if f[0] in REFERENCE_PERIODS],
+                         ids=[i for i, f in zip(FIXTURE_IDS, FIXTURES) if f[0] in REFERENCE_PERIODS])
+def test_engine_matches_reference(period, corpus, fixtures):
+    s = screener.StrictStockScreener(period=period)
+    for code, raw in list(fixtures.items())[:REFERENCE_STOCKS]:
+        data = s._prepare_data(raw)
+        if data is None:
+            continue
+        engine = s._build_engine(data)
+        for i in range(max(s.ma_long + 1, len(data) - REFERENCE_LAST_BARS), len(data)):
+            gold_idx = engine.gold_idx[i]
+            got = (gold_idx, engine.dead_idx[i],
+                   engine.yin_vol[i] if gold_idx != -1 else 0,
+                   engine.first_double[i], engine.confirm[i],
+                   engine.confirm_count(gold_idx, i) if gold_idx != -1 else 0)
+            assert got == reference_engine_at(s, data, i), (code, data[i]['date'])
+
+
+def _ema(values, period):
+    result = [values[0]]
+    m = 2.0 / (period + 1)
+    for v in values[1:]:
+        result.append(v * m + result[-1] * (1 - m))
+    return result
+
+
+@pytest.mark.parametrize('period,corpus,fixtures',
+                         [f for f in FIXTURES if f[0] in DAILY_PERIODS],
+                         ids=[i for i, f in zip(FIXTURE_IDS, FIXTURES) if f[0] in DAILY_PERIODS])
+def test_indicator_columns(period, corpus, fixtures):
+    s = screener.StrictStockScreener(period=period)
+    for code, raw in fixtures.items():
+        data = s._prepare_data(raw)
+        if data is None:
+            continue
+        cols = screener._as_columns(data)
+        n = len(cols.close)
+        for w in (30, 120, 250):
+            rolling_low, rolling_high = cols.rolling_low(w), cols.rolling_high(w)
+            for i in range(n):
+                window = range(max(0, i - w + 1), i + 1)
+                assert rolling_low[i] == min(cols.low[k] for k in window), (code, w, i)
+                assert rolling_high[i] == max(cols.high[k] for k in window), (code, w, i)
+        diff = [a - b for a, b in zip(_ema(cols.close, 12), _ema(cols.close, 26))]
+        dea = _ema(diff, 9)
+        assert cols.macd() == (diff, dea, [2 * (diff[i] - dea[i]) for i in range(n)]), code
+
+
+def _lookback_cases():
+    for period in bench.PERIODS:
+        need = screener.StrictStockScreener(period=period).datalen
+        for seed in LOOKBACK_SEEDS:
+            yield pytest.param(period, bench.synth_bars(period, need + LOOKBACK_LAST_BARS + 200, seed,
+                                                        plant=seed % 2 == 0), id=f"{period}-synthetic{seed}")
+        grind = need + LOOKBACK_GRIND_EXTRA
+        yield pytest.param(period, bench.synth_bars(period, need + grind + 200, 0, plant=True, grind=grind),
+                           id=f"{period}-grind")
+        for code, raw in list(bench.recorded_fixtures(period).items())[:len(LOOKBACK_SEEDS)]:
+            if len(raw) > need:
+                yield pytest.param(period, raw, id=f"{period}-recorded{code}")
+
+
+@pytest.mark.parametrize('period,bars', list(_lookback_cases()))
+def test_lookback(period, bars, monkeypatch):
+    """逐一模拟最后 LOOKBACK_LAST_BARS 根各为“当时最新一根”：经 _fetch_raw 按 datalen 抓取（必要时整段重取）
+    判定的结果与用全部历史判定一致"""
+    s = screener.StrictStockScreener(period=period)
+    need = s.datalen
+    raw = bars.to_dicts()
+    full = s._prepare_data(raw)
+    series = s.signal_series(full)
+    for end in range(max(need, len(raw) - LOOKBACK_LAST_BARS), len(raw)):
+        monkeypatch.setattr(screener, 'fetch_kline_with_fallback',
+                            lambda code, period, source_idx=0, datalen=1500, min_len=31, end=end:
+                            bars[max(0, end + 1 - datalen):end + 1])
+        tail = s._prepare_data(s._fetch_raw('000001'))
+        try:
+            normal_buy, strict_buy, details = s._check_signal_at(tail, len(tail) - 1)
+            got = (normal_buy, strict_buy, details.get('signal_type'), None)
+        except Exception as e:
+            got = (False, False, None, str(e))
+        i = len(full) - len(raw) + end  # raw 均为有效K线时与 end 相同
+        expected = (series['normal'][i], series['strict'][i], series['signal_type'][i], series['error'][i])
+        if expected[2] is None and got[2] == '无':
+            got = (got[0], got[1], None, got[3])  # signal_series 只给出完整判定的K线记信号类型
+        assert got == expected, full[i]['date']
+
+
+@pytest.mark.parametrize('period', bench.PERIODS)
+def test_lookback_grind_needs_full_history(period):
+    """缓涨K线确实落在截断情形：只取 datalen 根时最后一根的严格信号丢失，_needs_full_history 据此整段重取"""
+    s = screener.StrictStockScreener(period=period)
+    need = s.datalen
+    grind = need + LOOKBACK_GRIND_EXTRA
+    bars = bench.synth_bars(period, need + grind + 200, 0, plant=True, grind=grind)
+    full = s._prepare_data(bars.to_dicts())
+    assert s._check_signal_at(full, len(full) - 1)[:2] == (True, True)
+    tail = s._prepare_data(bars[-need:].to_dicts())
+    assert s._check_signal_at(tail, len(tail) - 1)[:2] == (False, False)
+    assert s._needs_full_history(bars[-need:])
+    assert not s._needs_full_history(bars[-need + 1:])  # 不足 datalen 根：已是全部历史
@@ -23,17 +23,34 @@
 注意：请先运行 "python 更新股票列表.py" 生成 stock_list.md 文件
 """
 
+import asyncio
+import hashlib
+import http.client
+import math
 import os
-import urllib.request
+import urllib.error
+import urllib.parse
 import json
 import sys
 import re
 import ssl
 import time
 import threading
+import weakref
+from collections import OrderedDict, deque
+from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import bar_resample
+import http_pool
+from bar_series import BarSeries
+
+try:
+    import numpy as np
+except ImportError:  # 列式模式需要 numpy；缺失时仅可用逐K线字典路径
+    np = None
+
 # 禁用代理（避免代理软件干扰国内API请求）
 for _key in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
     if _key in os.environ:
@@ -42,10 +59,6 @@ for _key in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
 # 忽略SSL证书验证
 ssl._create_default_https_context = ssl._create_unverified_context
 
-# 创建无代理的opener（全局复用）
-_proxy_handler = urllib.request.ProxyHandler({})
-_opener = urllib.request.build_opener(_proxy_handler)
-
 # 线程安全的打印锁
 _print_lock = threading.Lock()
 
@@ -203,7 +216,9 @@ def test_sina_rate_limit():
 # ==================== 多数据源K线获取 ====================
 
 class KlineSource:
-    """K线数据源基类"""
+    """K线数据源基类：build_request 构造请求、parse 解析响应，同步(fetch)与异步(fetch_kline_async)共用"""
+
+    STORE_KEY = ''  # 本地K线库中的数据源分组（与 data_source 的同名数据源共用文件，见 bar_store）
 
     @staticmethod
     def get_market_prefix(code: str) -> str:
@@ -213,50 +228,73 @@ class KlineSource:
 
     @staticmethod
     def _request(url: str, headers: dict, timeout: int = 12) -> bytes:
-        req = urllib.request.Request(url, headers=headers)
-        with _opener.open(req, timeout=timeout) as r:
-            return r.read()
+        return http_pool.http_get(url, headers, timeout)  # 长连接复用 + gzip
+
+    @classmethod
+    def build_request(cls, code: str, period: str, datalen: int) -> Optional[Tuple[str, Dict]]:
+        """返回 (url, headers)；该数据源不支持此周期时返回 None"""
+        raise NotImplementedError
+
+    @classmethod
+    def parse(cls, raw: bytes, code: str, period: str) -> BarSeries:
+        """响应体 → BarSeries（数值在这里解析一次；缺字段/非数值的K线跳过，与 _prepare_data 规则一致）"""
+        raise NotImplementedError
+
+    @classmethod
+    def fetch(cls, code: str, period: str, datalen: int = 1500) -> BarSeries:
+        req = cls.build_request(code, period, datalen)
+        if req is None:
+            return BarSeries()
+        url, headers = req
+        return cls.parse(cls._request(url, headers), code, period)
 
 
 class SinaKline(KlineSource):
-    """新浪财经K线"""
+    """新浪财经K线（分钟线/日线；没有周线/月线接口，scale=240 返回的是日线）"""
+
+    STORE_KEY = 'sina'
 
     SCALE_MAP = {
         '1min': 1, '5min': 5, '15min': 15, '30min': 30,
-        '60min': 60, '240min': 240, 'weekly': 240, 'monthly': 240,
+        '60min': 60, '240min': 240,
     }
 
     @classmethod
-    def fetch(cls, code: str, period: str, datalen: int = 1500) -> List[Dict]:
+    def build_request(cls, code: str, period: str, datalen: int) -> Optional[Tuple[str, Dict]]:
+        scale = cls.SCALE_MAP.get(period)
+        if scale is None:
+            return None  # 周线/月线由日线合成（见 fetch_kline_derived）
         prefix = cls.get_market_prefix(code)
-        scale = cls.SCALE_MAP.get(period, 240)
         url = (
             "https://quotes.sina.cn/cn/api/json_v2.php/"
             "CN_MarketDataService.getKLineData"
             f"?symbol={prefix}{code}&scale={scale}&ma=no&datalen={datalen}"
         )
-        raw = cls._request(url, {
+        return url, {
             "Referer": "https://finance.sina.com.cn",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        })
+        }
+
+    @classmethod
+    def parse(cls, raw: bytes, code: str, period: str) -> BarSeries:
         data = json.loads(raw.decode("utf-8"))
         if not isinstance(data, list):
-            return []
-        return [{"day": d["day"], "open": d["open"], "high": d["high"],
-                 "low": d["low"], "close": d["close"], "volume": d["volume"]}
-                for d in data]
+            return BarSeries()
+        return BarSeries.from_dicts(data)
 
 
 class EastmoneyKline(KlineSource):
     """东方财富K线"""
 
+    STORE_KEY = 'eastmoney'
+
     KLT_MAP = {
         '1min': 1, '5min': 5, '15min': 15, '30min': 30,
         '60min': 60, '240min': 101, 'weekly': 102, 'monthly': 103,
     }
 
     @classmethod
-    def fetch(cls, code: str, period: str, datalen: int = 1500) -> List[Dict]:
+    def build_request(cls, code: str, period: str, datalen: int) -> Optional[Tuple[str, Dict]]:
         market = 1 if code.startswith('6') else 0
         klt = cls.KLT_MAP.get(period, 101)
         url = (
@@ -267,53 +305,65 @@ class EastmoneyKline(KlineSource):
             f"&klt={klt}&fqt=1&end=20500101&lmt={datalen}"
             f"&_={int(time.time()*1000)}"
         )
-        raw = cls._request(url, {
+        return url, {
             "Referer": "https://quote.eastmoney.com",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        })
+        }
+
+    @classmethod
+    def parse(cls, raw: bytes, code: str, period: str) -> BarSeries:
         resp = json.loads(raw.decode("utf-8"))
         klines = resp.get('data', {}).get('klines', []) if resp.get('data') else []
-        result = []
+        result = BarSeries()
         for line in klines:
             parts = line.split(',')
             if len(parts) >= 6:
-                result.append({
-                    "day": parts[0], "open": parts[1], "high": parts[3],
-                    "low": parts[4], "close": parts[2], "volume": parts[5],
-                })
+                try:
+                    result.append(parts[0], float(parts[1]), float(parts[3]),
+                                  float(parts[4]), float(parts[2]), float(parts[5]))
+                except ValueError:
+                    continue
         return result
 
 
 class TencentKline(KlineSource):
     """腾讯财经K线（日线/周线/月线）"""
 
+    STORE_KEY = 'tencent'
+
     KTYPE_MAP = {
         '240min': 'day', 'weekly': 'week', 'monthly': 'month',
     }
 
     @classmethod
-    def fetch(cls, code: str, period: str, datalen: int = 1500) -> List[Dict]:
+    def build_request(cls, code: str, period: str, datalen: int) -> Optional[Tuple[str, Dict]]:
         ktype = cls.KTYPE_MAP.get(period)
         if not ktype:
-            return []  # 腾讯不支持分钟K线
+            return None  # 腾讯不支持分钟K线
         prefix = cls.get_market_prefix(code)
         url = (
             f"https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?"
             f"param={prefix}{code},{ktype},,,{datalen},qfq"
         )
-        raw = cls._request(url, {
+        return url, {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        })
+        }
+
+    @classmethod
+    def parse(cls, raw: bytes, code: str, period: str) -> BarSeries:
+        ktype = cls.KTYPE_MAP.get(period)
+        prefix = cls.get_market_prefix(code)
         resp = json.loads(raw.decode("utf-8"))
         kdata = resp.get('data', {}).get(f'{prefix}{code}', {})
         day_data = kdata.get(ktype, kdata.get(f'qfq{ktype}', []))
-        result = []
+        result = BarSeries()
         for d in day_data:
             if len(d) >= 6:
-                result.append({
-                    "day": d[0], "open": str(d[1]), "high": str(d[3]),
-                    "low": str(d[4]), "close": str(d[2]), "volume": str(d[5]),
-                })
+                try:
+                    result.append(d[0], float(d[1]), float(d[3]),
+                                  float(d[4]), float(d[2]), float(d[5]))
+                except (ValueError, TypeError):
+                    continue
         return result
 
 
@@ -324,6 +374,12 @@ _SOURCES_MINUTE = [SinaKline]
 _SOURCES_DAILY = [TencentKline]
 
 
+def sources_for_period(period: str) -> List[type]:
+    """周期对应的数据源列表（分钟线/日线两族，各自独立限速，可同时扫描互不占用额度）"""
+    is_minute = period in ('1min', '5min', '15min', '30min', '60min')
+    return _SOURCES_MINUTE if is_minute else _SOURCES_DAILY
+
+
 # ==================== 环境检测 ====================
 def _is_ci() -> bool:
     """检测是否在 CI/GitHub Actions 环境中运行"""
@@ -340,6 +396,7 @@ def _get_env_config() -> dict:
             'max_per_sec': 18.0,       # CI跨境延迟高，放宽限速
             'max_workers_minute': 10,   # 分钟线线程数
             'max_workers_daily': 14,    # 日线线程数
+            'async_in_flight': 64,      # 异步模式同时在途请求数（跨境往返长，多挂一些请求填满速率）
             'env_name': 'CI/GitHub Actions',
         }
     else:
@@ -347,6 +404,7 @@ def _get_env_config() -> dict:
             'max_per_sec': 30.0,       # 本地国内直连，保守限速
             'max_workers_minute': 4,    # 本地线程数
             'max_workers_daily': 6,     # 本地线程数
+            'async_in_flight': 16,      # 异步模式同时在途请求数
             'env_name': '本地',
         }
 
@@ -364,18 +422,24 @@ def _record_throttle(src_name: str):
         _throttle_counts[src_name] = _throttle_counts.get(src_name, 0) + 1
 
 
-def get_throttle_summary() -> str:
-    """返回限流统计摘要，无限流返回空字符串"""
+def get_throttle_summary(sources: Optional[List[str]] = None) -> str:
+    """返回限流统计摘要（sources 指定时只统计这些数据源），无限流返回空字符串"""
     with _throttle_lock:
-        if not _throttle_counts:
+        parts = [f"{name} {cnt}次" for name, cnt in _throttle_counts.items()
+                 if sources is None or name in sources]
+        if not parts:
             return ""
-        parts = [f"{name} {cnt}次" for name, cnt in _throttle_counts.items()]
         return "数据源限流: " + ", ".join(parts)
 
 
-def reset_throttle_counts():
+def reset_throttle_counts(sources: Optional[List[str]] = None):
+    """清零限流计数（sources 指定时只清这些数据源，多周期并行扫描时互不干扰）"""
     with _throttle_lock:
-        _throttle_counts.clear()
+        if sources is None:
+            _throttle_counts.clear()
+        else:
+            for name in sources:
+                _throttle_counts.pop(name, None)
 
 
 class SourceRateLimiter:
@@ -410,6 +474,16 @@ class SourceRateLimiter:
                 time.sleep(wait_interval - elapsed)
             lim['last_time'] = time.time()
 
+    def reserve(self, src_name: str) -> float:
+        """预约下一个请求时刻，返回需要等待的秒数（不阻塞，供 asyncio 侧 await asyncio.sleep 使用）。
+        与 wait 共用同一份 last_time/backoff，线程和协程混用时总速率仍受同一限制"""
+        lim = self._get_limiter(src_name)
+        with lim['lock']:
+            now = time.time()
+            start = max(now, lim['last_time'] + self._interval + lim['backoff'])
+            lim['last_time'] = start
+            return start - now
+
     def report_throttled(self, src_name: str):
         """报告某数据源被限流，增加退避时间（最大8秒）"""
         lim = self._get_limiter(src_name)
@@ -419,6 +493,10 @@ class SourceRateLimiter:
             else:
                 lim['backoff'] = min(lim['backoff'] * 2, 8.0)
 
+    def backoff(self, src_name: str) -> float:
+        """某数据源当前的退避时间（秒），0 表示未被限流"""
+        return self._get_limiter(src_name)['backoff']
+
     def report_success(self, src_name: str):
         """请求成功，逐步减少退避时间"""
         lim = self._get_limiter(src_name)
@@ -433,44 +511,1534 @@ class SourceRateLimiter:
 _rate_limiter = SourceRateLimiter(max_per_sec=_env_config['max_per_sec'])
 
 
+def _is_throttle_error(e: Exception) -> bool:
+    """检测限流：HTTP 456(新浪)、连接断开(东财)、403等"""
+    err_str = str(e)
+    return '456' in err_str or 'RemoteDisconnected' in err_str or '403' in err_str or '429' in err_str
+
+
+class FetchFailed(Exception):
+    """所有数据源的请求都出错（限流 456/403/429、断连、超时等），没有任何数据源给出应答。
+    与“数据源应答了但K线不足”（新股、停牌太久，返回空K线）区分：前者稍后重试可能成功，批量选股会延后重试"""
+
+    def __init__(self, code: str, period: str, errors: List[str]):
+        super().__init__(f"{code} {period} 全部数据源请求失败: {'; '.join(errors)}")
+        self.code = code
+        self.period = period
+        self.errors = errors
+
+
 def fetch_kline_with_fallback(code: str, period: str, source_idx: int = 0,
-                              datalen: int = 1500) -> List[Dict]:
+                              datalen: int = 1500, min_len: int = 31) -> BarSeries:
     """
     从指定数据源获取K线，失败自动切换下一个数据源。
     source_idx 用于在多线程中分散到不同数据源。
     每个数据源请求前会受速率限制，被限流后自动指数退避。
-    收到停止信号时立即中止。
+    收到停止信号时立即中止（返回空K线）。
+    min_len: 少于该根数视为无效数据（增量请求只取最新几根时调小）
+    所有数据源都请求出错时抛出 FetchFailed；有数据源应答但K线不足时返回空K线
     """
     if _stop_event.is_set():
-        return []
-
-    is_minute = period in ('1min', '5min', '15min', '30min', '60min')
-    sources = _SOURCES_MINUTE if is_minute else _SOURCES_DAILY
+        return BarSeries()
 
+    sources = sources_for_period(period)
     order = [sources[(source_idx + i) % len(sources)] for i in range(len(sources))]
 
+    errors = []
     for src in order:
         src_name = src.__name__
         try:
             _rate_limiter.wait(src_name)  # 等待速率限制（内部也检查停止信号）
             data = src.fetch(code, period, datalen)
-            if data and len(data) > 30:
+            if data and len(data) >= min_len:
                 _rate_limiter.report_success(src_name)  # 成功，减少退避
                 return data
         except StopIteration:
-            return []
+            return BarSeries()
         except Exception as e:
-            err_str = str(e)
-            # 检测限流：HTTP 456(新浪)、连接断开(东财)、403等
-            if '456' in err_str or 'RemoteDisconnected' in err_str or '403' in err_str or '429' in err_str:
+            if _is_throttle_error(e):
                 _record_throttle(src_name)
                 _rate_limiter.report_throttled(src_name)  # 限流，增加退避
+            errors.append(f"{src_name} {str(e)[:60]}")
             continue
-    return []
+    if errors and len(errors) == len(order):
+        raise FetchFailed(code, period, errors)
+    return BarSeries()
+
+
+# ==================== 增量K线（尾部缓存） ====================
+
+# 增量请求的最新K线根数：覆盖上轮未完成的最后一根 + 两轮之间新增的K线，多出的重叠部分用于核对
+_TAIL_FETCH_BARS = 8
+_TAIL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _series_values(series: BarSeries):
+    """BarSeries 的 OHLCV 列 → n×5 float64（array('d') 直接按缓冲区读取，不经 Python float）"""
+    values = np.empty((len(series), len(_TAIL_FIELDS)), dtype=np.float64)
+    for k, f in enumerate(_TAIL_FIELDS):
+        values[:, k] = np.frombuffer(getattr(series, f), dtype=np.float64)
+    return values
+
+
+class TailCache:
+    """
+    按 (代码, 周期) 缓存上一轮拉到的K线，下一轮只请求最新几根拼接到尾部（替换上轮未完成的最后一根）。
+    重叠部分（已完成的K线）必须与缓存完全一致，否则视为复权调整，整段重拉；
+    最新几根接不上缓存（停牌、两轮间隔过长）同样整段重拉。
+    K线以 numpy 数组紧凑存储（时间为定长字节串，OHLCV 为 float64），全市场数千只股票内存可控。
+    同一 (代码, 周期) 可被不同根数的请求共用（如 5分钟扫描与由 5分钟合成的 30分钟扫描）：缓存按请求过的
+    最大根数保留，每次只返回本次请求的根数。
+    """
+
+    def __init__(self):
+        self._entries = {}  # {(代码, 周期): (日期数组, OHLCV数组)}
+        self._capacity = {}  # {(代码, 周期): 请求过的最大根数}
+        self._updated = {}   # {(代码, 周期): 最近一次写入的时间戳}
+        self._lock = threading.Lock()
+        self._stats = {}    # {周期: {'incremental': 次数, 'full': 次数, 'gap': 次数, 'mismatch': 次数}}
+
+    @staticmethod
+    def _to_arrays(raw):
+        """原始K线（BarSeries 或字典列表）→ (按时间排序的日期字节数组, n×5 float64)，脏数据返回 None"""
+        if isinstance(raw, BarSeries):
+            dates = np.array([d.encode() for d in raw.day])
+            values = _series_values(raw)
+        else:
+            try:
+                dates = np.array([(d.get("day") or d.get("date")).encode() for d in raw])
+                values = np.array([[float(d[f]) for f in _TAIL_FIELDS] for d in raw], dtype=np.float64)
+            except (KeyError, ValueError, TypeError, AttributeError):
+                return None
+        order = np.argsort(dates, kind='stable')
+        return dates[order], values.reshape(-1, len(_TAIL_FIELDS))[order]
+
+    @staticmethod
+    def _to_raw(dates, values) -> BarSeries:
+        return BarSeries.from_columns(dates.astype(str).tolist(), values)
+
+    def _count(self, period: str, key: str):
+        with self._lock:
+            stats = self._stats.setdefault(period, {'incremental': 0, 'full': 0, 'gap': 0, 'mismatch': 0,
+                                                    'reused': 0, 'snapshot': 0})
+            stats[key] += 1
+
+    def has(self, code: str, period: str, datalen: int = 0) -> bool:
+        """是否有缓存，且缓存的根数足够 datalen（不够时调用方应整段重拉）"""
+        with self._lock:
+            return (code, period) in self._entries and self._capacity.get((code, period), 0) >= datalen
+
+    def fresh(self, code: str, period: str, datalen: int, max_age: float) -> Optional[BarSeries]:
+        """max_age 秒内刚更新过、且根数足够 datalen 的缓存K线（最新 datalen 根）；否则返回 None"""
+        key = (code, period)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None or self._capacity.get(key, 0) < datalen
+                    or time.time() - self._updated.get(key, 0) > max_age):
+                return None
+        dates, values = entry
+        return self._to_raw(dates[-datalen:], values[-datalen:])
+
+    def _put(self, key, dates, values, capacity: int):
+        """写入缓存（调用方持锁）"""
+        self._entries[key] = (dates, values)
+        self._capacity[key] = max(self._capacity.get(key, 0), capacity)
+        self._updated[key] = time.time()
+
+    def get(self, code: str, period: str):
+        with self._lock:
+            return self._entries.get((code, period))
+
+    def seed(self, code: str, period: str, days: List[str], values):
+        """用本地K线库的数据预热缓存（days 已按时间升序，values 为 n×5 OHLCV）"""
+        dates = np.array([d.encode() for d in days])
+        with self._lock:
+            self._put((code, period), dates, np.asarray(values, dtype=np.float64), len(days))
+            self._updated[(code, period)] = 0.0  # 本地库的数据可能是几天前的，不算刚从数据源更新过
+
+    def store(self, code: str, period: str, raw, datalen: int = 0) -> Optional[BarSeries]:
+        """整段K线（请求了 datalen 根）写入缓存（替换旧内容），返回按时间排序的K线"""
+        arrays = self._to_arrays(raw)
+        if arrays is None:
+            return None
+        with self._lock:
+            self._put((code, period), *arrays, max(datalen, len(arrays[0])))
+        return self._to_raw(*arrays)
+
+    def splice(self, code: str, period: str, tail, datalen: int) -> Optional[BarSeries]:
+        """最新几根K线拼接到缓存尾部；缓存缺失/接不上/重叠不一致时返回 None（调用方整段重拉）"""
+        with self._lock:
+            entry = self._entries.get((code, period))
+        if entry is None:
+            return None
+        new = self._to_arrays(tail)
+        if new is None:
+            return None
+        dates, values = entry
+        tail_dates, tail_values = new
+
+        # 最新几根的第一根必须在缓存里，且至少与缓存重叠一根已完成的K线（用于核对复权）
+        p = int(np.searchsorted(dates, tail_dates[0]))
+        overlap = len(dates) - p
+        if p >= len(dates) or dates[p] != tail_dates[0] or overlap < 2:
+            self._count(period, 'gap')
+            return None
+        if overlap > len(tail_dates) or (tail_dates[:overlap] != dates[p:]).any():
+            self._count(period, 'mismatch')
+            return None
+        # 缓存最后一根可能是上轮未完成的K线，只核对之前已完成的部分
+        if not np.array_equal(tail_values[:overlap - 1], values[p:-1]):
+            self._count(period, 'mismatch')
+            return None
+
+        with self._lock:
+            keep = max(datalen, self._capacity.get((code, period), 0))
+            dates = np.concatenate([dates[:p], tail_dates])[-keep:]
+            values = np.concatenate([values[:p], tail_values])[-keep:]
+            self._put((code, period), dates, values, datalen)
+        self._count(period, 'incremental')
+        return self._to_raw(dates[-datalen:], values[-datalen:])
+
+    def with_today(self, code: str, period: str, day: str, bar: Optional[Tuple[float, ...]],
+                   datalen: int) -> Optional[BarSeries]:
+        """
+        缓存的历史K线 + 当天这根（day 日期，bar 为 OHLCV；None 表示当天无成交，如停牌）替换缓存里的当天K线。
+        缓存须在 day 当天（北京时间）从数据源更新过且根数足够，保证 day 之前的交易日没有缺口；否则返回 None
+        """
+        key = (code, period)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._capacity.get(key, 0) < datalen:
+                return None
+            if time.strftime('%Y-%m-%d', time.gmtime(self._updated.get(key, 0) + 8 * 3600)) != day:
+                return None
+        dates, values = entry
+        p = int(np.searchsorted(dates, day.encode()))
+        dates, values = dates[:p], values[:p]
+        if bar is not None:
+            dates = np.concatenate([dates, np.array([day.encode()])])
+            values = np.concatenate([values, np.array([bar], dtype=np.float64)])
+        with self._lock:
+            self._put(key, dates, values, datalen)
+        return self._to_raw(dates[-datalen:], values[-datalen:])
+
+    def summary(self, period: str) -> str:
+        """返回某周期的增量命中统计摘要，无记录返回空字符串"""
+        with self._lock:
+            stats = self._stats.get(period)
+            if not stats:
+                return ""
+            text = (f"增量K线: 增量 {stats['incremental']} 次, 整段 {stats['full']} 次"
+                    f"（接不上 {stats['gap']}, 复权不一致 {stats['mismatch']}）")
+            if stats['reused']:
+                text += f", 合成复用缓存 {stats['reused']} 次"
+            if stats['snapshot']:
+                text += f", 快照合成当日K线 {stats['snapshot']} 次"
+            return text
+
+    def reset_stats(self, period: str):
+        with self._lock:
+            self._stats.pop(period, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._capacity.clear()
+            self._updated.clear()
+            self._stats.clear()
+
+
+_tail_cache = TailCache()
+
+
+def _get_bar_store():
+    """本地K线库（bar_store.py）；不可用或已关闭（BAR_STORE_DIR=off）时返回 None"""
+    try:
+        import bar_store
+    except ImportError:
+        return None
+    return bar_store.get_store()
+
+
+def _store_source(period: str) -> str:
+    """本周期K线在本地K线库中的数据源分组（进程内缓存的K线均来自本周期的数据源列表）"""
+    return '+'.join(src.STORE_KEY for src in sources_for_period(period))
+
+
+def _seed_from_bar_store(code: str, period: str, datalen: int) -> int:
+    """
+    进程内缓存为空时（如监控重启后）用本地K线库预热，返回需要补拉的最新K线根数；
+    本地库没有足够数据或缺得太多时返回 0（整段拉取）
+    """
+    store = _get_bar_store()
+    if store is None:
+        return 0
+    import bar_store
+    records = store.read(code, period, _store_source(period), last=datalen)
+    if len(records) < datalen:
+        return 0
+    missing = bar_store.estimate_missing_bars(int(records['t'][-1]), period)
+    if missing >= datalen:
+        return 0
+    days = [bar_store.decode_time(t, period) for t in records['t'].tolist()]
+    values = np.column_stack([records[f] for f in _TAIL_FIELDS])
+    _tail_cache.seed(code, period, days, values)
+    return max(missing, _TAIL_FETCH_BARS)
+
+
+def _save_to_bar_store(code: str, period: str, tail: Optional[List[Dict]] = None):
+    """缓存写回本地K线库：优先只写最新几根（与库尾重叠核对），不行再与库中已有K线合并"""
+    store = _get_bar_store()
+    entry = _tail_cache.get(code, period)
+    if store is None or entry is None:
+        return
+    import bar_store
+    try:
+        source = _store_source(period)
+        if tail and store.write_tail(code, period, source, bar_store.from_kline_bars(tail)):
+            return
+        dates, values = entry
+        store.merge(code, period, source, bar_store.from_arrays(dates.astype(str).tolist(), values))
+    except (KeyError, ValueError, TypeError, OSError):
+        pass  # 本地库只是加速手段，写失败不影响选股
+
+
+def fetch_kline_incremental(code: str, period: str, source_idx: int = 0,
+                            datalen: int = 1500) -> BarSeries:
+    """
+    增量获取K线：已有缓存时只请求最新 _TAIL_FETCH_BARS 根拼接到尾部，
+    无缓存、接不上或复权不一致时整段重拉 datalen 根并写入缓存。返回按时间排序的K线
+    进程内缓存为空时先尝试用本地K线库预热，结果同步写回本地库
+    """
+    if np is None:
+        return fetch_kline_with_fallback(code, period, source_idx, datalen=datalen)
+
+    tail_len = _TAIL_FETCH_BARS if _tail_cache.has(code, period, datalen) else \
+        _seed_from_bar_store(code, period, datalen)
+    if tail_len:
+        tail = fetch_kline_with_fallback(code, period, source_idx,
+                                         datalen=tail_len, min_len=2)
+        if not tail:
+            return BarSeries()  # 请求失败（多为限流），本轮不再整段重拉加重负担
+        spliced = _tail_cache.splice(code, period, tail, datalen)
+        if spliced is not None:
+            _save_to_bar_store(code, period, tail)
+            return spliced
+
+    raw = fetch_kline_with_fallback(code, period, source_idx, datalen=datalen)
+    if not raw:
+        return raw
+    _tail_cache._count(period, 'full')
+    result = _tail_cache.store(code, period, raw, datalen)
+    if result is None:
+        return raw
+    _save_to_bar_store(code, period)
+    return result
+
+
+def get_tail_cache_summary(period: str) -> str:
+    return _tail_cache.summary(period)
+
+
+def reset_tail_cache_stats(period: str):
+    _tail_cache.reset_stats(period)
+
+
+# ==================== 异步K线获取（asyncio） ====================
+# 单线程内同时挂起大量请求：限速沿用 _rate_limiter（与线程模式共用令牌），数据源顺序与
+# fetch_kline_with_fallback 一致。HTTP 用 asyncio 流手写最小 GET（标准库没有异步 HTTP 客户端）。
+
+class _AsyncStopped(Exception):
+    """协程内的停止信号（协程里不能用 StopIteration）"""
+
+
+async def _async_check_control():
+    """异步版 check_control：暂停时让出事件循环轮询等待，停止时抛出 _AsyncStopped"""
+    while not _pause_event.is_set():
+        await asyncio.sleep(0.2)
+    if _stop_event.is_set():
+        raise _AsyncStopped()
+
+
+async def _read_http_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                await reader.readline()
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    return await reader.read()
+
+
+# 异步请求共用：与 http_pool 一致不校验证书（只建一次，不再每个请求新建 SSLContext）
+_async_ssl_context = ssl._create_unverified_context()
+# 空闲长连接按事件循环分开：{事件循环: {(主机, 端口, https): [(reader, writer, 放回时间)]}}。
+# 连接只能在所属事件循环里使用，多个线程各跑一个 asyncio.run 扫描（监控多周期并行）时互不取用；
+# 事件循环结束后条目随之回收，扫描结束前由 _async_close_idle 关闭本循环的空闲连接
+_async_idle = weakref.WeakKeyDictionary()
+_async_idle_lock = threading.Lock()
+
+
+def _async_idle_pool() -> Dict[Tuple[str, int, bool], List]:
+    """当前事件循环的空闲连接池（不存在则新建）"""
+    loop = asyncio.get_running_loop()
+    with _async_idle_lock:
+        pool = _async_idle.get(loop)
+        if pool is None:
+            pool = _async_idle[loop] = {}
+        return pool
+
+
+async def _async_close(writer: asyncio.StreamWriter, abort: bool = False):
+    """关闭连接并等待关闭完成；出错/超时时 abort 直接断开，不等 TLS 关闭握手"""
+    if abort:
+        writer.transport.abort()
+        return
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), 1)
+    except (OSError, asyncio.TimeoutError):
+        pass
+
+
+async def _async_checkout(key: Tuple[str, int, bool]):
+    """取一条本事件循环内未过期的空闲连接（返回 (reader, writer, 是否复用)），没有则新建；过期的关闭"""
+    idle = _async_idle_pool().get(key, [])
+    while idle:
+        reader, writer, last_used = idle.pop()
+        if time.time() - last_used < http_pool.IDLE_TIMEOUT and not reader.at_eof():
+            return reader, writer, True
+        await _async_close(writer, abort=True)
+    host, port, https = key
+    reader, writer = await asyncio.open_connection(host, port, ssl=_async_ssl_context if https else None)
+    return reader, writer, False
+
+
+async def _async_close_idle():
+    """关闭本事件循环的全部空闲连接（asyncio.run 结束前调用；其他事件循环的连接不动）"""
+    loop = asyncio.get_running_loop()
+    with _async_idle_lock:
+        pool = _async_idle.pop(loop, {})
+    for conns in pool.values():
+        for _, writer, _ in conns:
+            await _async_close(writer)
+
+
+async def _async_get_once(url: str, headers: dict):
+    """发一次 GET（HTTP/1.1 长连接），返回 (状态码, 原因, 响应头(小写键), 解压后的响应体)"""
+    parts = urllib.parse.urlsplit(url)
+    https = parts.scheme == 'https'
+    key = (parts.hostname, parts.port or (443 if https else 80), https)
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    lines = [f"GET {path} HTTP/1.1", f"Host: {parts.hostname}", "Accept-Encoding: gzip, deflate"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+    for attempt in range(2):
+        reader, writer, reused = await _async_checkout(key)
+        done = keep = False
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line:
+                raise http.client.RemoteDisconnected("Remote end closed connection without response")
+            version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            resp_headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                resp_headers[name.strip().lower()] = value.strip()
+            wire = await _read_http_body(reader, resp_headers)
+            # 有明确长度的响应且服务端未要求关闭时放回复用（无长度的响应体读到 EOF 为止，连接已不可用）
+            keep = (version == 'HTTP/1.1' and resp_headers.get('connection', '').lower() != 'close'
+                    and ('content-length' in resp_headers
+                         or resp_headers.get('transfer-encoding', '').lower() == 'chunked'))
+            done = True
+        except (http.client.RemoteDisconnected, ConnectionError, asyncio.IncompleteReadError):
+            if reused and attempt == 0:
+                continue  # 复用的连接已被服务端关闭（keep-alive 超时），换新连接重试一次
+            raise
+        finally:
+            if keep:
+                _async_idle_pool().setdefault(key, []).append((reader, writer, time.time()))
+            else:
+                await _async_close(writer, abort=not done)
+        body = http_pool.decode_body(wire, resp_headers.get('content-encoding'))
+        http_pool.get_pool().record_response(len(wire), len(body), reused)
+        return int(status), reason, resp_headers, body
+
+
+async def _async_request(url: str, headers: dict, timeout: int = 12) -> bytes:
+    """异步 GET，跟随重定向；非 2xx 抛 urllib.error.HTTPError（与 http_pool.HTTPPool.get 一致，限流检测通用）"""
+
+    async def _do() -> bytes:
+        nonlocal url
+        for _ in range(http_pool.MAX_REDIRECTS + 1):
+            status, reason, resp_headers, body = await _async_get_once(url, headers)
+            if status in (301, 302, 303, 307, 308) and resp_headers.get('location'):
+                url = urllib.parse.urljoin(url, resp_headers['location'])
+                continue
+            if not 200 <= status < 300:
+                raise urllib.error.HTTPError(url, status, reason, resp_headers, None)
+            return body
+        raise urllib.error.HTTPError(url, status, reason, resp_headers, None)
+
+    return await asyncio.wait_for(_do(), timeout)
+
+
+async def fetch_kline_async(code: str, period: str, source_idx: int = 0,
+                            datalen: int = 1500, min_len: int = 31) -> BarSeries:
+    """fetch_kline_with_fallback 的协程版：数据源顺序、限速、限流退避、停止检查、FetchFailed 完全相同"""
+    if _stop_event.is_set():
+        return BarSeries()
+
+    sources = sources_for_period(period)
+    order = [sources[(source_idx + i) % len(sources)] for i in range(len(sources))]
+
+    errors = []
+    for src in order:
+        src_name = src.__name__
+        try:
+            await asyncio.sleep(_rate_limiter.reserve(src_name))
+            if _stop_event.is_set():
+                return BarSeries()
+            req = src.build_request(code, period, datalen)
+            if req is None:
+                continue
+            url, headers = req
+            data = src.parse(await _async_request(url, headers), code, period)
+            if data and len(data) >= min_len:
+                _rate_limiter.report_success(src_name)
+                return data
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _is_throttle_error(e):
+                _record_throttle(src_name)
+                _rate_limiter.report_throttled(src_name)
+            errors.append(f"{src_name} {str(e)[:60]}")
+            continue
+    if errors and len(errors) == len(order):
+        raise FetchFailed(code, period, errors)
+    return BarSeries()
+
+
+async def fetch_kline_incremental_async(code: str, period: str, source_idx: int = 0,
+                                        datalen: int = 1500) -> BarSeries:
+    """fetch_kline_incremental 的协程版（尾部缓存、本地K线库预热与写回逻辑相同）"""
+    if np is None:
+        return await fetch_kline_async(code, period, source_idx, datalen=datalen)
+
+    tail_len = _TAIL_FETCH_BARS if _tail_cache.has(code, period, datalen) else \
+        _seed_from_bar_store(code, period, datalen)
+    if tail_len:
+        tail = await fetch_kline_async(code, period, source_idx, datalen=tail_len, min_len=2)
+        if not tail:
+            return BarSeries()
+        spliced = _tail_cache.splice(code, period, tail, datalen)
+        if spliced is not None:
+            _save_to_bar_store(code, period, tail)
+            return spliced
+
+    raw = await fetch_kline_async(code, period, source_idx, datalen=datalen)
+    if not raw:
+        return raw
+    _tail_cache._count(period, 'full')
+    result = _tail_cache.store(code, period, raw, datalen)
+    if result is None:
+        return raw
+    _save_to_bar_store(code, period)
+    return result
+
+
+# ==================== 形态提示（扫描排序） ====================
+
+def _max_daily_gain(code: str) -> float:
+    """单日收盘价最大倍数（按最宽松的板块估计：北交所 30%，其余取创业板/科创板的 20%）"""
+    return 1.3 if code[:1] in ('4', '8') or code[:2] == '92' else 1.2
+
+
+class PatternHints:
+    """
+    按 (周期, 代码) 记录上一轮扫描时每只股票的形态状态，用于：
+    1. 排序：下一轮按形态阶段从高到低提交任务，已出信号/等确认阳的股票排在最前，严格/筑底信号在一轮开头几秒内
+       就能推送；没有记录的股票（首轮、新股）排在有形态的股票之后、无形态的之前。
+    2. 观察名单（skip_unviable）：没有有效金叉的股票，出信号至少要 新金叉→阴线→倍量阳→确认阳 四根K线，
+       新金叉又要等 MA20 追上 MA30（按涨跌停上限可算出最少几根）。状态里记下“最后一根K线之后最早第几根
+       可能出信号”，本轮新出的K线数达不到就不必请求和判定。
+    状态（可 JSON 序列化）：
+      stage    形态阶段（NONE/GOLD/DOUBLE/CONFIRM/SIGNAL）
+      bar      判定时最后一根K线的时间（可能未走完）
+      earliest 该根之后最早第几根可能出信号（0 = 随时可能，不跳过）
+      gold / dead  最近一次金叉/死叉日期（已走完的K线），gap  MA20-MA30 相对收盘价的距离
+    启用本地K线库时每个周期的状态存为 <K线库>/pattern_state/<周期>.json，进程重启后首轮即可跳过。
+    """
+
+    NONE, GOLD, DOUBLE, CONFIRM, SIGNAL = range(5)
+    LABELS = {GOLD: '近期金叉', DOUBLE: '已见倍量阳', CONFIRM: '待确认', SIGNAL: '上轮信号'}
+    _UNKNOWN_RANK = 0.5
+
+    def __init__(self):
+        self._states = {}   # {周期: {代码: 状态字典}}
+        self._deferred = {}  # {周期: 上一轮因时间预算用尽未扫到的代码}
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def empty(cls) -> Dict:
+        """数据缺失/过期时的状态：无形态、不跳过"""
+        return {'stage': cls.NONE, 'bar': None, 'earliest': 0, 'gold': None, 'dead': None, 'gap': None}
+
+    def record(self, period: str, code: str, state: Dict):
+        with self._lock:
+            self._states.setdefault(period, {})[code] = state
+
+    def get(self, period: str, code: str) -> Optional[Dict]:
+        with self._lock:
+            return self._states.get(period, {}).get(code)
+
+    def order(self, period: str, tasks: List[Tuple[int, str, str]]) -> List[Tuple[int, str, str]]:
+        """任务 (序号, 代码, 名称) 按上一轮形态阶段降序重排（稳定排序）；
+        同阶段内上一轮被顺延的股票排在前面，预算持续不够时各股票轮流被扫到，不会总是同一批落空"""
+        with self._lock:
+            stages = {code: st['stage'] for code, st in self._states.get(period, {}).items()}
+            deferred = self._deferred.get(period, set())
+        if not stages and not deferred:
+            return tasks
+        return sorted(tasks, key=lambda t: (-stages.get(t[1], self._UNKNOWN_RANK), t[1] not in deferred))
+
+    def defer(self, period: str, codes: List[str]):
+        """记下本轮因时间预算用尽未扫到的股票（替换上一轮的记录）"""
+        with self._lock:
+            self._deferred[period] = set(codes)
+
+    def viable(self, period: str, code: str, now=None) -> bool:
+        """本轮是否可能出信号：无记录或 earliest 已到返回 True；能证明本轮不可能出信号才返回 False"""
+        state = self.get(period, code)
+        if not state or not state.get('earliest') or not state.get('bar'):
+            return True
+        try:
+            return bar_resample.max_bars_since(state['bar'], period, now) >= state['earliest']
+        except (ValueError, IndexError):
+            return True
+
+    def triggers(self, period: str) -> Dict[str, List]:
+        """处于确认窗口内、带盘中触发价位的股票 {代码: [K线日期, 最低收盘价, 最低成交量]}"""
+        with self._lock:
+            return {code: st['trigger'] for code, st in self._states.get(period, {}).items() if st.get('trigger')}
+
+    def summary(self, period: str) -> str:
+        """各形态阶段的股票数，无记录返回空字符串"""
+        with self._lock:
+            stages = [st['stage'] for st in self._states.get(period, {}).values()]
+        parts = [f"{label} {stages.count(stage)}" for stage, label in sorted(self.LABELS.items(), reverse=True)
+                 if stages.count(stage)]
+        return "优先扫描: " + ", ".join(parts) if parts else ""
+
+    # ---------- 持久化 ----------
+
+    @staticmethod
+    def _path(period: str) -> Optional[str]:
+        store = _get_bar_store()
+        if store is None:
+            return None
+        return os.path.join(store.root, 'pattern_state', f"{period}.json")
+
+    def load(self, period: str):
+        """从本地读入某周期的状态（每个周期只读一次，进程内已有的记录优先）"""
+        with self._lock:
+            if period in self._loaded:
+                return
+            self._loaded.add(period)
+        path = self._path(period)
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            states = self._states.setdefault(period, {})
+            for code, state in saved.items():
+                states.setdefault(code, state)
+
+    def save(self, period: str):
+        """写回某周期的状态（临时文件 + os.replace，写失败不影响选股）"""
+        path = self._path(period)
+        if not path:
+            return
+        with self._lock:
+            states = dict(self._states.get(period, {}))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(states, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._deferred.clear()
+            self._loaded.clear()
+
+
+_pattern_hints = PatternHints()
+
+
+# ==================== 判定结果缓存 ====================
+
+MEMO_MAX_ENTRIES = 20000   # 约 4 个周期 × 全市场
+MEMO_MAX_AGE = 6 * 3600    # 秒，超过即视为过期（跨交易日的记录不再复用）
+
+
+class ResultMemo:
+    """
+    按 (代码, 周期, 判定参数, 最后一根K线时间, K线摘要) 缓存判定结果 (普通, 严格, details, 最后K线时间) 及形态状态。
+    判定参数（窗口、容差、开口阈值、均线参数，见 StrictStockScreener.memo_params）在键里，
+    同一进程内参数不同的选股器不会共用判定结果。
+    日线盘中各检查点之间、停牌股、合成周期没出新K线时，本轮拿到的K线与上一轮完全相同，
+    命中后不再做均线预计算和信号判定。摘要取整段 OHLCV 与时间（blake2b，千根K线约几十微秒），
+    任何一根K线的数值变化（未走完K线的最新价、复权）都会换成新键，不会返回过期结果。
+    条目按写入先后淘汰：超过 MEMO_MAX_ENTRIES 或早于 MEMO_MAX_AGE 秒的丢弃。
+    """
+
+    def __init__(self, max_entries: int = MEMO_MAX_ENTRIES, max_age: float = MEMO_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()   # {键: (写入时刻, 结果, 形态状态)}
+        self._stats = {}                # {周期: {'hit': n, 'miss': n}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(code: str, period: str, raw, params: Tuple = ()) -> Optional[Tuple]:
+        """K线的缓存键（params 为选股器的判定参数）；非 BarSeries 或为空时返回 None（不缓存）"""
+        if not isinstance(raw, BarSeries) or not len(raw):
+            return None
+        h = hashlib.blake2b(digest_size=16)
+        for f in _TAIL_FIELDS:
+            h.update(getattr(raw, f))
+        h.update('\n'.join(raw.day).encode())
+        return code, period, params, raw.day[-1], h.digest()
+
+    def get(self, key: Optional[Tuple]) -> Optional[Tuple]:
+        """命中返回 (结果, 形态状态)，details 为副本（调用方会往里追加字段）"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.max_age:
+                del self._entries[key]
+                entry = None
+            self._count(key[1], 'hit' if entry else 'miss')
+        if entry is None:
+            return None
+        normal, strict, details, last_bar = entry[1]
+        return (normal, strict, dict(details), last_bar), entry[2]
+
+    def put(self, key: Optional[Tuple], result: Tuple, state: Optional[Dict] = None):
+        if key is None:
+            return
+        normal, strict, details, last_bar = result
+        now = time.time()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now, (normal, strict, dict(details), last_bar), state)
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if len(self._entries) <= self.max_entries and now - oldest[0] <= self.max_age:
+                    break
+                self._entries.popitem(last=False)
+
+    def _count(self, period: str, field: str):
+        stats = self._stats.setdefault(period, {'hit': 0, 'miss': 0})
+        stats[field] += 1
+
+    def summary(self, period: str) -> str:
+        """某周期的命中统计，没有命中返回空字符串"""
+        with self._lock:
+            stats = self._stats.get(period)
+        if not stats or not stats['hit']:
+            return ""
+        return f"判定缓存: 命中 {stats['hit']} / {stats['hit'] + stats['miss']} 只（K线与上轮相同，未重算）"
+
+    def reset_stats(self, period: str):
+        with self._lock:
+            self._stats.pop(period, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_result_memo = ResultMemo()
+
+
+# ==================== 合成周期K线 ====================
+# 30分钟由 5分钟、周/月线由日线在本地合成（bar_resample）。增量模式下来源周期的缓存在
+# DERIVED_MAX_AGE 秒内刚被同一轮的来源周期扫描更新过时直接复用，不再发请求。
+
+DERIVED_MAX_AGE = 300  # 来源周期缓存的最长复用时间（秒），约一根 5分钟K线
+
+
+def _resample_base(base: BarSeries, period: str, datalen: int, base_len: int) -> Optional[BarSeries]:
+    """
+    来源K线 → 合成K线（最新 datalen 根）；来源被截断时最早一根可能不完整，丢弃。
+    合成结果不足 datalen 根（数据源返回的来源K线少于请求根数，或上市不久）时返回 None，由调用方直接请求本周期
+    """
+    if not base:
+        return BarSeries()
+    bars = bar_resample.resample(base, period)
+    if len(base) >= base_len:
+        bars = bars[1:]
+    if len(bars) < datalen:
+        return None
+    return bars[-datalen:]
+
+
+def fetch_kline_derived(code: str, period: str, source_idx: int = 0, datalen: int = 1500,
+                        base_len: int = 1500, incremental: bool = False) -> BarSeries:
+    """
+    由来源周期K线合成 period K线（只请求来源周期，见 bar_resample.DERIVED_FROM）。
+    base_len: 请求的来源K线根数；incremental: 来源周期走尾部缓存（同一轮刚更新过则不发请求）
+    """
+    base_period = bar_resample.DERIVED_FROM[period]
+    base = None
+    if incremental and np is not None:
+        base = _tail_cache.fresh(code, base_period, base_len, DERIVED_MAX_AGE)
+        if base is not None:
+            _tail_cache._count(period, 'reused')
+        else:
+            base = fetch_kline_incremental(code, base_period, source_idx, datalen=base_len)
+    if base is None:
+        base = fetch_kline_with_fallback(code, base_period, source_idx, datalen=base_len)
+    bars = _resample_base(base, period, datalen, base_len)
+    if bars is not None:
+        return bars
+    if incremental and np is not None:
+        return fetch_kline_incremental(code, period, source_idx, datalen=datalen)
+    return fetch_kline_with_fallback(code, period, source_idx, datalen=datalen)
+
+
+async def fetch_kline_derived_async(code: str, period: str, source_idx: int = 0, datalen: int = 1500,
+                                    base_len: int = 1500, incremental: bool = False) -> BarSeries:
+    """fetch_kline_derived 的协程版"""
+    base_period = bar_resample.DERIVED_FROM[period]
+    base = None
+    if incremental and np is not None:
+        base = _tail_cache.fresh(code, base_period, base_len, DERIVED_MAX_AGE)
+        if base is not None:
+            _tail_cache._count(period, 'reused')
+        else:
+            base = await fetch_kline_incremental_async(code, base_period, source_idx, datalen=base_len)
+    if base is None:
+        base = await fetch_kline_async(code, base_period, source_idx, datalen=base_len)
+    bars = _resample_base(base, period, datalen, base_len)
+    if bars is not None:
+        return bars
+    if incremental and np is not None:
+        return await fetch_kline_incremental_async(code, period, source_idx, datalen=datalen)
+    return await fetch_kline_async(code, period, source_idx, datalen=datalen)
+
+
+# ==================== 行情快照（盘中合成当日K线） ====================
+# 盘中日K只有最后一根在变：历史部分取尾部缓存（当天从数据源拉过一次），当天这根由全市场行情快照合成。
+# 快照用腾讯 qt.gtimg.cn 批量行情，一次请求 QUOTE_BATCH 只，全市场约 15 次请求，代替每只一次的K线请求。
+
+QUOTE_BATCH = 300          # 单次行情请求的代码数（URL 约 3.6KB）
+SNAPSHOT_MAX_AGE = 600     # 快照最长使用时间（秒），过期视为没有快照（回退增量获取）
+
+
+class QuoteSnapshot:
+    """全市场行情快照：{代码: (日期, (开, 高, 低, 现价, 成交量), 换手率%)}，当天无成交（停牌/未开盘）时 OHLCV 为 None"""
+
+    URL = "https://qt.gtimg.cn/q="
+    SOURCE = 'TencentKline'  # 与腾讯K线共用限速额度
+
+    def __init__(self):
+        self._quotes = {}
+        self._time = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse(raw: bytes) -> Dict[str, Tuple]:
+        """
+        v_sh600000="1~名称~600000~现价~昨收~今开~成交量(手)~...";  各字段以 ~ 分隔：
+        [2]代码 [3]现价 [5]今开 [6]成交量 [30]时间 YYYYMMDDHHMMSS [33]最高 [34]最低 [38]换手率(%，缺失为 None)
+        """
+        quotes = {}
+        for line in raw.decode('gbk', errors='replace').split(';'):
+            _, _, body = line.partition('="')
+            fields = body.rstrip('"\n ').split('~')
+            if len(fields) < 35 or len(fields[30]) < 8:
+                continue
+            stamp = fields[30]
+            day = f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}"
+            try:
+                last, open_, volume = float(fields[3]), float(fields[5]), float(fields[6])
+                high, low = float(fields[33]), float(fields[34])
+            except ValueError:
+                continue
+            bar = (open_, high, low, last, volume) if open_ > 0 and volume > 0 else None
+            try:
+                turnover = float(fields[38])
+            except (ValueError, IndexError):
+                turnover = None
+            quotes[fields[2]] = (day, bar, turnover)
+        return quotes
+
+    def refresh(self, codes: List[str]) -> int:
+        """按批请求全部代码的行情，替换快照，返回请求次数（单批失败只缺这一批，对应股票回退增量获取）"""
+        quotes, requests = self.fetch(codes)
+        with self._lock:
+            self._quotes = quotes
+            self._time = time.time()
+        return requests
+
+    @classmethod
+    def fetch(cls, codes: List[str]) -> Tuple[Dict[str, Tuple], int]:
+        """按批请求行情，返回 (行情字典, 请求次数)"""
+        quotes = {}
+        requests = 0
+        for i in range(0, len(codes), QUOTE_BATCH):
+            batch = codes[i:i + QUOTE_BATCH]
+            url = cls.URL + ','.join(f"{KlineSource.get_market_prefix(c)}{c}" for c in batch)
+            try:
+                _rate_limiter.wait(cls.SOURCE)
+                requests += 1
+                raw = http_pool.http_get(url, {"Referer": "https://gu.qq.com"}, 12)
+                _rate_limiter.report_success(cls.SOURCE)
+            except StopIteration:
+                break
+            except Exception as e:
+                if _is_throttle_error(e):
+                    _record_throttle(cls.SOURCE)
+                    _rate_limiter.report_throttled(cls.SOURCE)
+                continue
+            quotes.update(cls.parse(raw))
+        return quotes, requests
+
+    def get(self, code: str) -> Optional[Tuple]:
+        with self._lock:
+            if time.time() - self._time > SNAPSHOT_MAX_AGE:
+                return None
+            return self._quotes.get(code)
+
+    def quotes(self) -> Dict[str, Tuple]:
+        """整份快照（过期返回空字典）"""
+        with self._lock:
+            if time.time() - self._time > SNAPSHOT_MAX_AGE:
+                return {}
+            return dict(self._quotes)
+
+    def age(self) -> float:
+        """距上次刷新的秒数"""
+        with self._lock:
+            return time.time() - self._time
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._quotes)
+
+
+_quote_snapshot = QuoteSnapshot()
+
+
+def _snapshot_bars(code: str, period: str, datalen: int) -> Optional[BarSeries]:
+    quote = _quote_snapshot.get(code)
+    if quote is None:
+        return None
+    bars = _tail_cache.with_today(code, period, quote[0], quote[1], datalen)
+    if bars is not None:
+        _tail_cache._count(period, 'snapshot')
+    return bars
+
+
+def fetch_kline_snapshot(code: str, period: str, source_idx: int = 0, datalen: int = 1500) -> BarSeries:
+    """盘中日K：历史取尾部缓存、当天这根由行情快照合成（不发请求）；无快照或缓存不可用时走增量获取"""
+    bars = _snapshot_bars(code, period, datalen)
+    if bars is not None:
+        return bars
+    return fetch_kline_incremental(code, period, source_idx, datalen=datalen)
+
+
+async def fetch_kline_snapshot_async(code: str, period: str, source_idx: int = 0,
+                                     datalen: int = 1500) -> BarSeries:
+    """fetch_kline_snapshot 的协程版"""
+    bars = _snapshot_bars(code, period, datalen)
+    if bars is not None:
+        return bars
+    return await fetch_kline_incremental_async(code, period, source_idx, datalen=datalen)
+
+
+# ==================== 行情预筛 ====================
+# 每轮开始时用同一份批量行情快照剔除本轮不可能出有效信号的股票，不为它们花受限的K线请求：
+#   - 停牌/当天无成交：快照里多数股票已有当天成交，而它没有（开盘前所有股票都无成交，此时不剔除）
+#   - 价格区间、换手率下限：环境变量配置，默认不限
+# 快照里没有的股票（该批请求失败）一律保留。
+
+PREFILTER_MIN_PRICE = float(os.environ.get('PREFILTER_MIN_PRICE', '0'))         # 现价下限（元），0 = 不限
+PREFILTER_MAX_PRICE = float(os.environ.get('PREFILTER_MAX_PRICE', '0'))         # 现价上限（元），0 = 不限
+PREFILTER_MIN_TURNOVER = float(os.environ.get('PREFILTER_MIN_TURNOVER', '0'))   # 换手率下限（%），0 = 不限
+PREFILTER_REUSE_AGE = 120  # 快照在该秒数内刷新过则直接复用（多条扫描线同一轮只拉一次）
+
+PREFILTER_LABELS = {'halted': '停牌/无成交', 'price': '价格区间外', 'turnover': '换手不足'}
+
+
+def prefilter_by_snapshot(stock_list: List[Tuple[str, str]],
+                          quotes: Dict[str, Tuple]) -> Tuple[List[Tuple[str, str]], Dict[str, int]]:
+    """按行情快照剔除停牌/无成交及价格、换手不达标的股票，返回 (保留的股票, {原因: 剔除数})"""
+    counts = dict.fromkeys(PREFILTER_LABELS, 0)
+    days = {}
+    for day, bar, _ in quotes.values():
+        if bar is not None:
+            days[day] = days.get(day, 0) + 1
+    # 当前交易日：有成交的股票最多的日期，且须占快照的一半以上（否则尚未开盘，不按无成交剔除）
+    active_day = max(days, key=days.get) if days else None
+    if active_day is not None and days[active_day] * 2 < len(quotes):
+        active_day = None
+
+    kept = []
+    for code, name in stock_list:
+        quote = quotes.get(code)
+        if quote is None or active_day is None:
+            kept.append((code, name))
+            continue
+        day, bar, turnover = quote
+        if bar is None or day != active_day:
+            counts['halted'] += 1
+        elif bar[3] < PREFILTER_MIN_PRICE or (PREFILTER_MAX_PRICE and bar[3] > PREFILTER_MAX_PRICE):
+            counts['price'] += 1
+        elif PREFILTER_MIN_TURNOVER and turnover is not None and turnover < PREFILTER_MIN_TURNOVER:
+            counts['turnover'] += 1
+        else:
+            kept.append((code, name))
+    return kept, counts
+
+
+def format_prefilter_counts(counts: Dict[str, int]) -> str:
+    """剔除统计 → '剔除 N 只（停牌/无成交 a, ...）'，没有剔除返回空字符串"""
+    total = sum(counts.values())
+    if not total:
+        return ""
+    parts = [f"{PREFILTER_LABELS[k]} {v}" for k, v in counts.items() if v]
+    return f"剔除 {total} 只（{', '.join(parts)}）"
+
+
+# ==================== 盘中触发价位 ====================
+# 处于确认窗口内的股票（有效金叉、已有首倍量、距首倍 1~5 根、此前无确认阳），当前这根能否成为确认阳只取决于
+# 它自己的 开/收/量：收盘>开盘、收盘>=首倍价×容差、成交量>窗口内其他阳线量。扫描时把这些价位记进形态状态
+# （PatternHints 状态的 trigger 字段），盘中用批量行情对比，命中后再做一次完整判定（见 monitor 的触发监视）。
+# 批量行情只有全天的开/高/低/量，只能对应日K，分钟周期不生成触发价位。
+
+TRIGGER_PERIODS = ('240min',)
+
+
+def pattern_triggers(period: str) -> Dict[str, List]:
+    """本进程扫描记下的某周期触发价位 {代码: [K线日期, 最低收盘价, 最低成交量]}（供 match_triggers 对比）"""
+    return _pattern_hints.triggers(period)
+
+
+def match_triggers(triggers: Dict[str, List], quotes: Dict[str, Tuple]) -> List[str]:
+    """行情达到触发价位的代码：触发价位 [K线日期, 最低收盘价, 最低成交量]，行情须为同一天且 现价>开盘"""
+    hits = []
+    for code, (day, min_close, min_volume) in triggers.items():
+        quote = quotes.get(code)
+        if not quote or quote[0] != day or quote[1] is None:
+            continue
+        open_, _, _, last, volume = quote[1]
+        if last > open_ and last >= min_close and volume > min_volume:
+            hits.append(code)
+    return hits
+
+
+# ==================== 列式K线（numpy） ====================
+
+# Python 3.12 起内置 sum() 对浮点改用 Neumaier 补偿求和，列式MA需按同一算法累加才能与字典路径逐位一致
+_SUM_COMPENSATED = sys.version_info >= (3, 12)
+
+
+def _rolling_sum(x, w: int):
+    """沿最后一维计算 sum(x[i-w+1:i+1])，逐位对齐内置 sum() 的累加顺序；不足w根处为 NaN"""
+    out = np.full(x.shape, np.nan)
+    n = x.shape[-1]
+    if n < w:
+        return out
+    m = n - w + 1
+    s = x[..., 0:m].copy()  # sum() 从整数0起加，0 + x0 == x0
+    if _SUM_COMPENSATED:
+        c = np.zeros_like(s)
+        for k in range(1, w):
+            xk = x[..., k:k + m]
+            t = s + xk
+            c += np.where(np.abs(s) >= np.abs(xk), (s - t) + xk, (xk - t) + s)
+            s = t
+        s = np.where((c != 0) & np.isfinite(c), s + c, s)
+    else:
+        for k in range(1, w):
+            s = s + x[..., k:k + m]
+    out[..., w - 1:] = s
+    return out
+
+
+def _compute_cross_columns(close, ma20, ma30, open_threshold: float) -> Dict:
+    """沿最后一维向量化计算开口条件、简单金叉/死叉、金叉（带开口）——与 _prepare_data 逐K线循环等价"""
+    has_open = (ma20 - ma30) * 10000 >= close * open_threshold  # MA缺失处为NaN，比较结果为False
+    shape = close.shape
+    simple_cross = np.zeros(shape, dtype=bool)
+    dead_cross = np.zeros(shape, dtype=bool)
+    gold_cross = np.zeros(shape, dtype=bool)
+    p20, p30 = ma20[..., :-1], ma30[..., :-1]
+    c20, c30 = ma20[..., 1:], ma30[..., 1:]
+    simple_cross[..., 1:] = (p20 <= p30) & (c20 > c30)
+    dead_cross[..., 1:] = (p20 >= p30) & (c20 < c30)
+
+    # 本轮上穿有效：最近一次简单金叉晚于最近一次死叉（二者不会落在同一根）
+    idx = np.arange(shape[-1])
+    last_simple = np.maximum.accumulate(np.where(simple_cross, idx, -1), axis=-1)
+    last_dead = np.maximum.accumulate(np.where(dead_cross, idx, -1), axis=-1)
+    in_uptrend = last_simple > last_dead
+
+    pair_valid = ~(np.isnan(p20) | np.isnan(p30) | np.isnan(c20) | np.isnan(c30))
+    gold_cross[..., 1:] = (pair_valid & has_open[..., 1:] & ~has_open[..., :-1]
+                           & in_uptrend[..., 1:])
+    return {
+        'has_open': has_open,
+        'simple_cross': simple_cross,
+        'dead_cross': dead_cross,
+        'gold_cross': gold_cross,
+    }
+
+
+class ColumnarBars:
+    """列式K线：价格/量为 float64 数组，MA缺失处为 NaN，各标记为 bool 数组。
+
+    由 StrictStockScreener._prepare_columnar 生成，_check_signal_at / check_one_stock 可直接使用；
+    数值与 _prepare_data 的字典列表逐位一致（to_dicts() 可还原为同样的字典列表）。
+    """
+
+    FLOAT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'ma20', 'ma30', 'ma5')
+    FLAG_FIELDS = ('is_yang', 'is_yin', 'has_open', 'simple_cross', 'gold_cross', 'dead_cross')
+
+    __slots__ = ('date',) + FLOAT_FIELDS + FLAG_FIELDS + ('_columns',)
+
+    def __init__(self, date: List[str], **arrays):
+        self.date = date
+        for name in self.FLOAT_FIELDS + self.FLAG_FIELDS:
+            setattr(self, name, arrays[name])
+        self._columns = None
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    def __getitem__(self, i: int) -> Dict:
+        """单根K线的字典形式（与字典路径同键），供偶尔的逐根读取"""
+        cols = self.columns()
+        return {
+            'date': cols.date[i], 'open': cols.open[i], 'high': cols.high[i],
+            'low': cols.low[i], 'close': cols.close[i], 'volume': cols.volume[i],
+            'ma20': cols.ma20[i], 'ma30': cols.ma30[i], 'ma5': cols.ma5[i],
+            'is_yang': cols.is_yang[i], 'is_yin': cols.is_yin[i],
+            '_has_open': bool(self.has_open[i]),
+            'gold_cross': cols.gold_cross[i], 'dead_cross': cols.dead_cross[i],
+            '_simple_cross': bool(self.simple_cross[i]),
+        }
+
+    def columns(self) -> '_BarColumns':
+        """转为 Python 列表视图（惰性、只转一次），标量逐根访问比 numpy 下标快得多"""
+        if self._columns is None:
+            def _opt(arr):
+                return [None if v != v else v for v in arr.tolist()]
+            self._columns = _BarColumns(
+                date=self.date,
+                open=self.open.tolist(), high=self.high.tolist(), low=self.low.tolist(),
+                close=self.close.tolist(), volume=self.volume.tolist(),
+                ma5=_opt(self.ma5), ma20=_opt(self.ma20), ma30=_opt(self.ma30),
+                is_yang=self.is_yang.tolist(), is_yin=self.is_yin.tolist(),
+                gold_cross=self.gold_cross.tolist(), dead_cross=self.dead_cross.tolist(),
+            )
+        return self._columns
+
+    def to_dicts(self) -> List[Dict]:
+        """还原为 _prepare_data 的字典列表（用于对拍和兼容旧调用方）"""
+        return [self[i] for i in range(len(self))]
+
+
+def _rolling_extreme(values: List[float], w: int, lowest: bool) -> List[float]:
+    """逐位置 min/max(values[max(0, i-w+1):i+1])，结果与对切片直接求 min/max 相同
+    有 numpy 时按 w 根分块：窗口 = 前一块的块内后缀极值 ∪ 本块的块内前缀极值，与 w 无关的 O(n) 向量化；
+    否则单调队列 O(n)"""
+    if np is not None and len(values) >= w:
+        ufunc = np.minimum if lowest else np.maximum
+        n = len(values)
+        blocks = -(-n // w)
+        arr = np.full(blocks * w, np.inf if lowest else -np.inf)
+        arr[:n] = values
+        arr = arr.reshape(blocks, w)
+        prefix = ufunc.accumulate(arr, axis=1).ravel()
+        suffix = ufunc.accumulate(arr[:, ::-1], axis=1)[:, ::-1].ravel()
+        out = prefix[:n].copy()  # 开头不足 w 根：第一块的前缀即累计极值
+        out[w - 1:] = ufunc(suffix[:n - w + 1], prefix[w - 1:n])
+        return out.tolist()
+    out = [0.0] * len(values)
+    window = deque()
+    for i, v in enumerate(values):
+        while window and (values[window[-1]] >= v if lowest else values[window[-1]] <= v):
+            window.pop()
+        window.append(i)
+        if window[0] <= i - w:
+            window.popleft()
+        out[i] = values[window[0]]
+    return out
+
+
+def _ema(values: List[float], period: int) -> List[float]:
+    """通达信 EMA：以首个值为初值逐根递推"""
+    result = [values[0]]
+    m = 2.0 / (period + 1)
+    for i in range(1, len(values)):
+        result.append(values[i] * m + result[-1] * (1 - m))
+    return result
+
+
+class _BarColumns:
+    """_check_signal_at 使用的逐字段列表视图，字典列表与 ColumnarBars 两种输入共用。
+    筑底/突破分支用到的滚动最高/最低价和 MACD 在首次使用时整段算一次并缓存（逐根回测时各K线共用）"""
+
+    FIELDS = ('date', 'open', 'high', 'low', 'close', 'volume', 'ma5', 'ma20', 'ma30',
+              'is_yang', 'is_yin', 'gold_cross', 'dead_cross')
+
+    __slots__ = FIELDS + ('_derived',)
+
+    def __init__(self, **cols):
+        for name in self.FIELDS:
+            setattr(self, name, cols[name])
+        self._derived = {}
+
+    def rolling_low(self, w: int) -> List[float]:
+        """近 w 根最低价 min(low[i-w+1..i])，开头不足 w 根时取已有部分"""
+        key = ('low', w)
+        if key not in self._derived:
+            self._derived[key] = _rolling_extreme(self.low, w, lowest=True)
+        return self._derived[key]
+
+    def rolling_high(self, w: int) -> List[float]:
+        """近 w 根最高价 max(high[i-w+1..i])，开头不足 w 根时取已有部分"""
+        key = ('high', w)
+        if key not in self._derived:
+            self._derived[key] = _rolling_extreme(self.high, w, lowest=False)
+        return self._derived[key]
+
+    def macd(self) -> Tuple[List[float], List[float], List[float]]:
+        """收盘价 MACD(12, 26, 9)：(DIFF, DEA, MACD柱)"""
+        if 'macd' not in self._derived:
+            closes = self.close
+            ema12, ema26 = _ema(closes, 12), _ema(closes, 26)
+            diff = [ema12[i] - ema26[i] for i in range(len(closes))]
+            dea = _ema(diff, 9)
+            self._derived['macd'] = (diff, dea, [2 * (diff[i] - dea[i]) for i in range(len(closes))])
+        return self._derived['macd']
+
+    @classmethod
+    def from_dicts(cls, data: List[Dict]) -> '_BarColumns':
+        return cls(
+            date=[d['date'] for d in data],
+            open=[d['open'] for d in data], high=[d['high'] for d in data],
+            low=[d['low'] for d in data], close=[d['close'] for d in data],
+            volume=[d['volume'] for d in data],
+            ma5=[d.get('ma5') for d in data], ma20=[d.get('ma20') for d in data],
+            ma30=[d.get('ma30') for d in data],
+            is_yang=[d['is_yang'] for d in data], is_yin=[d['is_yin'] for d in data],
+            gold_cross=[d.get('gold_cross', False) for d in data],
+            dead_cross=[d.get('dead_cross', False) for d in data],
+        )
+
+
+def _as_columns(data) -> _BarColumns:
+    if isinstance(data, ColumnarBars):
+        return data.columns()
+    return _BarColumns.from_dicts(data)
 
 
 # ==================== 选股核心逻辑 ====================
 
+class _SignalEngine:
+    """逐K线信号序列：一次正向扫描算出 BARSLAST(金叉)/BARSLAST(死叉)/阴线量/倍量阳/首倍量/确认阳，
+    之后任意位置的这些量都是 O(1) 查表（语义与金叉.txt逐K线独立计算一致）
+
+    要点：
+    - 某根K线所属的金叉周期内不会再出现新金叉，因此确认阳只依赖该K线自身的 BARSLAST(金叉)，可逐根预算；
+    - 倍量阳标记与观察位置无关；首倍量在 [pos-窗口-10, pos] 扫描窗口内判定，窗口左端截断时
+      窗口内第一根倍量阳也算“首倍”，其余情况等价于全局首倍（前10根无倍量阳）；
+    - 确认量能的“前窗口内最大阳线量”拆成 [L, pos-6] 的单调队列最大值 + pos-5..pos-1 的直接比较（需剔除首倍量）。
+    """
+
+    __slots__ = ('cols', 'gold_idx', 'dead_idx', 'yin_vol', 'double_yang', 'first_double',
+                 'confirm', 'confirm_cum')
+
+    def __init__(self, cols: '_BarColumns', window: int, ma_long: int, tolerance: int):
+        self.cols = cols
+        n = len(cols.close)
+        closes, volumes = cols.close, cols.volume
+        is_yang, is_yin = cols.is_yang, cols.is_yin
+        gold_cross, dead_cross = cols.gold_cross, cols.dead_cross
+
+        self.gold_idx = gold_idx = [-1] * n
+        self.dead_idx = dead_idx = [-1] * n
+        self.yin_vol = yin_vols = [0] * n
+        self.double_yang = double_yang = [False] * n
+        self.first_double = first_double = [-1] * n
+        self.confirm = confirm = [False] * n
+        self.confirm_cum = confirm_cum = [0] * n
+
+        g = d = -1
+        last_yin = last_dv = -1
+        dv_q = deque()      # 扫描窗口内的倍量阳
+        ff_q = deque()      # 全局首倍量（前10根无倍量阳）
+        vol_q = deque()     # 单调队列：本金叉周期内 [L, pos-6] 的阳线，量递减
+        next_push = 0
+        count = 0
+        for p in range(n):
+            # BARSLAST 只回看到 ma_long 之后（与原逐根回溯的 range(pos, ma_long, -1) 一致）
+            if p > ma_long:
+                if gold_cross[p]:
+                    g = p
+                    vol_q.clear()
+                    next_push = g + 1
+                if dead_cross[p]:
+                    d = p
+            gold_idx[p] = g
+            dead_idx[p] = d
+
+            # 阴线量：p 之前最近一根阴线，须在金叉之后、窗口之内
+            yv = volumes[last_yin] if (g != -1 and last_yin > g and last_yin >= p - window) else 0
+            yin_vols[p] = yv
+            if is_yin[p]:
+                last_yin = p
+            if g == -1:
+                confirm_cum[p] = count
+                continue
+
+            # 倍量阳 / 首倍量
+            dist_gold = p - g
+            dv = (1 <= dist_gold <= window and is_yang[p] and yv > 0 and
+                  volumes[p] >= yv * 2 and volumes[p] > volumes[g])
+            if dv:
+                double_yang[p] = True
+                dv_q.append(p)
+                if last_dv == -1 or last_dv < p - 10:
+                    ff_q.append(p)
+                last_dv = p
+
+            start_scan = max(0, p - window - 10)
+            lo = max(start_scan, g + 1)
+            while dv_q and dv_q[0] < start_scan:
+                dv_q.popleft()
+            while ff_q and ff_q[0] < lo:
+                ff_q.popleft()
+            fd = ff_q[0] if ff_q else -1
+            if dv_q and dv_q[0] >= lo and (fd == -1 or dv_q[0] < fd):
+                fd = dv_q[0]
+            first_double[p] = fd
+
+            # 确认量能窗口 [L, p-6] 的阳线量最大值
+            while next_push <= p - 6:
+                if is_yang[next_push]:
+                    v = volumes[next_push]
+                    while vol_q and volumes[vol_q[-1]] <= v:
+                        vol_q.pop()
+                    vol_q.append(next_push)
+                next_push += 1
+            left = max(g + 1, p - window)
+            while vol_q and vol_q[0] < left:
+                vol_q.popleft()
+
+            # 确认阳：距首倍 1~5 根、收盘不破首倍价容差、量大于窗口内其他阳线
+            dist_fd = p - fd
+            if (is_yang[p] and fd != -1 and 1 <= dist_fd <= 5 and dist_fd < dist_gold and
+                    closes[p] * 10000 >= closes[fd] * tolerance):
+                max_yang_vol = volumes[vol_q[0]] if vol_q else 0
+                for kk in range(max(left, p - 5), p):
+                    if kk != fd and is_yang[kk]:
+                        max_yang_vol = max(max_yang_vol, volumes[kk])
+                if volumes[p] > max_yang_vol:
+                    confirm[p] = True
+                    count += 1
+            confirm_cum[p] = count
+
+    def confirm_count(self, start: int, end: int) -> int:
+        """[start, end] 区间内确认阳根数（对齐 COUNT(确认阳, 距金叉天数+1)）"""
+        return self.confirm_cum[end] - (self.confirm_cum[start - 1] if start > 0 else 0)
+
+
+
+# ==================== 批量选股进度/结果收集 ====================
+class _ScanProgress:
+    """批量选股的结果收集、进度输出与汇总（线程池/流水线等各执行方式共用，保证输出一致）"""
+
+    def __init__(self, total: int, on_signal=None, tag: str = '', sources: Optional[List[str]] = None):
+        self.total = total
+        self.on_signal = on_signal
+        self.prefix = f"{tag} " if tag else ""  # 多周期并行扫描时区分各周期的进度行
+        self.sources = sources                  # 汇总里只统计本周期所用数据源的限流
+        self.first_signal = None                # (第几只完成, 距开始秒数)，衡量形态排序的效果
+        self.normal_results: List[Tuple[str, str, Dict]] = []
+        self.strict_results: List[Tuple[str, str, Dict]] = []
+        self.completed = 0
+        self.error_count = 0
+        # 请求失败（FetchFailed）的股票：defer_failed 时先记入 deferred 不计数，一轮扫完后重试
+        self.defer_failed = False
+        self.deferred: List[Tuple[str, str]] = []
+        self.retried = set()     # 进入过重试的代码
+        self.recovered = 0       # 重试后成功判定的股票数
+        self.over_budget: List[Tuple[str, str]] = []  # 时间预算用尽、顺延到下一轮的股票（err='__deferred__'）
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, code: str, name: str, normal_signal: bool, strict_signal: bool,
+               details: Dict, err):
+        """记录一只股票的结果：计数、归类、打印，有信号时立即回调 on_signal
+        err: 错误信息，或 FetchFailed（defer_failed 时不计数，留待重试），或 '__deferred__'（顺延到下一轮，不计数）"""
+        if isinstance(err, FetchFailed) and self.defer_failed:
+            with self.lock:
+                self.deferred.append((code, name))
+            return
+        if err == '__deferred__':
+            with self.lock:
+                self.over_budget.append((code, name))
+            return
+        with self.lock:
+            self.completed += 1
+            completed, total = self.completed, self.total
+            if err:
+                self.error_count += 1
+            elif code in self.retried:
+                self.recovered += 1
+
+            # 计算速度时扣除暂停时间
+            elapsed = time.time() - self.start_time - get_total_paused_time()
+            if completed > 1 and elapsed > 0:
+                speed = completed / elapsed
+                eta = (total - completed) / speed
+                eta_str = f"预计剩余 {int(eta)}s ({speed:.1f}只/s)"
+            else:
+                eta_str = ""
+
+            if strict_signal or normal_signal:
+                if self.first_signal is None:
+                    self.first_signal = (completed, time.time() - self.start_time)
+                sig_type = details.get('signal_type', '')
+                if sig_type in ('筑底', '突破', '严格'):
+                    self.strict_results.append((code, name, details))
+                else:
+                    self.normal_results.append((code, name, details))
+                with _print_lock:
+                    tag = f"[{sig_type}]" if sig_type else ""
+                    print(f"\r{self.prefix}[{completed}/{total}] {code} {name:<10} "
+                          f">>> {tag}买入信号 <<< "
+                          f"金叉:{details.get('gold_cross_date','')} "
+                          f"放量阳:{details.get('first_double_date','')} "
+                          f"确认阳:{details.get('date','')} "
+                          f"{eta_str}")
+                if self.on_signal:
+                    try:
+                        self.on_signal(code, name, sig_type or 'normal', details)
+                    except Exception:
+                        pass
+            else:
+                with _print_lock:
+                    print(f"\r{self.prefix}[{completed}/{total}] {code} {name:<10} "
+                          f"{eta_str:<40}", end='', flush=True)
+
+    def take_deferred(self) -> List[Tuple[str, str]]:
+        """取出待重试的股票并清空队列"""
+        with self.lock:
+            deferred, self.deferred = self.deferred, []
+            self.retried.update(code for code, _ in deferred)
+        return deferred
+
+    def postpone_deferred(self):
+        """时间预算已用尽：待重试的股票不再重试，一并顺延到下一轮"""
+        with self.lock:
+            self.over_budget.extend(self.deferred)
+            self.deferred = []
+
+    def stats(self) -> Dict:
+        """本轮覆盖统计：evaluated 为成功判定（含无信号）的股票数，coverage 为其占本轮应判定股票的百分比，
+        deferred 为时间预算用尽顺延到下一轮的股票数"""
+        evaluated = self.completed - self.error_count
+        return {
+            'total': self.total,
+            'evaluated': evaluated,
+            'failed': self.error_count,
+            'retried': len(self.retried),
+            'recovered': self.recovered,
+            'deferred': len(self.over_budget),
+            'coverage': evaluated * 100 / self.total if self.total else 100.0,
+        }
+
+    def print_summary(self, stopped_early: bool, extra_lines: List[str] = ()):
+        """选股结束汇总：用时/速度、按类型统计、失败数、限流统计，extra_lines 为执行方式附加的统计"""
+        elapsed_total = time.time() - self.start_time
+        paused_total = get_total_paused_time()
+        active_time = elapsed_total - paused_total
+        speed = self.completed / active_time if active_time > 0 else 0
+
+        # 注：每只股票只检查其最后一根K线（data[-1]）
+        # 信号本身就是最后一根K线的信号，无需额外过滤
+
+        print(f"\r{'=' * 80}")
+        if stopped_early:
+            print(f"  {self.prefix}选股被用户停止  已完成 {self.completed}/{self.total} 只")
+        else:
+            print(f"  {self.prefix}选股完成！")
+        time_info = f"用时 {active_time:.1f}s  速度 {speed:.1f}只/s"
+        if paused_total > 1:
+            time_info += f"  (暂停 {paused_total:.1f}s)"
+        print(f"  {time_info}")
+        # 按类型统计
+        type_counts = {}
+        for _, _, d in self.strict_results + self.normal_results:
+            st = d.get('signal_type', '普通')
+            type_counts[st] = type_counts.get(st, 0) + 1
+        for st, cnt in type_counts.items():
+            print(f"  {st}买入: {cnt} 只")
+        if self.first_signal:
+            print(f"  首个信号: 第 {self.first_signal[0]} 只完成时 (+{self.first_signal[1]:.1f}s)")
+        if self.error_count > 0:
+            print(f"  请求失败: {self.error_count} 只")
+        stats = self.stats()
+        if stats['retried']:
+            print(f"  失败重试: {stats['retried']} 只，找回 {stats['recovered']} 只")
+        if stats['deferred']:
+            print(f"  时间预算用尽: 顺延 {stats['deferred']} 只到下一轮")
+        print(f"  覆盖率: {stats['coverage']:.1f}%（成功判定 {stats['evaluated']}/{self.total} 只）")
+        throttle_info = get_throttle_summary(self.sources)
+        if throttle_info:
+            print(f"  {throttle_info}")
+        pool_info = http_pool.get_summary()
+        if pool_info:
+            print(f"  {pool_info}")
+        for line in extra_lines:
+            print(f"  {line}")
+        print(f"{'=' * 80}\n")
+
+
 class StrictStockScreener:
     """严格选股器 - 多周期支持，核心逻辑对齐通达信金叉.txt"""
 
@@ -511,8 +2079,18 @@ class StrictStockScreener:
         'monthly': 10,
     }
 
+    # 单次扫描请求的K线根数：按周期算出信号逻辑所需的最少根数，再加安全余量（上限为数据源最大1500根）
+    MAX_DATALEN = 1500
+    LOOKBACK_MARGIN = 120   # 覆盖常见的“简单金叉→开口达标”上穿段；更长的上穿段截断时整段重取（见 _uptrend_cut）
+    MACD_WARMUP = 250       # EMA26/DEA9 预热，之后初值影响 < 1e-8
+    PIPELINE_SLOTS_PER_PROCESS = 2  # 流水线模式每个判定进程的共享内存槽位数（抓取→判定的有界队列长度）
+    FETCH_RETRY_PASSES = 2          # 一轮扫完后对请求失败的股票最多重试几遍（0 = 不重试）
+
     def __init__(self, period: str = '240min', period_name: str = '日线',
-                 max_workers: int = 8, debug: bool = False):
+                 max_workers: int = 8, debug: bool = False, columnar: bool = False,
+                 datalen: Optional[int] = None, incremental: bool = False, derive: bool = False,
+                 skip_unviable: bool = False, closed_only: bool = False, snapshot: bool = False,
+                 prefilter: bool = False):
         self.period = period
         self.period_name = period_name
         self.tolerance = self.TOLERANCE_MAP.get(period, 9993)
@@ -521,6 +2099,25 @@ class StrictStockScreener:
         self.ma_long = 30   # MA4 in 通达信
         self.max_workers = max_workers
         self.debug = debug  # 调试模式
+        # 列式模式：K线直接解析为 numpy 数组并向量化预计算（需要 numpy，缺失时回退字典路径）
+        self.columnar = columnar and np is not None
+        # 增量模式：同一进程内多轮扫描时只拉最新几根K线拼到缓存尾部（见 TailCache）
+        self.incremental = incremental and np is not None
+        # 观察名单：上一轮形态状态表明本轮不可能出信号的股票直接跳过（见 PatternHints）
+        self.skip_unviable = skip_unviable
+        self.last_skipped = 0
+        # 只判定已收盘的K线：数据源返回的当前未走完的分钟K线丢弃（监控按K线收盘时刻调度时使用）
+        self.closed_only = closed_only
+        # 快照模式（日线，需增量模式）：每轮先批量拉全市场行情，历史K线取缓存、当天这根由快照合成（见 QuoteSnapshot）
+        self.snapshot = snapshot and self.incremental and period == '240min'
+        # 行情预筛：每轮先拉批量行情快照，停牌/无成交及价格、换手不达标的股票不请求K线（见 prefilter_by_snapshot）
+        self.prefilter = prefilter
+        self.last_prefiltered = {}
+        # 上一次 screen_all_stocks 的覆盖统计（见 _ScanProgress.stats）
+        self.last_scan_stats = {}
+        # 本轮截止时刻（time.time()，None 不限）：过了截止时刻尚未开始抓取的股票顺延到下一轮（见 screen_all_stocks）
+        self.deadline = None
+        self.last_deferred = 0
 
         # 动态调整搜索窗口大小
         # 分钟周期下，20根K线时间太短，容易漏掉形态，需适当放大
@@ -537,6 +2134,50 @@ class StrictStockScreener:
         else:
             self.window_size = 20   # 日/周/月保持20
 
+        # 每只股票请求的K线根数（None 表示按周期自动推算最少所需根数）
+        self.datalen = datalen or self.required_bars()
+        # 合成模式：只请求来源周期K线，本地合成本周期（15分钟←5分钟、周/月线←日线，见 bar_resample）。
+        # 数据源上限内的来源K线合成不出 datalen 根时（如周/月线、30/60分钟）不合成，直接请求本周期
+        self.derive = derive and bar_resample.can_derive(period, self.datalen, self.MAX_DATALEN)
+
+    def required_bars(self) -> int:
+        """
+        最新一根K线出信号所需的最少K线根数：
+        - 确认阳距首倍量≤5根、首倍量距金叉≤窗口，首倍量/阴线量判定再各回看 窗口+10 根
+          → 最远回溯约 3*窗口+25 根，金叉日还需 MA30 预热（金叉位置须 > ma_long）
+        - 日/周/月线：底部企稳/筑底/位置用到 250 根最低最高价，筑底的 MACD 另需 EMA 预热
+        """
+        need = self.ma_long + 3 * self.window_size + 30
+        if self.period in ('240min', 'weekly', 'monthly'):
+            need = max(need, 250 + self.MACD_WARMUP)
+        return min(self.MAX_DATALEN, need + self.LOOKBACK_MARGIN)
+
+    def _uptrend_cut(self, raw) -> bool:
+        """
+        取到的K线是否截断在一段上穿中：窗口内第一次简单金叉/死叉之前 MA20 已在 MA30 之上，且开口由不达标变为达标。
+        这根算不算金叉取决于窗口之前的那次简单金叉（_prepare_data 的 in_uptrend），只取 datalen 根判定不出来；
+        窗口内先出现交叉时此后的上穿状态与整段历史一致。MA 与 _prepare_data 同样逐根求和，结果逐位相同
+        """
+        closes = raw.close if isinstance(raw, BarSeries) else [float(d['close']) for d in raw]
+        prev = None
+        for i in range(29, len(closes)):
+            ma20 = sum(closes[i - 19:i + 1]) / 20
+            ma30 = sum(closes[i - 29:i + 1]) / 30
+            has_open = (ma20 - ma30) * 10000 >= closes[i] * self.open_threshold
+            if prev is not None:
+                p_ma20, p_ma30, p_open = prev
+                if (p_ma20 <= p_ma30 and ma20 > ma30) or (p_ma20 >= p_ma30 and ma20 < ma30):
+                    return False
+                if has_open and not p_open:
+                    return True
+            prev = ma20, ma30, has_open
+        return False
+
+    def _needs_full_history(self, raw) -> bool:
+        """按 datalen 取到的K线是否要按数据源最大根数重取（数据源给的不足 datalen 根时已是全部历史）"""
+        return (self.datalen < self.MAX_DATALEN and raw is not None and len(raw) >= self.datalen
+                and self._uptrend_cut(raw))
+
     def _log(self, msg: str):
         """调试日志"""
         if self.debug:
@@ -631,36 +2272,109 @@ class StrictStockScreener:
 
         return data
 
-    def _check_signal_at(self, data: List[Dict], idx: int) -> Tuple[bool, bool, Dict]:
+    @staticmethod
+    def _parse_columns(raw) -> Tuple[List[str], 'np.ndarray']:
+        """原始K线 → (日期列表, n×5 float64 的 OHLCV 数组)，按时间正序；脏数据逐根过滤（与 _prepare_data 一致）
+        BarSeries 已在抓取时解析过，直接读数值列"""
+        fields = ('open', 'high', 'low', 'close', 'volume')
+        if isinstance(raw, BarSeries):
+            dates, values = list(raw.day), _series_values(raw)
+        else:
+            dates, values = StrictStockScreener._parse_dict_rows(raw, fields)
+
+        # 确保按时间正序（稳定排序，同日期保持原顺序，与 list.sort 一致）
+        n = len(dates)
+        order = sorted(range(n), key=dates.__getitem__)
+        if order != list(range(n)):
+            dates = [dates[i] for i in order]
+            values = values[order]
+        return dates, values
+
+    @staticmethod
+    def _parse_dict_rows(raw: List[Dict], fields: Tuple[str, ...]) -> Tuple[List[str], 'np.ndarray']:
+        """字典列表K线 → (日期列表, n×5 float64)，未排序"""
+        try:
+            dates = [d.get("day") or d.get("date") for d in raw]
+            values = np.empty((len(raw), len(fields)), dtype=np.float64)
+            for k, f in enumerate(fields):
+                values[:, k] = np.fromiter(map(float, [d[f] for d in raw]), dtype=np.float64, count=len(raw))
+        except (KeyError, ValueError, TypeError, AttributeError):
+            # 存在脏数据：逐根过滤，与 _prepare_data 的跳过规则一致
+            dates, rows = [], []
+            for d in raw:
+                try:
+                    date_val = d.get("day") or d.get("date")
+                    rows.append([float(d[f]) for f in fields])
+                    dates.append(date_val)
+                except (KeyError, ValueError, TypeError):
+                    continue
+            values = np.array(rows, dtype=np.float64).reshape(-1, len(fields))
+        return dates, values
+
+    def _columnar_from_arrays(self, dates: List[str], values) -> ColumnarBars:
+        """已排序的 (日期, n×5 OHLCV) → ColumnarBars：MA/阴阳/开口/金叉死叉全部向量化"""
+        opens, highs, lows, closes, volumes = (values[:, k] for k in range(5))
+        ma20 = _rolling_sum(closes, 20) / 20
+        ma30 = _rolling_sum(closes, 30) / 30
+        ma5 = _rolling_sum(closes, 5) / 5
+        cross = _compute_cross_columns(closes, ma20, ma30, self.open_threshold)
+
+        return ColumnarBars(
+            dates,
+            open=opens, high=highs, low=lows, close=closes, volume=volumes,
+            ma20=ma20, ma30=ma30, ma5=ma5,
+            is_yang=closes > opens, is_yin=closes < opens,
+            **cross,
+        )
+
+    def _prepare_columnar(self, raw: List[Dict]) -> Optional[ColumnarBars]:
+        """列式版 _prepare_data：原始K线直接解析为 float64 数组，MA/阴阳/开口/金叉死叉全部向量化，
+        结果与字典路径逐位一致"""
+        dates, values = self._parse_columns(raw)
+        if len(dates) < self.ma_long + 30:
+            return None
+        return self._columnar_from_arrays(dates, values)
+
+    def _build_engine(self, data) -> _SignalEngine:
+        """为整段K线预计算逐K线信号序列（字典列表或 ColumnarBars 均可）"""
+        return _SignalEngine(_as_columns(data), self.window_size, self.ma_long, self.tolerance)
+
+    def _check_signal_at(self, data, idx: int,
+                         engine: Optional[_SignalEngine] = None) -> Tuple[bool, bool, Dict]:
         """
         在指定位置idx检查是否有买入信号（完全对齐通达信金叉.txt逻辑）
+        data 可以是 _prepare_data 的字典列表，也可以是 _prepare_columnar 的 ColumnarBars；
+        对同一段数据逐根检查时传入 engine（_build_engine 的结果）复用预计算序列
         返回: (普通买入, 严格买入, 详情)
         """
         n = len(data)
-        curr = data[idx]
+        cols = engine.cols if engine is not None else _as_columns(data)
+        dates = cols.date
+        opens, highs, lows = cols.open, cols.high, cols.low
+        closes, volumes = cols.close, cols.volume
+        ma5s, ma20s, ma30s = cols.ma5, cols.ma20, cols.ma30
+        is_yang, is_yin = cols.is_yang, cols.is_yin
 
         # ===== 基础判断 =====
-        if not curr['is_yang']:
+        if not is_yang[idx]:
             return False, False, {}
 
+        if engine is None:
+            engine = _SignalEngine(cols, self.window_size, self.ma_long, self.tolerance)
+
         # ===== 第一步：找最近的金叉日 =====
         # TDX BARSLAST(金叉日) 在金叉当天返回0，所以搜索范围包含idx自身
-        gold_cross_idx = -1
-        for j in range(idx, self.ma_long, -1):
-            if data[j].get('gold_cross', False):
-                gold_cross_idx = j
-                break
-
+        gold_cross_idx = engine.gold_idx[idx]
         if gold_cross_idx == -1:
             return False, False, {}
 
         # 检查金叉日是否符合“金叉量够大”条件
-        gold_day_vol = data[gold_cross_idx]['volume']
+        gold_day_vol = volumes[gold_cross_idx]
         max_yin_vol_before_gold = 0
         for offset in range(1, 8):
             check_idx = gold_cross_idx - offset
-            if check_idx >= 0 and data[check_idx]['is_yin']:
-                max_yin_vol_before_gold = max(max_yin_vol_before_gold, data[check_idx]['volume'])
+            if check_idx >= 0 and is_yin[check_idx]:
+                max_yin_vol_before_gold = max(max_yin_vol_before_gold, volumes[check_idx])
 
         # 小周期放宽"金叉量够大"：>=50%即可（与金叉.txt同步）
         is_minute_period = self.period in ('1min', '5min', '15min', '30min')
@@ -676,11 +2390,7 @@ class StrictStockScreener:
 
         # ===== 第二步：死叉检测 =====
         # TDX BARSLAST(死叉日) 同理，搜索范围包含idx自身
-        dead_cross_idx = -1
-        for j in range(idx, self.ma_long, -1):
-            if data[j].get('dead_cross', False):
-                dead_cross_idx = j
-                break
+        dead_cross_idx = engine.dead_idx[idx]
 
         if dead_cross_idx != -1:
             dist_dead = idx - dead_cross_idx
@@ -688,31 +2398,8 @@ class StrictStockScreener:
             if dist_gold >= dist_dead:
                 return False, False, {}
 
-        # ===== 第三步：计算阴线量的辅助函数（对齐通达信逐K线独立计算）=====
-        def calc_yin_vol_at(pos):
-            """在pos位置独立计算阴线量：从pos往前回看20根，找金叉后最近的阴线"""
-            # 重新定位 pos 位置对应的金叉日
-            k_gold_idx = -1
-            for kj in range(pos, self.ma_long, -1):
-                if data[kj].get('gold_cross', False):
-                    k_gold_idx = kj
-                    break
-
-            if k_gold_idx == -1: return 0
-
-            k_dist_gold = pos - k_gold_idx
-            # TDX: 阴线量:=IF(YX1,REF(VOL,1),YXL2); 这是一个嵌套结构，越近的优先级越高
-            for off in range(1, self.window_size + 1):
-                ci = pos - off
-                if ci < 0:
-                    continue
-                # 只有在金叉日之后的阴线才算 (dist > off)
-                if off < k_dist_gold and data[ci]['is_yin']:
-                    return data[ci]['volume']
-            return 0
-
-        # 当前K线的阴线量
-        yin_vol = calc_yin_vol_at(idx)
+        # ===== 第三步：阴线量（对齐通达信逐K线独立计算，见 _SignalEngine）=====
+        yin_vol = engine.yin_vol[idx]
         has_yin = yin_vol > 0
         if not has_yin:
             return False, False, {}
@@ -720,104 +2407,14 @@ class StrictStockScreener:
         # ===== 第四步：金叉日量能 =====
         # (已在第一步计算完毕)
 
-        # ===== 辅助函数：在任意位置pos计算倍量阳标记列表和首倍量位置 =====
-        def find_first_double_at(pos):
-            """
-            在pos位置计算：倍量阳标记 → 首倍量位置
-            完全对齐TDX逐K线独立计算逻辑
-            返回: first_double_idx 或 -1
-            """
-            # 计算 pos 位置及其之前的所有倍量阳标记
-            dv_flags = {}
-            # 扫描范围：需要包含 pos 往前 10 根（用于首倍判定）
-            # CHANGED: 这里的范围应该包含到 self.window_size
-            start_scan = max(0, pos - self.window_size - 10)
-            for k in range(start_scan, pos + 1):
-                # 1. 找 k 点对应的金叉日
-                k_gold_idx = -1
-                for kj in range(k, self.ma_long, -1):
-                    if data[kj].get('gold_cross', False):
-                        k_gold_idx = kj
-                        break
-                if k_gold_idx == -1: continue
-
-                k_dist_gold = k - k_gold_idx
-                if k_dist_gold <= 0 or k_dist_gold > self.window_size: continue
-
-                k_gold_vol = data[k_gold_idx]['volume']
-
-                # 2. 计算 k 点对应的阴线量
-                k_yin_vol = calc_yin_vol_at(k)
-
-                if (data[k]['is_yang'] and k_yin_vol > 0 and
-                    data[k]['volume'] >= k_yin_vol * 2 and
-                    data[k]['volume'] > k_gold_vol):
-                    dv_flags[k] = True
-
-            # TDX 首倍量: 倍量阳 AND (REF(倍量阳,1)=0 AND ... AND REF(倍量阳,10)=0)
-            fd_idx = -1
-            # 在当前位置 idx 对应的金叉周期内找首倍量
-            for k in sorted(dv_flags.keys()):
-                if k <= gold_cross_idx: continue
-
-                is_first = True
-                for prev_off in range(1, 11):
-                    if (k - prev_off) in dv_flags:
-                        is_first = False
-                        break
-                if is_first:
-                    fd_idx = k
-                    break  # 找到金叉后第一个倍量阳即停止，避免取到后面的
-            return fd_idx
-
-        # ===== 辅助函数：在任意位置pos判断是否为确认阳 =====
-        def is_confirm_yang_at(pos):
-            """
-            在pos位置独立计算确认阳条件（对齐TDX逐K线独立计算）
-            返回: True/False
-            """
-            if not data[pos]['is_yang']:
-                return False
-
-            fd_idx = find_first_double_at(pos)
-            if fd_idx == -1:
-                return False
-
-            pos_dist_fd = pos - fd_idx
-            pos_dist_gold = pos - gold_cross_idx
-            fd_price = data[fd_idx]['close']
-
-            # 距首倍>=1 AND 距首倍<=5 AND 距首倍<距金叉天数
-            if pos_dist_fd < 1 or pos_dist_fd > 5:
-                return False
-            if pos_dist_fd >= pos_dist_gold:
-                return False
-
-            # 收盘价容差
-            if data[pos]['close'] * 10000 < fd_price * self.tolerance:
-                return False
-
-            # 确认量能达标（QRY: N<距金叉天数 AND N<>距首倍）
-            max_yang_vol = 0
-            for n in range(1, self.window_size + 1):
-                kk = pos - n
-                if kk < 0:
-                    continue
-                # QRYn: n < 距金叉天数 AND n <> 距首倍
-                if n < pos_dist_gold and n != pos_dist_fd:
-                    if data[kk]['is_yang']:
-                        max_yang_vol = max(max_yang_vol, data[kk]['volume'])
-
-            return data[pos]['volume'] > max_yang_vol
-
         # ===== 在当前位置idx计算首倍量 =====
-        first_double_idx = find_first_double_at(idx)
+        first_double_idx = engine.first_double[idx]
         if first_double_idx == -1:
             return False, False, {}
 
         dist_first_double = idx - first_double_idx
-        first_double_price = data[first_double_idx]['close']
-        first_double_vol = data[first_double_idx]['volume']
+        first_double_price = closes[first_double_idx]
+        first_double_vol = volumes[first_double_idx]
 
         # ===== 放量适度（2-6倍） =====
         # TDX: 首倍量能 < 阴线量*6，这里阴线量是当前K线(idx)的阴线量
@@ -839,8 +2436,8 @@ class StrictStockScreener:
             else:
                 if not (n < gap_days):  # YXM2~20用<
                     continue
-            if data[k]['is_yin']:
-                max_yin_vol_between = max(max_yin_vol_between, data[k]['volume'])
+            if is_yin[k]:
+                max_yin_vol_between = max(max_yin_vol_between, volumes[k])
 
         normal_shrink = max_yin_vol_between > 0 and max_yin_vol_between < gold_day_vol * 2
 
@@ -858,7 +2455,7 @@ class StrictStockScreener:
             else:
                 if not (n < gap_days):
                     continue
-            if data[k]['is_yin'] and data[k]['volume'] >= shrink_limit:
+            if is_yin[k] and volumes[k] >= shrink_limit:
                 strict_shrink = False
                 break
         # 第二部分：YZ1~YZ5
@@ -869,33 +2466,31 @@ class StrictStockScreener:
                     continue
                 if not (n < dist_first_double):  # N<距首倍
                     continue
-                if data[k]['is_yin'] and data[k]['volume'] >= shrink_limit:
+                if is_yin[k] and volumes[k] >= shrink_limit:
                     strict_shrink = False
                     break
 
         # ===== 确认阳线判断（当前K线idx）=====
-        if not is_confirm_yang_at(idx):
+        if not engine.confirm[idx]:
             return False, False, {}
 
         # ===== 首次确认（对齐通达信 COUNT(确认阳, 距金叉天数+1)=1）=====
         # TDX中每根K线的确认阳都是独立计算的（阴线量、倍量阳、首倍量、首倍价、QRY都重算）
-        confirm_count = 0
-        for check_i in range(gold_cross_idx, idx + 1): # 范围应该是 [金叉日, 当前日]，即 距金叉天数+1 个周期
-            if is_confirm_yang_at(check_i):
-                confirm_count += 1
+        # 范围是 [金叉日, 当前日]，即 距金叉天数+1 个周期
+        confirm_count = engine.confirm_count(gold_cross_idx, idx)
 
         if confirm_count != 1:
             return False, False, {}
 
         # ===== 综合信号 =====
         details = {
-            'date': curr['date'],
-            'close': curr['close'],
-            'ma20': curr['ma20'],
-            'ma30': curr['ma30'],
-            'volume': curr['volume'],
-            'gold_cross_date': data[gold_cross_idx]['date'],
-            'first_double_date': data[first_double_idx]['date'],
+            'date': dates[idx],
+            'close': closes[idx],
+            'ma20': ma20s[idx],
+            'ma30': ma30s[idx],
+            'volume': volumes[idx],
+            'gold_cross_date': dates[gold_cross_idx],
+            'first_double_date': dates[first_double_idx],
             'days_since_gold': dist_gold,
             'days_since_first_double': dist_first_double,
             'first_double_price': first_double_price,
@@ -915,13 +2510,11 @@ class StrictStockScreener:
         bottom_stable = False
         if is_daily_or_above:
             # MA5止跌：MA5 >= 20天前的MA5
-            if idx >= 24 and curr.get('ma5') is not None and data[idx - 20].get('ma5') is not None:
-                ma5_rising = curr['ma5'] >= data[idx - 20]['ma5']
+            if idx >= 24 and ma5s[idx] is not None and ma5s[idx - 20] is not None:
+                ma5_rising = ma5s[idx] >= ma5s[idx - 20]
             # 底部企稳：30日最低价 >= 120日最低价
             if idx >= 119:
-                low_30 = min(data[k]['low'] for k in range(idx - 29, idx + 1))
-                low_120 = min(data[k]['low'] for k in range(idx - 119, idx + 1))
-                bottom_stable = low_30 >= low_120
+                bottom_stable = cols.rolling_low(30)[idx] >= cols.rolling_low(120)[idx]
 
         if is_daily_or_above:
             strict_buy = (strict_shrink and vol_moderate and gap_days > 0
@@ -942,9 +2535,9 @@ class StrictStockScreener:
             def is_trough(k):
                 if k < 5 or k >= n - 5:
                     return False
-                low_k = data[k]['low']
+                low_k = lows[k]
                 for off in range(1, 6):
-                    if data[k - off]['low'] < low_k or data[k + off]['low'] < low_k:
+                    if lows[k - off] < low_k or lows[k + off] < low_k:
                         return False
                 return True
 
@@ -956,25 +2549,25 @@ class StrictStockScreener:
                     break
 
             if right_idx > 0:
-                right_low = data[right_idx]['low']
+                right_low = lows[right_idx]
                 left_start = right_idx - 10
                 # 左底：右底前10-50根内最低点
                 if left_start >= 40:
-                    left_low = min(data[k]['low'] for k in range(left_start - 40, left_start + 1))
+                    left_low = min(lows[k] for k in range(left_start - 40, left_start + 1))
                     # 颈线：两底之间最高价
-                    neck = max(data[k]['high'] for k in range(right_idx, left_start + 1))
+                    neck = max(highs[k] for k in range(right_idx, left_start + 1))
 
                     # W底条件
                     has_double = right_low > 0 and left_low > 0
                     bottom_up = right_low * 1000 >= left_low * 970
                     bottom_not_high = right_low * 1000 <= left_low * 1050
                     neck_valid = neck * 1000 > max(left_low, right_low) * 1030
-                    break_neck = curr['close'] > neck
+                    break_neck = closes[idx] > neck
                     # 真底部：右底接近120日最低
-                    low_120 = min(data[k]['low'] for k in range(max(0, idx - 119), idx + 1))
+                    low_120 = cols.rolling_low(120)[idx]
                     is_real_bottom = right_low * 1000 <= low_120 * 1050
                     # 未再创低
-                    post_low = min(data[k]['low'] for k in range(right_idx, idx + 1))
+                    post_low = min(lows[k] for k in range(right_idx, idx + 1))
                     no_new_low = post_low >= right_low
 
                     w_bottom = (has_double and bottom_up and bottom_not_high and
@@ -982,31 +2575,20 @@ class StrictStockScreener:
 
                     if w_bottom:
                         # 量价结构
-                        down_vols = [data[right_idx - i]['volume'] for i in range(5) if right_idx - i >= 0]
+                        down_vols = [volumes[right_idx - i] for i in range(5) if right_idx - i >= 0]
                         down_avg = sum(down_vols) / len(down_vols) if down_vols else 1
-                        up_bars = [data[k]['volume'] for k in range(right_idx + 1, idx)]
+                        up_bars = [volumes[k] for k in range(right_idx + 1, idx)]
                         up_avg = sum(up_bars) / len(up_bars) if up_bars else 0
-                        vol_60_avg = sum(data[k]['volume'] for k in range(max(0, idx - 59), idx + 1)) / min(60, idx + 1)
+                        vol_60_avg = sum(volumes[k] for k in range(max(0, idx - 59), idx + 1)) / min(60, idx + 1)
                         vol_struct = (down_avg * 100 < vol_60_avg * 70) and (up_avg * 100 > down_avg * 130)
 
                         # 均线企稳
-                        ma20_up = curr['ma20'] is not None and data[idx - 3].get('ma20') is not None and curr['ma20'] > data[idx - 3]['ma20']
-                        above_ma30 = curr['ma30'] is not None and curr['close'] > curr['ma30']
+                        ma20_up = ma20s[idx] is not None and ma20s[idx - 3] is not None and ma20s[idx] > ma20s[idx - 3]
+                        above_ma30 = ma30s[idx] is not None and closes[idx] > ma30s[idx]
                         ma_stable = ma5_rising and above_ma30 and ma20_up
 
                         # MACD底背离
-                        closes_arr = [data[k]['close'] for k in range(n)]
-                        def ema_calc(arr, period):
-                            result = [arr[0]]
-                            m = 2.0 / (period + 1)
-                            for i in range(1, len(arr)):
-                                result.append(arr[i] * m + result[-1] * (1 - m))
-                            return result
-                        ema12 = ema_calc(closes_arr, 12)
-                        ema26 = ema_calc(closes_arr, 26)
-                        diff_arr = [ema12[i] - ema26[i] for i in range(n)]
-                        dea_arr = ema_calc(diff_arr, 9)
-                        macd_arr = [2 * (diff_arr[i] - dea_arr[i]) for i in range(n)]
+                        diff_arr, dea_arr, macd_arr = cols.macd()
                         macd_right = macd_arr[right_idx] if right_idx < n else 0
                         macd_left_min = min(macd_arr[max(0, left_start - 10):left_start + 1]) if left_start >= 0 else 0
                         macd_diverge = macd_right > macd_left_min
@@ -1016,14 +2598,14 @@ class StrictStockScreener:
                         macd_ok = macd_diverge or macd_cross or macd_turn_pos
 
                         # 价格位置+换手率（简化：只用价格位置）
-                        low_250 = min(data[k]['low'] for k in range(max(0, idx - 249), idx + 1))
-                        high_250 = max(data[k]['high'] for k in range(max(0, idx - 249), idx + 1))
-                        pos_pct = (curr['close'] - low_250) * 100 / (high_250 - low_250) if high_250 > low_250 else 50
+                        low_250 = cols.rolling_low(250)[idx]
+                        high_250 = cols.rolling_high(250)[idx]
+                        pos_pct = (closes[idx] - low_250) * 100 / (high_250 - low_250) if high_250 > low_250 else 50
                         at_low = pos_pct < 40
 
                         # 上涨确认
-                        leave_bottom = curr['close'] * 1000 > right_low * 1050
-                        short_up = curr['close'] > data[idx - 5]['close'] if idx >= 5 else False
+                        leave_bottom = closes[idx] * 1000 > right_low * 1050
+                        short_up = closes[idx] > closes[idx - 5] if idx >= 5 else False
                         up_confirm = leave_bottom and short_up
 
                         # 辅助条件3选2
@@ -1034,16 +2616,15 @@ class StrictStockScreener:
         breakout_buy = False
         if (normal_buy or vol_explode) and idx >= 30:
             # 近30日箱体
-            box_high = max(data[k]['high'] for k in range(max(0, idx - 29), idx + 1))
-            box_low = min(data[k]['low'] for k in range(max(0, idx - 29), idx + 1))
+            box_highs, box_lows = cols.rolling_high(30), cols.rolling_low(30)
+            box_high, box_low = box_highs[idx], box_lows[idx]
             narrow_box = (box_high - box_low) * 1000 < box_low * 150
 
             # 往前找突破发生点
             for j in range(idx, max(idx - 30, gold_cross_idx), -1):
-                j_high = max(data[k]['high'] for k in range(max(0, j - 29), j + 1))
-                j_low = min(data[k]['low'] for k in range(max(0, j - 29), j + 1))
+                j_high, j_low = box_highs[j], box_lows[j]
                 j_narrow = (j_high - j_low) * 1000 < j_low * 150
-                if j_narrow and data[j]['close'] >= j_high:
+                if j_narrow and closes[j] >= j_high:
                     # 突破发生在金叉前
                     dist_bp = idx - j
                     if dist_bp < dist_gold and dist_bp <= 30:
@@ -1058,30 +2639,297 @@ class StrictStockScreener:
 
         return normal_buy, strict_buy, details
 
+    def signal_series(self, data) -> Dict[str, List]:
+        """
+        整段历史逐K线信号（回测/生成ML训练样本用），共用一次预计算的 _SignalEngine
+        data: _prepare_data 或 _prepare_columnar 的结果
+        返回按列组织的字典，每列长度与K线数相同：
+          date / normal / strict / bottom / breakout / signal_type
+          gold_cross_idx / first_double_idx / gap_days（无金叉或无首倍量时为 None）
+          details（仅通过确认阳的K线有，其余为 None）/ error（该K线判定异常时的错误信息）
+        """
+        n = len(data)
+        engine = self._build_engine(data)
+        series = {
+            'date': list(engine.cols.date),
+            'normal': [False] * n, 'strict': [False] * n,
+            'bottom': [False] * n, 'breakout': [False] * n,
+            'signal_type': [None] * n,
+            'gold_cross_idx': [None] * n, 'first_double_idx': [None] * n, 'gap_days': [None] * n,
+            'details': [None] * n, 'error': [None] * n,
+        }
+        for i in range(n):
+            gold_idx, fd_idx = engine.gold_idx[i], engine.first_double[i]
+            if gold_idx == -1:
+                continue
+            series['gold_cross_idx'][i] = gold_idx
+            if fd_idx != -1:
+                series['first_double_idx'][i] = fd_idx
+                series['gap_days'][i] = fd_idx - gold_idx
+
+            # 只有“首次确认阳”的K线可能出信号，其余K线 _check_signal_at 必然返回空
+            if not engine.confirm[i] or engine.confirm_count(gold_idx, i) != 1:
+                continue
+            try:
+                normal_buy, strict_buy, details = self._check_signal_at(data, i, engine)
+            except Exception as e:
+                series['error'][i] = str(e)
+                continue
+            if not details:
+                continue
+            series['normal'][i] = normal_buy
+            series['strict'][i] = strict_buy
+            series['bottom'][i] = details['bottom_buy']
+            series['breakout'][i] = details['breakout_buy']
+            series['signal_type'][i] = details['signal_type']
+            series['details'][i] = details
+        return series
+
+    def fetch_signal_series(self, code: str, source_idx: int = 0) -> Optional[Dict[str, List]]:
+        """获取单只股票K线（按数据源最大根数）并返回整段历史的 signal_series；数据不足或获取失败返回 None"""
+        try:
+            raw = fetch_kline_with_fallback(code, self.period, source_idx, datalen=self.MAX_DATALEN)
+        except FetchFailed:
+            return None
+        if not raw:
+            return None
+        data = self._prepare_columnar(raw) if self.columnar else self._prepare_data(raw)
+        if data is None:
+            return None
+        return self.signal_series(data)
+
+    @property
+    def fetch_period(self) -> str:
+        """实际向数据源请求的周期（合成模式下为来源周期）"""
+        return bar_resample.DERIVED_FROM[self.period] if self.derive else self.period
+
+    @property
+    def memo_params(self) -> Tuple:
+        """影响判定结果的参数（ResultMemo 键的一部分）"""
+        return self.window_size, self.tolerance, self.open_threshold, self.ma_short, self.ma_long
+
+    def base_datalen(self) -> int:
+        """合成模式下每只股票请求的来源周期K线根数"""
+        return bar_resample.base_datalen(self.period, self.datalen, self.MAX_DATALEN)
+
+    def _fetch_raw(self, code: str, source_idx: int = 0) -> BarSeries:
+        """按当前模式（合成/增量/整段）获取单只股票的原始K线"""
+        if self.derive:
+            raw = fetch_kline_derived(code, self.period, source_idx, datalen=self.datalen,
+                                      base_len=self.base_datalen(), incremental=self.incremental)
+        elif self.snapshot:
+            raw = fetch_kline_snapshot(code, self.period, source_idx, datalen=self.datalen)
+        elif self.incremental:
+            raw = fetch_kline_incremental(code, self.period, source_idx, datalen=self.datalen)
+        else:
+            raw = fetch_kline_with_fallback(code, self.period, source_idx, datalen=self.datalen)
+        if self._needs_full_history(raw):
+            raw = fetch_kline_with_fallback(code, self.period, source_idx, datalen=self.MAX_DATALEN)
+        return self._closed(raw)
+
+    async def _fetch_raw_async(self, code: str, source_idx: int = 0) -> BarSeries:
+        """_fetch_raw 的协程版"""
+        if self.derive:
+            raw = await fetch_kline_derived_async(code, self.period, source_idx, datalen=self.datalen,
+                                                  base_len=self.base_datalen(), incremental=self.incremental)
+        elif self.snapshot:
+            raw = await fetch_kline_snapshot_async(code, self.period, source_idx, datalen=self.datalen)
+        elif self.incremental:
+            raw = await fetch_kline_incremental_async(code, self.period, source_idx, datalen=self.datalen)
+        else:
+            raw = await fetch_kline_async(code, self.period, source_idx, datalen=self.datalen)
+        if self._needs_full_history(raw):
+            raw = await fetch_kline_async(code, self.period, source_idx, datalen=self.MAX_DATALEN)
+        return self._closed(raw)
+
+    def _closed(self, raw):
+        """closed_only 时去掉尾部未收盘的分钟K线（缓存里仍保留，下一轮增量照常拼接）"""
+        if not self.closed_only or not raw:
+            return raw
+        return bar_resample.closed_bars(raw, self.period)
+
+    @staticmethod
+    def _is_stale_bar(last_bar_time) -> bool:
+        """最后一根K线年份早于去年：数据源返回的脏数据，不判定信号"""
+        if not last_bar_time:
+            return False
+        try:
+            bar_year = int(last_bar_time[:4])
+            return bar_year < datetime.now().year - 1
+        except (ValueError, IndexError):
+            return False
+
+    def check_with_quote(self, code: str, quote: Tuple) -> Tuple[bool, bool, Dict, str]:
+        """历史K线取尾部缓存、当天这根由给定行情合成后判定（盘中触发监视用，不发请求）；缓存不可用时视为无信号"""
+        bars = _tail_cache.with_today(code, self.period, quote[0], quote[1], self.datalen)
+        if bars is None:
+            return False, False, {}, None
+        return self._evaluate_raw(bars, code)
+
     def check_one_stock(self, code: str, source_idx: int = 0) -> Tuple[bool, bool, Dict, str]:
         """检查单只股票的买入信号，返回(普通买入, 严格买入, 详情, 最后一根K线时间)"""
-        raw = fetch_kline_with_fallback(code, self.period, source_idx)
+        return self._evaluate_raw(self._fetch_raw(code, source_idx), code)
+
+    def _evaluate_raw(self, raw: List[Dict], code: Optional[str] = None) -> Tuple[bool, bool, Dict, str]:
+        """对已获取的原始K线判定最后一根的信号（check_one_stock 的计算部分）
+        给出 code 时顺带记录形态状态，供下一轮排序和跳过（见 PatternHints）；
+        K线与上一轮完全相同时直接取上轮的结果和状态（见 ResultMemo）"""
         if not raw:
             return False, False, {}, None
 
-        data = self._prepare_data(raw)
-        if data is None:
-            return False, False, {}, None
+        memo_key = ResultMemo.key(code, self.period, raw, self.memo_params) if code else None
+        cached = _result_memo.get(memo_key)
+        if cached is not None:
+            result, state = cached
+            _pattern_hints.record(self.period, code, state)
+            return result
 
+        data = self._prepare_columnar(raw) if self.columnar else self._prepare_data(raw)
         # 校验最后一根K线日期：年份必须是近两年内，过滤掉数据源返回的脏数据
         last_bar_time = data[-1]['date'] if data else None
-        if last_bar_time:
-            try:
-                bar_year = int(last_bar_time[:4])
-                from datetime import datetime as _dt
-                current_year = _dt.now().year
-                if bar_year < current_year - 1:
-                    return False, False, {}, last_bar_time
-            except (ValueError, IndexError):
-                pass
+        if data is None or self._is_stale_bar(last_bar_time):
+            result, state = (False, False, {}, last_bar_time), PatternHints.empty()
+        else:
+            normal_buy, strict_buy, details = self._check_signal_at(data, len(data) - 1)
+            result = (normal_buy, strict_buy, details, last_bar_time)
+            state = self._pattern_state(data, normal_buy or strict_buy, code) if code else None
+        if code:
+            _pattern_hints.record(self.period, code, state)
+            _result_memo.put(memo_key, result, state)
+        return result
 
-        normal_buy, strict_buy, details = self._check_signal_at(data, len(data) - 1)
-        return normal_buy, strict_buy, details, last_bar_time
+    def _pattern_stage(self, data, signalled: bool = False, end: Optional[int] = None) -> int:
+        """
+        最后一根K线所处的形态阶段（PatternHints 的排序依据，只看最近 窗口+5 根，近似即可）：
+        金叉后未死叉 → GOLD；其后出现倍量阳（量>=前一根阴线量2倍且>金叉量）→ DOUBLE；
+        倍量阳在最近5根内（下一根可能就是确认阳）→ CONFIRM；本根已出信号 → SIGNAL。end: 只看到该位置为止
+        """
+        if signalled:
+            return PatternHints.SIGNAL
+        cols = _as_columns(data)
+        last = len(cols.close) - 1 if end is None else end
+        gold_cross, dead_cross = cols.gold_cross, cols.dead_cross
+        g = -1
+        for p in range(last, max(self.ma_long, last - self.window_size - 5), -1):
+            if dead_cross[p]:
+                return PatternHints.NONE
+            if gold_cross[p]:
+                g = p
+                break
+        if g == -1:
+            return PatternHints.NONE
+
+        volumes, is_yang, is_yin = cols.volume, cols.is_yang, cols.is_yin
+        yin_vol = 0
+        double_idx = -1
+        for p in range(g + 1, last + 1):
+            if is_yang[p] and yin_vol > 0 and volumes[p] >= yin_vol * 2 and volumes[p] > volumes[g]:
+                double_idx = p
+            if is_yin[p]:
+                yin_vol = volumes[p]
+        if double_idx == -1:
+            return PatternHints.GOLD
+        return PatternHints.CONFIRM if last - double_idx < 5 else PatternHints.DOUBLE
+
+    def _pattern_state(self, data, signalled: bool = False, code: str = '') -> Dict:
+        """
+        PatternHints 的状态：形态阶段 + 最后一根K线 L 之后最早第几根可能出信号（earliest）。
+        只用已走完的K线（截至 F=L-1）推算，L 本身视为未来K线：
+          - F 之前有金叉、其后无死叉且仍在窗口内 → earliest=0（随时可能出信号）
+          - 否则需要 F 之后的新金叉 F+i，信号至少在 F+i+3（阴线、倍量阳、确认阳各一根）→ earliest=i+2；
+            新金叉要求 MA20>MA30，按每日涨幅上限给出 D_i=MA20-MA30 的上界，取上界首次为正的 i
+        """
+        cols = _as_columns(data)
+        closes = cols.close
+        n = len(closes)
+        last = n - 1
+        state = {'stage': self._pattern_stage(data, signalled), 'bar': cols.date[last],
+                 'earliest': 0, 'gold': None, 'dead': None, 'gap': None}
+        # 触发价位只看之前的K线是否已有首倍量（盘中这根暂时走低形成的死叉等不影响）
+        if (not signalled and self.period in TRIGGER_PERIODS
+                and self._pattern_stage(data, end=last - 1) >= PatternHints.DOUBLE):
+            state['trigger'] = self._trigger_levels(data)
+        f = last - 1
+        if signalled or f <= self.ma_long + 30:
+            return state
+
+        g = d = -1
+        for p in range(f, self.ma_long, -1):
+            if g == -1 and cols.gold_cross[p]:
+                g = p
+            if d == -1 and cols.dead_cross[p]:
+                d = p
+            if g != -1 and d != -1:
+                break
+        state['gold'] = cols.date[g] if g != -1 else None
+        state['dead'] = cols.date[d] if d != -1 else None
+        ma20, ma30 = cols.ma20[f], cols.ma30[f]
+        if ma20 is None or ma30 is None:
+            return state
+        gap = ma20 - ma30
+        state['gap'] = round(gap / closes[f], 6) if closes[f] else None
+        if g != -1 and g > d and g + self.window_size + 5 >= last:
+            return state
+
+        # 涨幅上限：分钟线以近两日最高收盘为基准（覆盖 F 所在日的昨收），日线及以上以 F 收盘为基准
+        days_per_bar = bar_resample.DAYS_PER_BAR.get(self.period, 1)
+        minute = days_per_bar < 1
+        if minute:
+            span = int(round(2 / days_per_bar))
+            if len({day[:10] for day in cols.date[max(0, f - span * 3):f + 1]}) < 6:
+                return state  # 不足6个交易日（新股前5日无涨跌幅限制）
+            ref = max(closes[max(0, f - span + 1):f + 1])
+        else:
+            ref = closes[f]
+        limit = _max_daily_gain(code)
+        for i in range(1, 21):
+            bound = ref * limit ** (math.ceil(i * days_per_bar - 1e-9) + (1 if minute else 0))
+            gap += bound / 60 - closes[f + i - 20] / 20 + closes[f + i - 30] / 30
+            if gap > 0:
+                state['earliest'] = i + 2
+                return state
+        state['earliest'] = 23
+        return state
+
+    def _trigger_levels(self, data) -> Optional[List]:
+        """
+        最后一根K线 x（盘中未走完）成为确认阳所需的价位 [日期, 最低收盘价, 最低成交量]，只用 x 之前的K线：
+        金叉/死叉、阴线量、首倍量、窗口内阳线量都与 x 无关（_SignalEngine 是正向扫描，x 之前的序列不受 x 影响）。
+        收盘价下限另含“不因收盘过低在 x 形成死叉”。不在确认窗口内返回 None
+        """
+        cols = _as_columns(data)
+        x = len(cols.close) - 1
+        if x <= self.ma_long + 1:
+            return None
+        engine = _SignalEngine(cols, self.window_size, self.ma_long, self.tolerance)
+        g, d = engine.gold_idx[x - 1], engine.dead_idx[x - 1]
+        if g == -1 or d > g or engine.confirm_count(g, x - 1):
+            return None
+        is_yin, is_yang, volumes, closes = cols.is_yin, cols.is_yang, cols.volume, cols.close
+
+        # 阴线量：x 之前最近一根阴线须在金叉之后、窗口之内
+        last_yin = next((p for p in range(x - 1, g, -1) if is_yin[p]), -1)
+        if last_yin == -1 or last_yin < x - self.window_size:
+            return None
+
+        # 首倍量：扫描窗口内最早的倍量阳在金叉之后则取它，否则取金叉之后第一根全局首倍（前10根无倍量阳）
+        double_yang = engine.double_yang
+        start = max(0, x - self.window_size - 10)
+        lo = max(start, g + 1)
+        fd = next((p for p in range(start, x) if double_yang[p]), -1)
+        if fd < lo:
+            fd = next((p for p in range(lo, x) if double_yang[p] and not any(double_yang[max(0, p - 10):p])), -1)
+        if fd == -1 or x - fd > 5:
+            return None
+
+        min_close = closes[fd] * self.tolerance / 10000
+        ma20, ma30 = cols.ma20[x - 1], cols.ma30[x - 1]
+        if ma20 is not None and ma30 is not None:
+            # MA20-MA30 在 x 的变化 = 收盘/60 - close[x-20]/20 + close[x-30]/30，收盘低于该价位即死叉
+            min_close = max(min_close, 60 * (closes[x - 20] / 20 - closes[x - 30] / 30 - (ma20 - ma30)))
+        left = max(g + 1, x - self.window_size)
+        min_volume = max((volumes[k] for k in range(left, x) if k != fd and is_yang[k]), default=0)
+        return [cols.date[x], min_close, min_volume]
 
     def load_stock_list(self) -> List[Tuple[str, str]]:
         """从MD文件加载股票列表（含基本面过滤）"""
@@ -1120,14 +2968,13 @@ class StrictStockScreener:
 
     def _check_sources(self):
         """开始前测试各数据源是否可用"""
-        is_minute = self.period in ('1min', '5min', '15min', '30min', '60min')
-        sources = _SOURCES_MINUTE if is_minute else _SOURCES_DAILY
+        sources = sources_for_period(self.fetch_period)
         test_code = '000001'  # 用平安银行测试
         ok_list = []
         fail_list = []
         for src in sources:
             try:
-                data = src.fetch(test_code, self.period, 50)
+                data = src.fetch(test_code, self.fetch_period, 50)
                 if data and len(data) > 10:
                     ok_list.append(src.__name__)
                 else:
@@ -1144,20 +2991,57 @@ class StrictStockScreener:
                     fail_list.append((src.__name__, err[:40]))
         return ok_list, fail_list
 
-    def screen_all_stocks(self, stock_list: List[Tuple[str, str]], on_signal=None):
+    def screen_all_stocks(self, stock_list: List[Tuple[str, str]], on_signal=None,
+                          executor: str = 'thread', processes: Optional[int] = None,
+                          progress_tag: str = '', deadline: Optional[float] = None):
         """并行批量选股 - 多数据源分散请求
         on_signal: 可选回调函数，签名 on_signal(code, name, signal_type, details)
                    signal_type: 'strict' 或 'normal'
-                   扫到信号立即调用，不等全部扫完"""
+                   扫到信号立即调用，不等全部扫完
+        executor: 'thread'  线程池内逐只 抓取+判定（默认）
+                  'process' 抓取/判定流水线：I/O 线程抓取解析 → 共享内存槽位 → 进程池判定（需 numpy），
+                            判定不再和抓取争 GIL，见 _run_pipelined
+                  'async'   单线程 asyncio：同时挂起多个请求，吞吐只受各数据源速率限制约束，见 _run_async
+        processes: 'process' 模式的判定进程数，默认 CPU 核数-1
+        progress_tag: 进度行前缀（多个周期同时扫描时标明周期）
+        deadline: 本轮截止时刻（time.time()）。到点后尚未开始抓取的股票不再请求，记为顺延（last_deferred），
+                  下一轮在同一形态阶段内优先扫描；已在途的请求照常完成"""
+        _pattern_hints.load(self.period)
+        self.deadline = deadline
+        self.last_deferred = 0
+        _result_memo.reset_stats(self.period)
+        self.last_skipped = 0
+        if self.skip_unviable:
+            now = bar_resample.beijing_now()
+            viable = [(code, name) for code, name in stock_list if _pattern_hints.viable(self.period, code, now)]
+            self.last_skipped = len(stock_list) - len(viable)
+            stock_list = viable
+        snapshot_line = self._refresh_snapshot(stock_list)
+        self.last_prefiltered = {}
+        if self.prefilter:
+            stock_list, self.last_prefiltered = prefilter_by_snapshot(stock_list, _quote_snapshot.quotes())
         total = len(stock_list)
-        is_minute = self.period in ('1min', '5min', '15min', '30min', '60min')
-        num_sources = len(_SOURCES_MINUTE) if is_minute else len(_SOURCES_DAILY)
+        num_sources = len(sources_for_period(self.fetch_period))
+        pipelined = executor == 'process' and np is not None
 
         print(f"\n{'=' * 80}")
         print(f"  严格选股程序 - 周期: {self.period_name}")
         print(f"  运行环境: {_env_config['env_name']}  速率限制: ≤{_env_config['max_per_sec']:.0f}次/秒")
         print(f"  待分析: {total} 只股票")
-        print(f"  并行线程: {self.max_workers}  数据源: {num_sources}个")
+        if self.last_skipped:
+            print(f"  形态跳过: {self.last_skipped} 只（距上次判定新出的K线不足以走完 金叉→确认阳）")
+        if snapshot_line:
+            print(f"  {snapshot_line}")
+        prefilter_info = format_prefilter_counts(self.last_prefiltered)
+        if prefilter_info:
+            print(f"  行情预筛: {prefilter_info}")
+        if pipelined:
+            processes = processes or max(1, (os.cpu_count() or 2) - 1)
+            print(f"  抓取线程: {self.max_workers}  判定进程: {processes}  数据源: {num_sources}个")
+        elif executor == 'async':
+            print(f"  异步在途请求: ≤{_env_config['async_in_flight']}  数据源: {num_sources}个")
+        else:
+            print(f"  并行线程: {self.max_workers}  数据源: {num_sources}个")
 
         # 测试数据源可用性
         ok_list, fail_list = self._check_sources()
@@ -1173,13 +3057,92 @@ class StrictStockScreener:
 
         print(f"{'=' * 80}\n")
 
-        normal_results = []
-        strict_results = []
-        error_count = 0
-        completed = 0
-        start_time = time.time()
-        results_lock = threading.Lock()
+        progress = _ScanProgress(total, on_signal, tag=progress_tag,
+                                 sources=[src.__name__ for src in sources_for_period(self.fetch_period)])
+        # 序号沿用股票列表顺序（决定数据源分配），提交顺序按上一轮形态阶段重排
+        tasks = _pattern_hints.order(self.period, [(i, code, name) for i, (code, name) in enumerate(stock_list)])
+        hint_info = _pattern_hints.summary(self.period)
+        if hint_info:
+            print(f"  {hint_info}")
+
+        # 重置控制状态
+        reset_control()
 
+        # 启动键盘监听线程
+        keyboard_thread = threading.Thread(target=keyboard_listener, daemon=True)
+        keyboard_thread.start()
+
+        print(f"  提示: 按 [空格] 暂停/继续  |  按 [Q] 或 [ESC] 停止并输出结果\n")
+
+        progress.defer_failed = self.FETCH_RETRY_PASSES > 0
+        if pipelined:
+            stopped_early, extra_lines = self._run_pipelined(tasks, num_sources, progress, processes)
+        elif executor == 'async':
+            stopped_early, extra_lines = asyncio.run(self._run_async(tasks, num_sources, progress))
+        else:
+            stopped_early, extra_lines = self._run_threaded(tasks, num_sources, progress), []
+        if not stopped_early:
+            stopped_early = self._retry_deferred(tasks, num_sources, progress)
+        if not stopped_early:
+            _pattern_hints.defer(self.period, [code for code, _ in progress.over_budget])
+
+        if self.last_skipped:
+            extra_lines = list(extra_lines) + [f"形态跳过 {self.last_skipped} 只（本轮不可能出信号）"]
+        if prefilter_info:
+            extra_lines = list(extra_lines) + [f"行情预筛{prefilter_info}"]
+        memo_info = _result_memo.summary(self.period)
+        if memo_info:
+            extra_lines = list(extra_lines) + [memo_info]
+        progress.print_summary(stopped_early, extra_lines)
+        self.last_scan_stats = progress.stats()
+        self.last_deferred = self.last_scan_stats['deferred']
+        _pattern_hints.save(self.period)
+        return progress.normal_results, progress.strict_results
+
+    def _retry_deferred(self, tasks: List[Tuple[int, str, str]], num_sources: int,
+                        progress: _ScanProgress) -> bool:
+        """
+        重试本轮请求失败（FetchFailed）的股票，最多 FETCH_RETRY_PASSES 遍：每遍先等本周期各数据源的当前退避时间
+        过去（限流放缓后再请求），并换下一个数据源起步；最后一遍仍失败的计入请求失败。返回是否被用户停止。
+        重试的股票通常不多，一律走线程池
+        """
+        order = {code: idx for idx, code, _ in tasks}
+        sources = [src.__name__ for src in sources_for_period(self.fetch_period)]
+        for attempt in range(1, self.FETCH_RETRY_PASSES + 1):
+            if self._over_budget():
+                progress.postpone_deferred()
+                break
+            retry = progress.take_deferred()
+            if not retry:
+                break
+            progress.defer_failed = attempt < self.FETCH_RETRY_PASSES
+            cool_down = max(_rate_limiter.backoff(name) for name in sources)
+            with _print_lock:
+                print(f"\r{progress.prefix}重试请求失败的 {len(retry)} 只（第 {attempt} 遍"
+                      + (f"，先等待限流退避 {cool_down:.1f}s" if cool_down else "") + "）")
+            if cool_down and _stop_event.wait(cool_down):
+                return True
+            retry_tasks = [(order[code] + attempt, code, name) for code, name in retry]
+            if self._run_threaded(retry_tasks, num_sources, progress):
+                return True
+        return False
+
+    def _over_budget(self) -> bool:
+        """本轮截止时刻已过（见 screen_all_stocks 的 deadline）"""
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def _refresh_snapshot(self, stock_list: List[Tuple[str, str]]) -> str:
+        """快照模式每轮刷新行情快照；只做预筛时 PREFILTER_REUSE_AGE 秒内刷新过则复用。返回说明行（未刷新为空）"""
+        if not self.snapshot and not (self.prefilter and _quote_snapshot.age() > PREFILTER_REUSE_AGE):
+            return ""
+        t0 = time.time()
+        requests = _quote_snapshot.refresh([code for code, _ in stock_list])
+        note = "当天K线由快照合成，缓存不可用的股票仍单独请求" if self.snapshot else "用于预筛"
+        return f"行情快照: {len(_quote_snapshot)} 只，{requests} 次请求，用时 {time.time() - t0:.1f}s（{note}）"
+
+    def _run_threaded(self, tasks: List[Tuple[int, str, str]], num_sources: int,
+                      progress: _ScanProgress) -> bool:
+        """线程池内逐只 抓取+判定，返回是否被用户停止"""
 
         def process_stock(args):
             idx, code, name = args
@@ -1187,25 +3150,17 @@ class StrictStockScreener:
             try:
                 # 任务开始前检查控制状态（暂停时阻塞，停止时跳过）
                 check_control()
+                if self._over_budget():
+                    return (code, name, False, False, {}, None, '__deferred__')
                 normal_signal, strict_signal, details, last_bar = self.check_one_stock(code, source_idx)
                 return (code, name, normal_signal, strict_signal, details, last_bar, None)
             except StopIteration:
                 return (code, name, False, False, {}, None, '__stopped__')
+            except FetchFailed as e:
+                return (code, name, False, False, {}, None, e)
             except Exception as e:
                 return (code, name, False, False, {}, None, str(e))
 
-        tasks = [(i, code, name) for i, (code, name) in enumerate(stock_list)]
-
-        # 重置控制状态
-        reset_control()
-        stopped_early = False
-
-        # 启动键盘监听线程
-        keyboard_thread = threading.Thread(target=keyboard_listener, daemon=True)
-        keyboard_thread.start()
-
-        print(f"  提示: 按 [空格] 暂停/继续  |  按 [Q] 或 [ESC] 停止并输出结果\n")
-
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             futures = {executor.submit(process_stock, task): task for task in tasks}
 
@@ -1214,87 +3169,336 @@ class StrictStockScreener:
                 try:
                     check_control()
                 except StopIteration:
-                    stopped_early = True
                     # 取消尚未开始的任务
                     for f in futures:
                         f.cancel()
-                    break
+                    return True
 
                 code, name, normal_signal, strict_signal, details, last_bar, err = future.result()
 
                 # 跳过被停止的任务
                 if err == '__stopped__':
                     continue
+                progress.record(code, name, normal_signal, strict_signal, details, err)
+        return False
 
-                with results_lock:
-                    completed += 1
-                    if err:
-                        error_count += 1
-
-                    # 计算速度时扣除暂停时间
-                    elapsed = time.time() - start_time - get_total_paused_time()
-                    if completed > 1 and elapsed > 0:
-                        speed = completed / elapsed
-                        eta = (total - completed) / speed
-                        eta_str = f"预计剩余 {int(eta)}s ({speed:.1f}只/s)"
-                    else:
-                        eta_str = ""
-
-                    if strict_signal or normal_signal:
-                        sig_type = details.get('signal_type', '')
-                        if sig_type in ('筑底', '突破', '严格'):
-                            strict_results.append((code, name, details))
-                        else:
-                            normal_results.append((code, name, details))
-                        with _print_lock:
-                            tag = f"[{sig_type}]" if sig_type else ""
-                            print(f"\r[{completed}/{total}] {code} {name:<10} "
-                                  f">>> {tag}买入信号 <<< "
-                                  f"金叉:{details.get('gold_cross_date','')} "
-                                  f"放量阳:{details.get('first_double_date','')} "
-                                  f"确认阳:{details.get('date','')} "
-                                  f"{eta_str}")
-                        if on_signal:
-                            try:
-                                on_signal(code, name, sig_type or 'normal', details)
-                            except Exception:
-                                pass
-                    else:
-                        with _print_lock:
-                            print(f"\r[{completed}/{total}] {code} {name:<10} "
-                                  f"{eta_str:<40}", end='', flush=True)
+    async def _run_async(self, tasks: List[Tuple[int, str, str]], num_sources: int,
+                         progress: _ScanProgress) -> Tuple[bool, List[str]]:
+        """
+        单线程 asyncio 扫描：最多 async_in_flight 个请求同时在途，每个请求按 _rate_limiter 预约发出时刻，
+        吞吐取决于速率限制而非线程数（跨境高延迟时尤其明显）。判定在事件循环内同步完成（单只毫秒级）。
+        返回 (是否被用户停止, 统计行)
+        """
+        in_flight = _env_config['async_in_flight']
+        semaphore = asyncio.Semaphore(in_flight)
+        stats = {'in_flight': 0, 'peak': 0}
 
-        elapsed_total = time.time() - start_time
-        paused_total = get_total_paused_time()
-        active_time = elapsed_total - paused_total
-        speed = completed / active_time if active_time > 0 else 0
+        async def process_stock(idx: int, code: str, name: str):
+            async with semaphore:
+                try:
+                    # 任务开始前检查控制状态（暂停时等待，停止时跳过）
+                    await _async_check_control()
+                except _AsyncStopped:
+                    return code, name, False, False, {}, '__stopped__'
+                if self._over_budget():
+                    return code, name, False, False, {}, '__deferred__'
+                stats['in_flight'] += 1
+                stats['peak'] = max(stats['peak'], stats['in_flight'])
+                try:
+                    raw = await self._fetch_raw_async(code, idx % num_sources)
+                    normal_signal, strict_signal, details, _ = self._evaluate_raw(raw, code)
+                    return code, name, normal_signal, strict_signal, details, None
+                except FetchFailed as e:
+                    return code, name, False, False, {}, e
+                except Exception as e:
+                    return code, name, False, False, {}, str(e)
+                finally:
+                    stats['in_flight'] -= 1
+
+        futures = [asyncio.ensure_future(process_stock(*task)) for task in tasks]
+        stopped_early = False
+        start = time.time()
+        try:
+            for next_done in asyncio.as_completed(futures):
+                code, name, normal_signal, strict_signal, details, err = await next_done
+                if _stop_event.is_set():
+                    stopped_early = True
+                    break
+                # 跳过被停止的任务
+                if err == '__stopped__':
+                    continue
+                progress.record(code, name, normal_signal, strict_signal, details, err)
+        finally:
+            # 停止时取消尚未完成的任务
+            for future in futures:
+                future.cancel()
+            await asyncio.gather(*futures, return_exceptions=True)
+            await _async_close_idle()
+
+        wall = max(time.time() - start - get_total_paused_time(), 1e-9)
+        return stopped_early, [
+            f"异步: 在途请求峰值 {stats['peak']} / 上限 {in_flight}  平均 {progress.completed / wall:.1f}只/s"
+        ]
+
+    def _run_pipelined(self, tasks: List[Tuple[int, str, str]], num_sources: int,
+                       progress: _ScanProgress, processes: int) -> Tuple[bool, List[str]]:
+        """
+        抓取/判定流水线：
+          I/O 线程池（max_workers 个）抓取并解析为 n×5 float64 → 占一个共享内存槽位写入 → 提交判定进程池；
+          判定进程（scan_worker.py）直接映射同一块共享内存计算 MA/金叉/信号，只回传结果。
+        槽位数 = 判定进程数 × PIPELINE_SLOTS_PER_PROCESS，即两级之间的有界队列：
+        判定跟不上时抓取线程阻塞在取槽位上（背压），不会把整市场K线堆在内存里。
+        结果按完成顺序回到主线程，逐只 record/on_signal。返回 (是否被用户停止, 流水线统计行)
+        """
+        import multiprocessing
+        from multiprocessing import shared_memory
+        from concurrent.futures import ProcessPoolExecutor
+        import queue
+        import scan_worker
+
+        n_slots = processes * self.PIPELINE_SLOTS_PER_PROCESS
+        max_bars = self.datalen + _TAIL_FETCH_BARS
+        shape = (n_slots, max_bars, 5)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+        ring = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        free_slots = queue.Queue()
+        for slot in range(n_slots):
+            free_slots.put(slot)
+        results = queue.Queue()
+        stats = {'io_busy': 0.0, 'slot_wait': 0.0, 'cpu_busy': 0.0,
+                 'depth_sum': 0, 'depth_samples': 0, 'depth_max': 0, 'local': 0}
+        stats_lock = threading.Lock()
+        # 判定进程在抓取线程首次 submit 时才启动，此时其他抓取线程正持锁收发请求：不能 fork 当前进程
+        # （子进程继承被持有的锁会死锁），用 forkserver（Windows 只有 spawn）。init_worker 按路径重新加载选股模块
+        methods = multiprocessing.get_all_start_methods()
+        mp_context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=mp_context, initializer=scan_worker.init_worker,
+            initargs=(os.path.abspath(__file__), shm.name, shape, self.period, self.period_name))
+
+        def on_evaluated(future, slot, code, name, memo_key, last_bar):
+            free_slots.put(slot)
+            try:
+                normal_signal, strict_signal, details, state, cpu_seconds = future.result()
+            except Exception as e:
+                results.put((code, name, False, False, {}, str(e)))
+                return
+            _pattern_hints.record(self.period, code, state)
+            _result_memo.put(memo_key, (normal_signal, strict_signal, details, last_bar), state)
+            with stats_lock:
+                stats['cpu_busy'] += cpu_seconds
+            results.put((code, name, normal_signal, strict_signal, details, None))
+
+        def fetch_stock(args):
+            idx, code, name = args
+            t0 = time.time()
+            try:
+                check_control()
+                if self._over_budget():
+                    results.put((code, name, False, False, {}, '__deferred__'))
+                    return
+                raw = self._fetch_raw(code, idx % num_sources)
+                memo_key = ResultMemo.key(code, self.period, raw, self.memo_params)
+                cached = _result_memo.get(memo_key)
+                dates, values = self._parse_columns(raw) if raw and cached is None else ([], None)
+            except StopIteration:
+                return
+            except FetchFailed as e:
+                results.put((code, name, False, False, {}, e))
+                return
+            except Exception as e:
+                results.put((code, name, False, False, {}, str(e)))
+                return
+            finally:
+                with stats_lock:
+                    stats['io_busy'] += time.time() - t0
+
+            if cached is not None:
+                (normal_signal, strict_signal, details, _), state = cached
+                _pattern_hints.record(self.period, code, state)
+                results.put((code, name, normal_signal, strict_signal, details, None))
+                return
+            n = len(dates)
+            if n < self.ma_long + 30 or self._is_stale_bar(dates[-1]):
+                if n:
+                    _pattern_hints.record(self.period, code, PatternHints.empty())
+                    _result_memo.put(memo_key, (False, False, {}, dates[-1]), PatternHints.empty())
+                results.put((code, name, False, False, {}, None))
+                return
+            if n > max_bars:
+                # 数据源多给了K线（超出槽位长度）：在本线程判定，结果不变
+                bars = self._columnar_from_arrays(dates, values)
+                normal_signal, strict_signal, details = self._check_signal_at(bars, n - 1)
+                state = self._pattern_state(bars, normal_signal or strict_signal, code)
+                _pattern_hints.record(self.period, code, state)
+                _result_memo.put(memo_key, (normal_signal, strict_signal, details, dates[-1]), state)
+                with stats_lock:
+                    stats['local'] += 1
+                results.put((code, name, normal_signal, strict_signal, details, None))
+                return
+
+            t1 = time.time()
+            slot = free_slots.get()
+            ring[slot, :n] = values
+            depth = n_slots - free_slots.qsize()
+            with stats_lock:
+                stats['slot_wait'] += time.time() - t1
+                stats['depth_sum'] += depth
+                stats['depth_samples'] += 1
+                stats['depth_max'] = max(stats['depth_max'], depth)
+            try:
+                future = pool.submit(scan_worker.evaluate, slot, n, dates, code)
+            except Exception as e:
+                free_slots.put(slot)
+                results.put((code, name, False, False, {}, str(e)))
+                return
+            future.add_done_callback(lambda f: on_evaluated(f, slot, code, name, memo_key, dates[-1]))
 
-        # 注：每只股票只检查其最后一根K线（data[-1]）
-        # 信号本身就是最后一根K线的信号，无需额外过滤
+        start = time.time()
+        stopped_early = False
+        io_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            io_futures = [io_pool.submit(fetch_stock, task) for task in tasks]
+            received = 0
+            while received < len(tasks):
+                try:
+                    check_control()
+                except StopIteration:
+                    stopped_early = True
+                    break
+                try:
+                    code, name, normal_signal, strict_signal, details, err = results.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                received += 1
+                progress.record(code, name, normal_signal, strict_signal, details, err)
+        finally:
+            if stopped_early:
+                for f in io_futures:
+                    f.cancel()
+            io_pool.shutdown(wait=True)
+            pool.shutdown(wait=True, cancel_futures=stopped_early)
+            del ring
+            shm.close()
+            shm.unlink()
+
+        wall = max(time.time() - start - get_total_paused_time(), 1e-9)
+        samples = stats['depth_samples'] or 1
+        extra_lines = [
+            f"流水线: 队列深度 平均 {stats['depth_sum'] / samples:.1f} / 峰值 {stats['depth_max']} / 容量 {n_slots}",
+            f"  抓取线程利用率 {stats['io_busy'] / (self.max_workers * wall):.0%}"
+            f"（等槽位 {stats['slot_wait']:.1f}s）  "
+            f"判定进程利用率 {stats['cpu_busy'] / (processes * wall):.0%}",
+        ]
+        if stats['local']:
+            extra_lines.append(f"  超长K线本线程判定: {stats['local']} 只")
+        return stopped_early, extra_lines
+
+    def _panel_candidates(self, close, open_, volume, valid_count):
+        """
+        面板（股票×N，右对齐，左侧无效部分为 NaN）上向量化预计算，返回最后一根可能出信号的行号。
+        金叉/死叉位置、阴线量、倍量阳全部按列运算；只保留满足出信号必要条件的行：
+        最后一根是阳线、金叉后无死叉、金叉距今不超过 窗口+5、有阴线量、最近5根内金叉后有倍量阳
+        """
+        n_rows, n = close.shape
+        w = self.window_size
+        cols = np.arange(n)
+        start = (n - valid_count)[:, None]
+
+        ma20 = _rolling_sum(close, 20) / 20
+        ma30 = _rolling_sum(close, 30) / 30
+        cross = _compute_cross_columns(close, ma20, ma30, self.open_threshold)
+        is_yang, is_yin = close > open_, close < open_
+
+        # BARSLAST 只回看到每只股票自身第 ma_long 根之后
+        searchable = cols > start + self.ma_long
+        gold_idx = np.maximum.accumulate(np.where(cross['gold_cross'] & searchable, cols, -1), axis=1)
+        dead_idx = np.maximum.accumulate(np.where(cross['dead_cross'] & searchable, cols, -1), axis=1)
+
+        # 阴线量：当前K线之前最近一根阴线，须在金叉之后、窗口之内
+        last_yin = np.maximum.accumulate(np.where(is_yin, cols, -1), axis=1)
+        last_yin = np.concatenate([np.full((n_rows, 1), -1), last_yin[:, :-1]], axis=1)
+        yin_vol = np.where((gold_idx >= 0) & (last_yin > gold_idx) & (last_yin >= cols - w),
+                           np.take_along_axis(volume, np.maximum(last_yin, 0), axis=1), 0.0)
+
+        dist_gold = cols - gold_idx
+        gold_vol = np.take_along_axis(volume, np.maximum(gold_idx, 0), axis=1)
+        double_yang = ((gold_idx >= 0) & (dist_gold >= 1) & (dist_gold <= w) & is_yang &
+                       (yin_vol > 0) & (volume >= yin_vol * 2) & (volume > gold_vol))
+
+        last = n - 1
+        g = gold_idx[:, last]
+        recent_dv = np.zeros(n_rows, dtype=bool)
+        for off in range(1, 6):
+            recent_dv |= double_yang[:, last - off] & (last - off > g)
+        ok = ((valid_count >= self.ma_long + 30) & is_yang[:, last] & (g >= 0) &
+              (dead_idx[:, last] < g) & (last - g <= w + 5) & (yin_vol[:, last] > 0) & recent_dv)
+        return np.nonzero(ok)[0], {'ma20': ma20, 'ma30': ma30, 'ma5': _rolling_sum(close, 5) / 5,
+                                   'is_yang': is_yang, 'is_yin': is_yin, **cross}
+
+    def screen_panel(self, panel, stock_list: Optional[List[Tuple[str, str]]] = None, on_signal=None):
+        """
+        全市场面板（bar_panel.BarPanel：股票×N 右对齐的 open/high/low/close/volume/t/valid）上选股，
+        不再逐只请求K线。金叉/阴线量/倍量阳等逐K线条件整块向量化算出，只有满足出信号必要条件的
+        少数股票再走 _check_signal_at 完成缩量/确认阳/严格/筑底/突破判定（与 check_one_stock 结果一致）。
+        stock_list 为空时扫面板内全部股票；返回值与回调同 screen_all_stocks
+        """
+        import bar_store
 
-        print(f"\r{'=' * 80}")
-        if stopped_early:
-            print(f"  选股被用户停止  已完成 {completed}/{total} 只")
-        else:
-            print(f"  选股完成！")
-        time_info = f"用时 {active_time:.1f}s  速度 {speed:.1f}只/s"
-        if paused_total > 1:
-            time_info += f"  (暂停 {paused_total:.1f}s)"
-        print(f"  {time_info}")
-        # 按类型统计
-        type_counts = {}
-        for _, _, d in strict_results + normal_results:
-            st = d.get('signal_type', '普通')
-            type_counts[st] = type_counts.get(st, 0) + 1
-        for st, cnt in type_counts.items():
-            print(f"  {st}买入: {cnt} 只")
-        if error_count > 0:
-            print(f"  请求失败: {error_count} 只")
-        throttle_info = get_throttle_summary()
-        if throttle_info:
-            print(f"  {throttle_info}")
-        print(f"{'=' * 80}\n")
+        if np is None:
+            raise RuntimeError("面板选股需要 numpy")
+        start_time = time.time()
+        rows = np.arange(len(panel.codes))
+        names = dict(zip(panel.codes, panel.names))
+        if stock_list is not None:
+            names.update(stock_list)
+            rows = np.array([r for r in (panel.row(code) for code, _ in stock_list) if r is not None],
+                            dtype=np.int64)
+        if self.period != panel.period:
+            print(f"  ⚠ 面板周期 {panel.period} 与选股周期 {self.period} 不一致")
+
+        close = np.asarray(panel.close[rows])
+        open_ = np.asarray(panel.open[rows])
+        volume = np.asarray(panel.volume[rows])
+        valid_count = np.asarray(panel.valid[rows]).sum(axis=1)
+        candidates, prepared = self._panel_candidates(close, open_, volume, valid_count)
+
+        high = np.asarray(panel.high[rows])
+        low = np.asarray(panel.low[rows])
+        n = close.shape[1]
+        normal_results, strict_results = [], []
+        for r in candidates.tolist():
+            code = panel.codes[rows[r]]
+            s = n - int(valid_count[r])
+            dates = [bar_store.decode_time(t, self.period) for t in np.asarray(panel.t[rows[r], s:]).tolist()]
+            if self._is_stale_bar(dates[-1]):
+                continue  # 与 check_one_stock 相同：最后一根K线过旧视为脏数据
+            bars = ColumnarBars(
+                dates,
+                open=open_[r, s:], high=high[r, s:], low=low[r, s:],
+                close=close[r, s:], volume=volume[r, s:],
+                **{k: v[r, s:] for k, v in prepared.items()},
+            )
+            try:
+                normal_signal, strict_signal, details = self._check_signal_at(bars, len(bars) - 1)
+            except Exception:
+                continue
+            if not (normal_signal or strict_signal):
+                continue
+            name = names.get(code, '')
+            sig_type = details.get('signal_type', '')
+            if sig_type in ('筑底', '突破', '严格'):
+                strict_results.append((code, name, details))
+            else:
+                normal_results.append((code, name, details))
+            if on_signal:
+                try:
+                    on_signal(code, name, sig_type or 'normal', details)
+                except Exception:
+                    pass
 
+        print(f"  面板选股 {self.period_name}: {len(rows)} 只, 候选 {len(candidates)} 只, "
+              f"信号 {len(strict_results) + len(normal_results)} 只, 用时 {time.time() - start_time:.2f}s")
         return normal_results, strict_results
 
 
@@ -1402,7 +3606,11 @@ def test_single_stock(period: str, period_name: str):
     print(f"\n  正在分析 {code} {stock_name} ({period_name})...")
 
     screener = StrictStockScreener(period=period, period_name=period_name)
-    normal_signal, strict_signal, details, last_bar = screener.check_one_stock(code)
+    try:
+        normal_signal, strict_signal, details, last_bar = screener.check_one_stock(code)
+    except FetchFailed as e:
+        print(f"\n  ⚠ 数据源请求失败（可能被限流），请稍后重试: {e}")
+        return
 
     if not last_bar:
         print(f"\n  ⚠ 无法获取K线数据，请检查股票代码是否正确")